@@ -0,0 +1,380 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import json
+import hashlib
+from functools import wraps
+from datetime import (
+  date,
+  datetime
+)
+
+from app import db
+
+from models import (
+  Venue,
+  Artist,
+  Show
+)
+
+from queries import (
+  venue_shows,
+  artist_shows,
+  show_filters,
+  filter_shows,
+  genre_filters,
+  filter_genres,
+  venue_validator,
+  artist_validator,
+  show_validator,
+  InvalidFilter,
+  SHOW_FILTERS,
+  GENRE_FILTERS
+)
+
+from records import (
+  ListedShow,
+  columns,
+  as_dicts
+)
+
+from search import (
+  find_venues,
+  find_artists,
+  InvalidSearch
+)
+
+from pagination import (
+  paginate,
+  InvalidCursor
+)
+
+from flask import (
+  Blueprint,
+  Response,
+  request,
+  abort,
+  redirect,
+  url_for,
+  stream_with_context,
+  g
+)
+
+from werkzeug.http import is_resource_modified
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+#----------------------------------------------------------------------------#
+# API Config.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Rows fetched per round-trip while streaming newline-delimited JSON.
+STREAM_BATCH_SIZE = 1000
+
+VENUE_COLUMNS = (
+  Venue.id,
+  Venue.name,
+  Venue.city,
+  Venue.state,
+  Venue.genres
+)
+
+ARTIST_COLUMNS = (
+  Artist.id,
+  Artist.name,
+  Artist.city,
+  Artist.state,
+  Artist.genres
+)
+
+# The projection of /shows too, see records.py.
+SHOW_COLUMNS = columns(ListedShow)
+
+#----------------------------------------------------------------------------#
+# Serialization.
+#----------------------------------------------------------------------------#
+
+def _default(value):
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  raise TypeError('%r is not JSON serializable' % (value,))
+
+if orjson is not None:
+  def dumps(payload):
+    return orjson.dumps(payload, default=_default)
+else:
+  def dumps(payload):
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+def json_response(payload):
+  """ JSON response carrying an ETag of its body, answered with 304 Not
+  Modified when it matches the client's If-None-Match. Views under
+  conditional() get theirs from their validator instead."""
+  response = Response(dumps(payload), mimetype='application/json')
+  if g.get('api_conditional'):
+    return response
+  response.add_etag()
+  return response.make_conditional(request)
+
+def conditional(validator):
+  """ Weak ETag and Last-Modified of a detail view from the row of
+  `validator(**view_args)` (see the validators of queries.py: updated_at,
+  which the show counters move, on both ends of the shows), and 304 Not
+  Modified before any of the view's own queries or serialization when the
+  client's copy is current. No row runs the view as is, for its 404."""
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      if request.method not in ('GET', 'HEAD'):
+        return view(**kwargs)
+      row = db.session.execute(validator(**kwargs)).first()
+      if row is None:
+        return view(**kwargs)
+      etag = hashlib.sha1(repr((request.full_path, tuple(row))).encode('utf-8')).hexdigest()
+      times = [value for value in row if isinstance(value, datetime)]
+      last_modified = max(times) if times else None
+      if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+      else:
+        g.api_conditional = True
+        response = view(**kwargs)
+      response.set_etag(etag, weak=True)
+      if last_modified is not None:
+        response.last_modified = last_modified
+      return response
+    return wrapper
+  return decorator
+
+def wants_ndjson():
+  return (
+    request.args.get('format') == 'ndjson' or
+    request.accept_mimetypes.best == 'application/x-ndjson'
+  )
+
+def ndjson_response(query):
+  """ Stream every row of `query` as one JSON object per line, fetching
+  STREAM_BATCH_SIZE rows at a time so memory stays flat. Each batch goes out
+  as one chunk, which the compression middleware flushes once."""
+  def generate():
+    lines = []
+    for row in query.yield_per(STREAM_BATCH_SIZE):
+      lines.append(dumps(dict(row._mapping)))
+      if len(lines) == STREAM_BATCH_SIZE:
+        yield b'\n'.join(lines) + b'\n'
+        lines = []
+    if lines:
+      yield b'\n'.join(lines) + b'\n'
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def list_response(endpoint, query, columns, key, args=()):
+  """ Keyset paginated list, or the whole list as NDJSON on request. The
+  query arguments named in `args` are carried over to the next and previous
+  page links."""
+  if wants_ndjson():
+    return ndjson_response(query.order_by(*columns))
+  try:
+    page = paginate(
+      query,
+      columns=columns,
+      key=key,
+      after=request.args.get('after'),
+      before=request.args.get('before'),
+      limit=request.args.get('limit', type=int)
+    )
+  except InvalidCursor:
+    abort(400)
+  kept = {name: request.args.getlist(name) for name in ('limit',) + tuple(args)}
+  return json_response({
+    "data": as_dicts(page.items),
+    "next": url_for(endpoint, after=page.next_cursor, **kept) if page.next_cursor else None,
+    "prev": url_for(endpoint, before=page.prev_cursor, **kept) if page.prev_cursor else None
+  })
+
+def search_response(endpoint, listing, find):
+  """ Keyset paginated search results, best first, SEARCH_LIMIT at most per
+  page. An empty ?q= redirects to the listing with the same genre
+  filters; a shorter term than search.MIN_TERM_LENGTH is a 400."""
+  genre_args = {name: request.args.getlist(name) for name in GENRE_FILTERS}
+  term = request.args.get('q', '')
+  if not term.strip():
+    return redirect(url_for(listing, **genre_args))
+  try:
+    page = find(
+      term,
+      after=request.args.get('after'),
+      limit=request.args.get('limit', type=int),
+      **request_genre_filters()
+    )
+  except (InvalidSearch, InvalidCursor):
+    abort(400)
+  return json_response({
+    "data": page.items,
+    "next": url_for(
+      endpoint, q=term, after=page.next_cursor, limit=request.args.getlist('limit'), **genre_args
+    ) if page.next_cursor else None
+  })
+
+def request_genre_filters():
+  """ ?genre=&genre_match= of the listings and searches, see
+  queries.genre_filters."""
+  try:
+    return genre_filters(request.args)
+  except InvalidFilter:
+    abort(400)
+
+def shows_window(kind, owner_id, when, after=None):
+  """ One window of a venue's or artist's upcoming or past shows."""
+  page = (venue_shows if kind == 'venue' else artist_shows)(owner_id, when, after=after)
+  return {
+    "data": as_dicts(page.items),
+    "next": url_for(
+      'api.%s_shows_window' % kind, when=when, after=page.next_cursor, **{kind + '_id': owner_id}
+    ) if page.next_cursor else None
+  }
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+@api.route('/venues')
+def venues():
+  return list_response(
+    'api.venues',
+    filter_genres(db.session.query(*VENUE_COLUMNS), Venue, **request_genre_filters()),
+    columns=(Venue.id,),
+    key=lambda venue: (venue.id,),
+    args=GENRE_FILTERS
+  )
+
+@api.route('/venues/search')
+def search_venues():
+  return search_response('api.search_venues', 'api.venues', find_venues)
+
+@api.route('/venues/<int:venue_id>')
+@conditional(venue_validator)
+def venue(venue_id):
+  venue = Venue.query.get_or_404(venue_id)
+  return json_response({
+    "id": venue.id,
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "address": venue.address,
+    "phone": venue.phone,
+    "genres": venue.genres,
+    "image_link": venue.image_link,
+    "facebook_link": venue.facebook_link,
+    "website": venue.website_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "upcoming_shows_count": venue.upcoming_shows_count,
+    "past_shows_count": venue.past_shows_count,
+    "upcoming_shows": shows_window('venue', venue.id, 'upcoming'),
+    "past_shows": shows_window('venue', venue.id, 'past')
+  })
+
+@api.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+@conditional(lambda venue_id, when: venue_validator(venue_id))
+def venue_shows_window(venue_id, when):
+  try:
+    window = shows_window('venue', venue_id, when, after=request.args.get('after'))
+  except InvalidCursor:
+    abort(400)
+  return json_response(window)
+
+#----------------------------------------------------------------------------#
+# Artists.
+#----------------------------------------------------------------------------#
+
+@api.route('/artists')
+def artists():
+  return list_response(
+    'api.artists',
+    filter_genres(db.session.query(*ARTIST_COLUMNS), Artist, **request_genre_filters()),
+    columns=(Artist.id,),
+    key=lambda artist: (artist.id,),
+    args=GENRE_FILTERS
+  )
+
+@api.route('/artists/search')
+def search_artists():
+  return search_response('api.search_artists', 'api.artists', find_artists)
+
+@api.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
+def artist(artist_id):
+  artist = Artist.query.get_or_404(artist_id)
+  return json_response({
+    "id": artist.id,
+    "name": artist.name,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "genres": artist.genres,
+    "image_link": artist.image_link,
+    "facebook_link": artist.facebook_link,
+    "website": artist.website_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "upcoming_shows_count": artist.upcoming_shows_count,
+    "past_shows_count": artist.past_shows_count,
+    "upcoming_shows": shows_window('artist', artist.id, 'upcoming'),
+    "past_shows": shows_window('artist', artist.id, 'past')
+  })
+
+@api.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+@conditional(lambda artist_id, when: artist_validator(artist_id))
+def artist_shows_window(artist_id, when):
+  try:
+    window = shows_window('artist', artist_id, when, after=request.args.get('after'))
+  except InvalidCursor:
+    abort(400)
+  return json_response(window)
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+@api.route('/shows')
+def shows():
+  """ Shows, narrowed with ?from=&to=&city=&state=&genre=&venue_id=&artist_id=
+  (see queries.show_filters; bare dates are UTC days)."""
+  try:
+    filters = show_filters(request.args)
+  except InvalidFilter:
+    abort(400)
+  return list_response(
+    'api.shows',
+    filter_shows(db.session.query(*SHOW_COLUMNS).join(Venue, Artist), **filters),
+    columns=(Show.start_time, Show.id),
+    key=lambda show: (show.start_time, show.id),
+    args=SHOW_FILTERS
+  )
+
+@api.route('/shows/<int:show_id>')
+@conditional(show_validator)
+def show(show_id):
+  show = db.session.query(*SHOW_COLUMNS).join(Venue, Artist).filter(Show.id == show_id).first()
+  if show is None:
+    abort(404)
+  return json_response(show._asdict())
+
+#----------------------------------------------------------------------------#
+# Errors.
+#----------------------------------------------------------------------------#
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(500)
+def error(error):
+  response = Response(
+    dumps({"error": error.code, "message": error.description}),
+    mimetype='application/json'
+  )
+  return response, error.code
@@ -3,15 +3,28 @@
 #----------------------------------------------------------------------------#
 
 import os
-import logging
 from flask import Flask
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-from logging import (
-    Formatter,
-    FileHandler
+from cache import Cache
+from pool import PoolMonitor
+from compression import Compression
+from templating import (
+    configure_templates,
+    templates_command
+)
+from assets import (
+    Assets,
+    assets_command
+)
+from routing import (
+    RoutingSQLAlchemy,
+    ReplicaRouter
+)
+from instrumentation import (
+    QueryProfiler,
+    configure_logging
 )
 
 #----------------------------------------------------------------------------#
@@ -21,25 +34,41 @@ from logging import (
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+configure_templates(app)
+assets = Assets(app)
+db = RoutingSQLAlchemy(app)
+pool_monitor = PoolMonitor(app, db)
+replica_router = ReplicaRouter(app, db, pool_monitor)
 migrate = Migrate(app, db, compare_type=True)
+cache = Cache(app, db)
+if replica_router.replicas:
+    cache.add_store_check(replica_router.may_store)
+profiler = QueryProfiler(app)
+compression = Compression(app)
 
 from controllers import controller
 app.register_blueprint(blueprint=controller)
 
+from api import api
+app.register_blueprint(blueprint=api)
+
+from importer import import_command
+app.cli.add_command(import_command)
+
+from counters import show_counts_command
+app.cli.add_command(show_counts_command)
+
+from genres import genres_command
+app.cli.add_command(genres_command)
+
+app.cli.add_command(templates_command)
+app.cli.add_command(assets_command)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+configure_logging(app)
 
 #always include this at the bottom of your code (port 3000 is only necessary in workspaces)
 if __name__ == '__main__':
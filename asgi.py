@@ -0,0 +1,505 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import io
+import sys
+import asyncio
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.routing import Map
+from werkzeug.exceptions import HTTPException
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from flask import (
+    request,
+    render_template,
+    flash,
+    abort
+)
+
+from app import (
+    app,
+    db,
+    cache,
+    pool_monitor,
+    compression
+)
+
+from models import (
+    Venue,
+    Artist
+)
+
+from controllers import (
+    venue_data,
+    artist_data,
+    more_shows_url,
+    request_show_filters,
+    request_genre_filters,
+    genre_filter_choices,
+    filter_choices,
+    search_listing,
+    search_refused
+)
+
+from pagination import InvalidCursor
+from routing import PRIMARY_ONLY
+
+import queries
+import search
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#
+#     uvicorn asgi:application
+#
+# The read-heavy routes (listings, search, detail pages and their "load
+# more" windows) are served natively on the event loop from an async
+# SQLAlchemy engine (asyncpg for PostgreSQL, aiosqlite for SQLite), with the
+# independent queries of a page running concurrently on their own
+# connections. Every other request goes to the Flask WSGI app on one of
+# ASGI_WSGI_THREADS worker threads. Pages are rendered with the same
+# templates, caches, request hooks and error handlers as in WSGI mode.
+#
+# The async engine connects to the primary only: natively served views read
+# from it whatever REPLICA_ENDPOINTS says (routing.PRIMARY_ONLY), the read
+# replicas serving the requests handed to the WSGI app.
+#----------------------------------------------------------------------------#
+
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite'
+}
+
+def async_database_url(config):
+    """ ASYNC_DATABASE_URL, or SQLALCHEMY_DATABASE_URI switched to the async
+    driver of its database."""
+    if config.get('ASYNC_DATABASE_URL'):
+        return make_url(config['ASYNC_DATABASE_URL'])
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError('No async driver known for %s, set ASYNC_DATABASE_URL' % url.get_backend_name())
+    return url.set(drivername='%s+%s' % (url.get_backend_name(), driver))
+
+def async_engine_options(config, url):
+    """ create_async_engine() options for the DB_POOL_* settings, like
+    pool.engine_options() does for the WSGI engine."""
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    if config['DB_PGBOUNCER']:
+        return {
+            "poolclass": NullPool,
+            "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        }
+    return {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING']
+    }
+
+_engine = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        url = async_database_url(app.config)
+        try:
+            _engine = create_async_engine(url, **async_engine_options(app.config, url))
+        except ImportError:
+            raise RuntimeError('ASGI mode requires the %s package' % url.get_driver_name())
+        pool_monitor.watch('async', _engine.sync_engine)
+    return _engine
+
+async def fetch(statement):
+    """ All rows of `statement`, on a connection of its own so that
+    independent statements can run concurrently with asyncio.gather()."""
+    async with get_engine().connect() as connection:
+        result = await connection.execute(statement)
+        return result.all()
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+async def venues():
+    rows = await fetch(queries.venue_area_statement(**request_genre_filters()))
+    return render_template('pages/venues.html', areas=queries.group_areas(rows), genre_filter=genre_filter_choices())
+
+async def _search(model, term):
+    term = search.search_term(term)
+    filters = request_genre_filters(request.form)
+    limit = search.search_limit()
+    if get_engine().dialect.name == 'postgresql':
+        statement, limit = search.ranked_statement(model, term, limit=limit, **filters)
+        rows = await fetch(statement)
+    else:
+        generation = search.index_generation(model)
+        index = search.cached_index(model, generation)
+        if index is None:
+            index = search.build_index(model, await fetch(search.index_statement(model)), generation)
+        keys = index.search(term, limit=limit + 1, **filters)
+        ids = [row_id for _, row_id in keys]
+        counts = {}
+        for rows in await asyncio.gather(*map(fetch, search.counts_statements(model, ids))):
+            counts.update(rows)
+        rows = search.indexed_rows(index, keys, counts)
+    return search.search_results(search.search_page(rows, limit))
+
+async def search_venues():
+    term = request.form.get('search_term', '')
+    if not term.strip():
+        return search_listing('venues')
+    try:
+        results = await _search(Venue, term)
+    except search.InvalidSearch as e:
+        return search_refused('pages/search_venues.html', term, e)
+    return render_template(
+        'pages/search_venues.html',
+        results=results,
+        search_term=term,
+        genre_filter=genre_filter_choices(request.form)
+    )
+
+async def search_artists():
+    term = request.form.get('search_term', '')
+    if not term.strip():
+        return search_listing('artists')
+    try:
+        results = await _search(Artist, term)
+    except search.InvalidSearch as e:
+        return search_refused('pages/search_artists.html', term, e)
+    return render_template(
+        'pages/search_artists.html',
+        results=results,
+        search_term=term,
+        genre_filter=genre_filter_choices(request.form)
+    )
+
+async def _detail(model, statement, owner_id):
+    # The row and both show windows, fetched concurrently.
+    current_time = datetime.utcnow()
+    upcoming, upcoming_limit = queries.show_window(statement(owner_id), 'upcoming', current_time=current_time)
+    past, past_limit = queries.show_window(statement(owner_id), 'past', current_time=current_time)
+    rows, upcoming_rows, past_rows = await asyncio.gather(
+        fetch(db.select(model.__table__).where(model.id == owner_id)),
+        fetch(upcoming),
+        fetch(past)
+    )
+    return (
+        rows[0] if rows else None,
+        queries.show_page(upcoming_rows, upcoming_limit),
+        queries.show_page(past_rows, past_limit)
+    )
+
+async def show_venue(venue_id):
+    venue, upcoming_shows, past_shows = await _detail(Venue, queries.venue_shows_statement, venue_id)
+    if venue is None:
+        flash('An error occurred. Venue id ' + str(venue_id) + ' not found.')
+        abort(404)
+    upcoming_shows.items = queries.venue_show_items(upcoming_shows.items)
+    past_shows.items = queries.venue_show_items(past_shows.items)
+    return render_template('pages/show_venue.html', venue=venue_data(venue, upcoming_shows, past_shows))
+
+async def show_artist(artist_id):
+    artist, upcoming_shows, past_shows = await _detail(Artist, queries.artist_shows_statement, artist_id)
+    if artist is None:
+        flash('An error occurred. Artist id ' + str(artist_id) + ' not found.')
+        abort(404)
+    upcoming_shows.items = queries.artist_show_items(upcoming_shows.items)
+    past_shows.items = queries.artist_show_items(past_shows.items)
+    return render_template('pages/show_artist.html', artist=artist_data(artist, upcoming_shows, past_shows))
+
+async def _more_shows(kind, statement, items, owner_id, when):
+    after = request.args.get('after')
+    try:
+        window, limit = queries.show_window(statement(owner_id), when, after)
+    except InvalidCursor:
+        abort(400)
+    page = queries.show_page(await fetch(window), limit, after)
+    page.items = items(page.items)
+    return render_template(
+        'pages/%s_show_tiles.html' % kind,
+        shows=page.items,
+        more_url=more_shows_url(kind, owner_id, when, page)
+    )
+
+async def venue_shows_more(venue_id, when):
+    return await _more_shows('venue', queries.venue_shows_statement, queries.venue_show_items, venue_id, when)
+
+async def artist_shows_more(artist_id, when):
+    return await _more_shows('artist', queries.artist_shows_statement, queries.artist_show_items, artist_id, when)
+
+def _page_arguments():
+    return request.args.get('after'), request.args.get('before'), request.args.get('limit', type=int)
+
+async def artists():
+    after, before, limit = _page_arguments()
+    try:
+        statement, limit = queries.artist_list_window(after, before, limit, **request_genre_filters())
+    except InvalidCursor:
+        abort(400)
+    page = queries.artist_list_page(await fetch(statement), limit, after, before)
+    return render_template('pages/artists.html', artists=page.items, page=page, genre_filter=genre_filter_choices())
+
+async def shows():
+    after, before, limit = _page_arguments()
+    filters = request_show_filters()
+    try:
+        statement, limit = queries.show_list_window(after, before, limit, **filters)
+    except InvalidCursor:
+        abort(400)
+    page = queries.show_list_page(await fetch(statement), limit, after, before)
+    return render_template('pages/shows.html', shows=page.items, page=page, filters=filter_choices())
+
+# Endpoints of controllers.py served natively, matched with the app's own
+# URL rules.
+ASYNC_VIEWS = {
+    'venues': venues,
+    'search_venues': search_venues,
+    'show_venue': show_venue,
+    'venue_shows_more': venue_shows_more,
+    'artists': artists,
+    'search_artists': search_artists,
+    'show_artist': show_artist,
+    'artist_shows_more': artist_shows_more,
+    'shows': shows
+}
+
+url_map = Map([rule.empty() for rule in app.url_map.iter_rules() if rule.endpoint in ASYNC_VIEWS])
+
+async def _cached_view(view, args):
+    # Same validators and page cache entries as the @cache.conditional and
+    # @cache.cached views of controllers.py.
+    sync_view = app.view_functions[request.endpoint]
+    validator = getattr(sync_view, 'cache_validator', None)
+    if validator is not None and cache.revalidates():
+        rows = await fetch(validator(**args))
+        validators = cache.validators(rows[0] if rows else None)
+        if validators is not None:
+            return cache.not_modified(validators) or cache.with_validators(await _cached_page(view, args), validators)
+    return await _cached_page(view, args)
+
+async def _cached_page(view, args):
+    sync_view = app.view_functions[request.endpoint]
+    depends = getattr(sync_view, 'cache_depends', None)
+    key = cache.page_key() if depends is not None else None
+    if key is None:
+        return await view(**args)
+    body = cache.get(key, depends)
+    if body is None:
+        body = await view(**args)
+        if isinstance(body, str):
+            cache.set(key, body, depends, sync_view.cache_ttl)
+    return body
+
+async def dispatch(environ):
+    """ Response of a natively served view, None when the request is not
+    for one of them."""
+    adapter = url_map.bind_to_environ(environ)
+    try:
+        endpoint, args = adapter.match()
+    except HTTPException:
+        return None
+
+    environ[PRIMARY_ONLY] = True
+    # As Flask.wsgi_app() and full_dispatch_request() do, around an awaited
+    # view.
+    with app.request_context(environ):
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await _cached_view(ASYNC_VIEWS[endpoint], args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+    return response
+
+#----------------------------------------------------------------------------#
+# ASGI <-> WSGI.
+#----------------------------------------------------------------------------#
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    # The body has been read in full, whatever the transfer encoding was.
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+def _headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+async def send_response(response, environ, send):
+    # Through the same compression as the WSGI app.
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    iterable = compression.wsgi_app(environ, start_response, app=response)
+    try:
+        body = b''.join(iterable)
+    finally:
+        iterable.close()
+    await send({
+        'type': 'http.response.start',
+        'status': started['status'],
+        'headers': _headers(started['headers'])
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+_executor = None
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config['ASGI_WSGI_THREADS'], thread_name_prefix='asgi-wsgi'
+        )
+    return _executor
+
+async def call_wsgi(environ, send, disconnected):
+    """ Run the Flask app on a worker thread, forwarding the body as it is
+    produced so that streamed responses stay streamed. The whole response is
+    iterated on one thread, as generators wrapped in stream_with_context
+    expect, and no further once the client is gone (`disconnected`, a
+    threading.Event)."""
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    done = object()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    def run():
+        try:
+            iterable = app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if disconnected.is_set():
+                        break
+                    if chunk:
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        except BaseException as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+    worker = loop.run_in_executor(get_executor(), run)
+    chunk = await chunks.get()
+    if isinstance(chunk, BaseException):
+        raise chunk
+    if disconnected.is_set():
+        return
+    await send({
+        'type': 'http.response.start',
+        'status': started['status'],
+        'headers': _headers(started['headers'])
+    })
+    while chunk is not done:
+        if isinstance(chunk, BaseException):
+            raise chunk
+        if disconnected.is_set():
+            # The worker stops at its next chunk.
+            return
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        chunk = await chunks.get()
+    await worker
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            return bytes(body)
+
+async def _watch_disconnect(receive, disconnected):
+    # The request body has been read: the next message is the disconnect.
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                get_engine()
+            except RuntimeError as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _executor is not None:
+                # Let the requests in progress finish.
+                await asyncio.get_running_loop().run_in_executor(None, _executor.shutdown)
+            if _engine is not None:
+                await _engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise RuntimeError('Unsupported ASGI scope %r' % scope['type'])
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    environ = wsgi_environ(scope, body)
+    response = await dispatch(environ)
+    if response is not None:
+        return await send_response(response, environ, send)
+    disconnected = threading.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        await call_wsgi(environ, send, disconnected)
+    finally:
+        watcher.cancel()
@@ -0,0 +1,336 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import re
+import json
+import gzip
+import time
+import hashlib
+import mimetypes
+import posixpath
+
+import click
+from flask.cli import (
+    AppGroup,
+    with_appcontext
+)
+from flask import (
+    request,
+    current_app,
+    send_from_directory,
+    url_for
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#
+# `flask assets build` writes a production copy of static/ to static/dist:
+#
+# * the BUNDLES, each concatenated from its sources and minified
+# * every file, bundled or not, renamed to name.<content hash>.ext, with the
+#   url()s of stylesheets pointing at the renamed files
+# * .gz (and, with the brotli package, .br) siblings of the text files that
+#   compress
+# * manifest.json, mapping static/ names to their renamed copies
+#
+# With ASSET_MODE = 'production' pages link the renamed copies: url_for(
+# 'static', filename=...) and the asset_url() / asset_urls() template
+# helpers resolve names through the manifest, and /static/dist serves them
+# precompressed, with far-future immutable cache headers since a change of
+# content is a change of name. In 'development' mode they link the sources.
+#----------------------------------------------------------------------------#
+
+# Bundle name -> sources, in static/. Bundle names aren't files in static/:
+# link them with asset_urls(), which falls back to the sources.
+BUNDLES = {
+    'css/app.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css'
+    ],
+    # Loaded in <head>, before the page renders.
+    'js/head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js'
+    ],
+    # Deferred, after jQuery.
+    'js/app.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js'
+    ]
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Types worth precompressing; images and fonts other than SVG already are.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.eot', '.ttf', '.otf')
+
+# Content-Encoding -> file suffix, in order of preference.
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz'
+}
+
+ONE_YEAR = 365 * 24 * 3600
+
+#----------------------------------------------------------------------------#
+# Minification.
+#----------------------------------------------------------------------------#
+
+CSS_STRINGS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+CSS_COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+def minify_css(css):
+    """ Drop comments and the whitespace around punctuation, leaving string
+    literals as they are. Conservative: no rewriting of values."""
+    css = CSS_COMMENTS.sub('', css)
+    parts = CSS_STRINGS.split(css)
+    for i in range(0, len(parts), 2):
+        part = CSS_SPACE.sub(' ', parts[i])
+        parts[i] = CSS_PUNCTUATION.sub(r'\1', part).replace(';}', '}')
+    return ''.join(parts).strip()
+
+def minify_js(js):
+    """ rjsmin when installed; sources are otherwise shipped as they are (the
+    libraries are minified upstream)."""
+    if rjsmin is None:
+        return js
+    return rjsmin.jsmin(js)
+
+#----------------------------------------------------------------------------#
+# Build.
+#----------------------------------------------------------------------------#
+
+def fingerprinted(name, content):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+def rewrite_urls(css, source, files, static_url):
+    """ Point the relative url()s of the stylesheet `source` (a name in
+    static/) at the renamed files, or at static/ for files not built."""
+    def replace(match):
+        url = match.group(2).strip()
+        if re.match(r'^([a-z]+:|/|#)', url, re.I):
+            return match.group(0)
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        if name in files:
+            return 'url("%s/%s/%s%s")' % (static_url, DIST, files[name], suffix)
+        return 'url("%s/%s%s")' % (static_url, name, suffix)
+    return CSS_URL.sub(replace, css)
+
+def static_files(static_folder):
+    """ Names of the files in static/, outside of dist/."""
+    names = []
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        relative = os.path.relpath(directory, static_folder).replace(os.sep, '/')
+        if relative == DIST or relative.startswith(DIST + '/'):
+            subdirectories[:] = []
+            continue
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if not filename.startswith('.'):
+                names.append(filename if relative == '.' else relative + '/' + filename)
+    return names
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    # Atomic on POSIX, workers never read half a file.
+    os.replace(temporary, path)
+
+def compressed(content):
+    """ {encoding: bytes} of the encodings that make `content` smaller."""
+    encodings = {'gzip': gzip.compress(content, 9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in encodings.items() if len(data) < len(content)}
+
+def build(static_folder, static_url, bundles=BUNDLES):
+    """ Write the production copy of `static_folder` described above. Files
+    of earlier builds are kept, for pages still linking them while workers
+    restart. Returns the manifest."""
+    dist = os.path.join(static_folder, DIST)
+    files, encodings, sizes = {}, {}, {}
+
+    def emit(name, content):
+        target = fingerprinted(name, content)
+        path = os.path.join(dist, target)
+        if not os.path.exists(path):
+            _write(path, content)
+        files[name] = target
+        sizes[target] = {"bytes": len(content)}
+        if name.endswith(COMPRESSIBLE):
+            for encoding, data in compressed(content).items():
+                _write(path + ENCODINGS[encoding], data)
+                encodings.setdefault(target, []).append(encoding)
+                sizes[target][encoding] = len(data)
+
+    def read(name):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            return f.read()
+
+    def stylesheet(name, content):
+        css = rewrite_urls(content.decode('utf-8'), name, files, static_url)
+        return minify_css(css).encode('utf-8')
+
+    # Stylesheets last, so that the files they point at have their names.
+    names = static_files(static_folder)
+    for name in sorted(names, key=lambda name: name.endswith('.css')):
+        content = read(name)
+        emit(name, stylesheet(name, content) if name.endswith('.css') else content)
+
+    for bundle, sources in bundles.items():
+        if bundle.endswith('.css'):
+            content = '\n'.join(stylesheet(source, read(source)).decode('utf-8') for source in sources)
+        else:
+            # A newline and semicolon between scripts, in case one lacks its
+            # final semicolon.
+            content = '\n;'.join(minify_js(read(source).decode('utf-8')) for source in sources)
+        emit(bundle, content.encode('utf-8'))
+
+    manifest = {
+        "built_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "files": files,
+        "bundles": bundles,
+        "encodings": encodings,
+        "sizes": sizes
+    }
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+class Assets:
+    """ Links and serves the built assets, see above."""
+
+    def __init__(self, app=None):
+        self.files = {}
+        self.bundles = BUNDLES
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSET_MODE', 'development' if app.debug else 'production')
+        self.app = app
+        self.directory = os.path.join(app.static_folder, DIST)
+        if app.config['ASSET_MODE'] == 'production':
+            self.load()
+        elif app.config['ASSET_MODE'] != 'development':
+            raise ValueError('Unknown ASSET_MODE %r' % app.config['ASSET_MODE'])
+
+        app.url_defaults(self._url_defaults)
+        app.add_url_rule(
+            '%s/%s/<path:filename>' % (app.static_url_path, DIST),
+            endpoint='asset',
+            view_func=self.send
+        )
+        app.jinja_env.globals['asset_url'] = self.url
+        app.jinja_env.globals['asset_urls'] = self.urls
+
+    def load(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.app.logger.warning(
+                'No asset manifest in %s, linking the source files; run `flask assets build`' % self.directory
+            )
+            return
+        self.files = manifest['files']
+        self.bundles = manifest['bundles']
+        self.encodings = manifest['encodings']
+
+    def _url_defaults(self, endpoint, values):
+        # url_for('static', filename=...) links the renamed copy.
+        if endpoint == 'static':
+            target = self.files.get(values.get('filename'))
+            if target is not None:
+                values['filename'] = '%s/%s' % (DIST, target)
+
+    def url(self, filename, **values):
+        """ url_for('static', filename=filename), in templates."""
+        return url_for('static', filename=filename, **values)
+
+    def urls(self, name):
+        """ URLs to link for a bundle (or a single file): the bundle once
+        built, its sources otherwise."""
+        if name in self.files or name not in self.bundles:
+            return [self.url(name)]
+        return [self.url(source) for source in self.bundles[name]]
+
+    def send(self, filename):
+        """ A built file, precompressed when the client accepts one of its
+        encodings. Never changes under its name."""
+        path = filename
+        encoding = None
+        available = self.encodings.get(filename, ())
+        for candidate, suffix in ENCODINGS.items():
+            if candidate in available and request.accept_encodings[candidate]:
+                encoding = candidate
+                path = filename + suffix
+                break
+        response = send_from_directory(
+            self.directory,
+            path,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            max_age=ONE_YEAR
+        )
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if filename in self.encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+assets_command = AppGroup('assets', help='Build the static assets.')
+
+@assets_command.command('build')
+@with_appcontext
+def build_command():
+    """ Bundle, minify, fingerprint and precompress static/ into
+    static/dist, for ASSET_MODE = 'production'."""
+    app = current_app._get_current_object()
+    started = time.perf_counter()
+    manifest = build(app.static_folder, app.static_url_path)
+    for bundle in sorted(manifest['bundles']):
+        target = manifest['files'][bundle]
+        sizes = manifest['sizes'][target]
+        click.echo('%s -> %s: %s' % (bundle, target, ', '.join(
+            '%s %d bytes' % ('raw' if encoding == 'bytes' else encoding, sizes[encoding])
+            for encoding in ('bytes', 'gzip', 'br') if encoding in sizes
+        )))
+    click.echo('Built %d files into %s in %.0f ms.' % (
+        len(manifest['files']), os.path.join(app.static_folder, DIST), (time.perf_counter() - started) * 1000
+    ))
+    if brotli is None:
+        click.echo('The brotli package is not installed: no .br files.', err=True)
@@ -0,0 +1,111 @@
+""" Concurrent-request throughput of the ASGI entry point against WSGI.
+
+Seeds the dataset of benchmarks.load, serves the app both from a threaded
+Werkzeug server (WSGI mode) and from uvicorn running asgi:application, and
+sends the read-heavy routes at each level of --concurrency to both. Prints
+throughput, p50/p95 latency and the ASGI/WSGI throughput ratio as JSON.
+
+    python -m benchmarks.asgi_throughput [--database-url URL]
+                                         [--concurrency 1 8 32] [--requests N]
+
+Needs uvicorn and the async driver of the database (aiosqlite by default,
+asyncpg for PostgreSQL).
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+
+from benchmarks.common import (
+    load_app,
+    git_revision
+)
+from benchmarks.load import (
+    ROUTES,
+    seed_dataset,
+    start_server,
+    drive_http
+)
+
+# Routes asgi.py serves natively.
+READ_ROUTES = [
+    'venues', 'search_venues', 'show_venue', 'venue_shows_more', 'artists',
+    'search_artists', 'show_artist', 'artist_shows_more', 'shows'
+]
+
+def start_asgi_server(application):
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(application, log_level='warning', access_log=False, lifespan='on'))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError('uvicorn failed to start')
+        time.sleep(0.01)
+    return server, thread, sock.getsockname()[:2]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--areas', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route and level')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--route', action='append', help='only run this endpoint (repeatable)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    os.environ['CACHE_TYPE'] = 'null'
+    app, db = load_app(args.database_url)
+    dataset = seed_dataset(app, db, args, 0)
+    import asgi
+
+    routes = [route for route in ROUTES if route[0] in READ_ROUTES and (not args.route or route[0] in args.route)]
+    wsgi_server = start_server(app)
+    asgi_server, asgi_thread, asgi_address = start_asgi_server(asgi.application)
+    servers = (('wsgi', wsgi_server.server_address[:2]), ('asgi', asgi_address))
+
+    results = []
+    try:
+        for route in routes:
+            for concurrency in args.concurrency:
+                entry = {"endpoint": route[0], "concurrency": concurrency}
+                for mode, address in servers:
+                    result = drive_http(address, dataset, route, args.requests, args.warmup, concurrency, mode)
+                    entry[mode] = {key: result[key] for key in (
+                        "errors", "throughput_rps", "p50_ms", "p95_ms", "queries_median"
+                    )}
+                entry["asgi_speedup"] = round(entry["asgi"]["throughput_rps"] / entry["wsgi"]["throughput_rps"], 2)
+                results.append(entry)
+    finally:
+        wsgi_server.shutdown()
+        asgi_server.should_exit = True
+        asgi_thread.join()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    report = {
+        "revision": git_revision(),
+        "database": dialect,
+        "dataset": {"venues": args.venues, "artists": args.artists, "shows": args.shows, "areas": args.areas},
+        "routes": results
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 1 if any(r[mode]["errors"] for r in results for mode in ('wsgi', 'asgi')) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
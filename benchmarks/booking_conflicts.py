@@ -0,0 +1,74 @@
+""" Time of the booking conflict check as the shows table grows.
+
+For each size, seeds a throwaway database and times
+queries.booking_conflicts for random venues, artists and start times, as
+create_show_submission runs it before every booking. Prints the median and
+p95 per size and the conflicts found per check. With the (foreign key,
+start_time) indexes the time should stay about flat, growing with log n
+rather than n.
+
+    python -m benchmarks.booking_conflicts [--sizes 1000 10000 100000]
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import (
+    datetime,
+    timedelta
+)
+
+from benchmarks.common import (
+    load_app,
+    seed,
+    latency_summary
+)
+
+def measure(db, venues, artists, checks, rng):
+    from queries import booking_conflicts
+
+    now = datetime.utcnow()
+    seconds, found = [], 0
+    for _ in range(checks):
+        start_time = now + timedelta(hours=rng.randint(-24 * 365, 24 * 365))
+        started = time.perf_counter()
+        found += len(booking_conflicts(
+            rng.randint(1, venues), rng.randint(1, artists), start_time, start_time + timedelta(hours=3)
+        ))
+        seconds.append(time.perf_counter() - started)
+    summary = latency_summary(seconds, sum(seconds))
+    return {
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "conflicts_per_check": round(found / checks, 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--checks', type=int, default=500)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args(argv)
+
+    app, db = load_app(args.database_url)
+    results = []
+    with app.app_context():
+        for size in args.sizes:
+            db.drop_all()
+            db.create_all()
+            seed(db, venues=args.venues, artists=args.artists, shows=size, areas=20)
+            db.session.execute(db.text('ANALYZE'))
+            result = measure(db, args.venues, args.artists, args.checks, random.Random(size))
+            result["shows"] = size
+            results.append(result)
+            db.session.remove()
+
+    print(json.dumps({"results": results}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
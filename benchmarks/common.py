@@ -0,0 +1,144 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import re
+import math
+import sys
+import random
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#----------------------------------------------------------------------------#
+# App setup.
+#----------------------------------------------------------------------------#
+
+def load_app(database_url=None):
+    """ Import the Fyyur app against a throwaway database.
+
+    config.py reads DATABASE_URL, CACHE_TYPE, LOG_LEVEL and INTERNAL_ENDPOINTS at import time, so this
+    has to run before anything imports `app`. Defaults to a fresh SQLite file."""
+    if database_url is None:
+        handle, path = tempfile.mkstemp(prefix='fyyur-bench-', suffix='.db')
+        os.close(handle)
+        database_url = 'sqlite:///' + path
+    os.environ['DATABASE_URL'] = database_url
+    # Measure the database work, not the page cache in front of it.
+    os.environ.setdefault('CACHE_TYPE', 'null')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # The benchmarks read the /_internal statistics.
+    os.environ.setdefault('INTERNAL_ENDPOINTS', '1')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    from app import app, db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app, db
+
+def seed(db, venues=100, artists=100, shows=1000, areas=10, rng=None):
+    """ Bulk insert a synthetic dataset, half the shows in the past and half
+    in the future."""
+    from models import Venue, Artist, Show
+    from enums import Genres
+    import counters
+
+    names = [genre.name for genre in Genres]
+
+    def genres(i):
+        # One to two genres per row, spread over the whole enum.
+        return sorted({names[i % len(names)], names[i * 7 % len(names)]})
+
+    rng = rng or random.Random(0)
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(Venue, [{
+        "id": i,
+        "name": "Venue %d" % i,
+        "city": "City %d" % (i % areas),
+        "state": "ST",
+        "address": "%d Main St" % i,
+        "genres": genres(i),
+        "seeking_talent": False
+    } for i in range(1, venues + 1)])
+    db.session.bulk_insert_mappings(Artist, [{
+        "id": i,
+        "name": "Artist %d" % i,
+        "city": "City %d" % (i % areas),
+        "state": "ST",
+        "genres": genres(i),
+        "seeking_venue": False
+    } for i in range(1, artists + 1)])
+    db.session.bulk_insert_mappings(Show, [{
+        "id": i,
+        "venue_id": rng.randint(1, venues),
+        "artist_id": rng.randint(1, artists),
+        "start_time": now + timedelta(hours=rng.randint(-24 * 365, 24 * 365))
+    } for i in range(1, shows + 1)])
+    db.session.commit()
+    # Bulk inserts skip the events maintaining the show counters.
+    counters.recount()
+
+#----------------------------------------------------------------------------#
+# Query counting.
+#----------------------------------------------------------------------------#
+
+@contextmanager
+def count_queries(engine):
+    """ Yields a list that collects every statement sent to `engine`."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+#----------------------------------------------------------------------------#
+# Reporting.
+#----------------------------------------------------------------------------#
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+def queries_from_headers(headers):
+    """ Statement count the QueryProfiler put in the Server-Timing header,
+    None when the header is missing."""
+    match = SERVER_TIMING_QUERIES.search(headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+def percentile(sorted_values, fraction):
+    """ Nearest rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(1, math.ceil(fraction * len(sorted_values))) - 1]
+
+def latency_summary(seconds, elapsed):
+    """ p50/p95/p99, mean and max in milliseconds plus throughput for a list
+    of request latencies measured over `elapsed` wall clock seconds."""
+    values = sorted(s * 1000 for s in seconds)
+    return {
+        "p50_ms": round(percentile(values, 0.50), 3) if values else None,
+        "p95_ms": round(percentile(values, 0.95), 3) if values else None,
+        "p99_ms": round(percentile(values, 0.99), 3) if values else None,
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "max_ms": round(values[-1], 3) if values else None,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else None
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
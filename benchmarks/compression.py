@@ -0,0 +1,78 @@
+""" Response size and time of the listing pages per encoding and level.
+
+Seeds a throwaway SQLite database and fetches the growing pages (/venues,
+/shows, the NDJSON show export) without compression, then with gzip and, if
+the brotli package is installed, brotli at each level given, printing
+bytes on the wire, compression ratio and p50 latency as JSON.
+
+    python -m benchmarks.compression [--gzip-levels 1 6 9]
+                                     [--brotli-qualities 1 4 11]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from benchmarks.common import (
+    load_app,
+    seed,
+    latency_summary
+)
+
+PATHS = ['/venues', '/shows?limit=100', '/api/v1/shows?format=ndjson']
+
+def measure(client, path, encoding, requests):
+    seconds = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        response = client.get(path, headers={'Accept-Encoding': encoding})
+        size = len(response.get_data())
+        seconds.append(time.perf_counter() - begin)
+    return {
+        "encoding": response.headers.get('Content-Encoding', 'identity'),
+        "bytes": size,
+        "p50_ms": latency_summary(seconds, time.perf_counter() - started)["p50_ms"]
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=500)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--gzip-levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--brotli-qualities', type=int, nargs='+', default=[1, 4, 11])
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    with app.app_context():
+        seed(db, venues=args.venues, artists=args.artists, shows=args.shows, areas=50)
+    from app import compression
+    import compression as module
+
+    runs = [('identity', None)]
+    runs += [('gzip', level) for level in args.gzip_levels]
+    if module.brotli is not None:
+        runs += [('br', quality) for quality in args.brotli_qualities]
+
+    client = app.test_client()
+    results = []
+    for path in PATHS:
+        identity = None
+        for encoding, level in runs:
+            if encoding == 'gzip':
+                app.config['COMPRESS_GZIP_LEVEL'] = level
+            elif encoding == 'br':
+                app.config['COMPRESS_BROTLI_QUALITY'] = level
+            result = measure(client, path, encoding, args.requests)
+            identity = identity or result
+            result.update(path=path, level=level, ratio=round(result["bytes"] / identity["bytes"], 4))
+            results.append(result)
+
+    print(json.dumps({"results": results, "middleware": compression.stats()}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+""" Check and time the conditional GETs of the pages with HTTP validators.
+
+Seeds a throwaway SQLite database and, for every @cache.conditional page,
+times full renders against revalidations sending the page's ETag back (304
+Not Modified, no template rendered), with SQL statements per request. Then
+checks that each kind of write changes the validators of the pages showing
+it:
+
+    * editing a venue changes its page and /venues
+    * creating a show changes its venue's and artist's pages and /shows
+    * renaming an artist changes the pages of the venues it plays at
+    * deleting a venue changes /venues and /shows
+
+    python -m benchmarks.conditional_get [--requests N]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from benchmarks.common import (
+    load_app,
+    seed,
+    count_queries,
+    latency_summary
+)
+from benchmarks.load import (
+    START_TIME,
+    VENUE_FORM,
+    ARTIST_FORM
+)
+
+PAGES = [
+    ('venues', '/venues'),
+    ('show_venue', '/venues/1'),
+    ('artists', '/artists'),
+    ('show_artist', '/artists/1'),
+    ('shows', '/shows')
+]
+
+def timed(client, engine, path, requests, headers=None):
+    seconds, queries, statuses = [], [], set()
+    started = time.perf_counter()
+    for _ in range(requests):
+        with count_queries(engine) as statements:
+            begin = time.perf_counter()
+            response = client.get(path, headers=headers or {})
+            seconds.append(time.perf_counter() - begin)
+        queries.append(len(statements))
+        statuses.add(response.status_code)
+    summary = latency_summary(seconds, time.perf_counter() - started)
+    return {
+        "status": sorted(statuses),
+        "queries": max(queries),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"]
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=50)
+    parser.add_argument('--artists', type=int, default=50)
+    parser.add_argument('--shows', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    with app.app_context():
+        seed(db, venues=args.venues, artists=args.artists, shows=args.shows, areas=5)
+        engine = db.engine
+        from models import Show
+        artist_id, venue_id = db.session.query(Show.artist_id, Show.venue_id).filter(Show.venue_id != 1).first()
+    client = app.test_client()
+
+    # Writes follow their redirect, which renders (consumes) the flashed
+    # message: pages rendering one carry no validators.
+    def etags():
+        tags = {endpoint: client.get(path).headers.get('ETag') for endpoint, path in PAGES}
+        assert all(tags.values()), tags
+        return tags
+
+    checks = {}
+    timings = []
+    for endpoint, path in PAGES:
+        response = client.get(path)
+        etag = response.headers.get('ETag')
+        checks["%s has validators" % endpoint] = bool(
+            etag and etag.startswith('W/') and response.last_modified and
+            response.headers.get('Cache-Control') == app.config['CACHE_CONTROL'][endpoint]
+        )
+        full = timed(client, engine, path, args.requests)
+        revalidated = timed(client, engine, path, args.requests, {'If-None-Match': etag})
+        checks["%s revalidates to 304" % endpoint] = revalidated["status"] == [304] and full["status"] == [200]
+        timings.append({
+            "endpoint": endpoint,
+            "full": full,
+            "revalidated": revalidated,
+            "speedup": round(full["p50_ms"] / revalidated["p50_ms"], 1)
+        })
+
+    before = etags()
+    client.post('/venues/1/edit', data=dict(VENUE_FORM, name='Renamed Venue'), follow_redirects=True)
+    after = etags()
+    checks["venue edit changes its pages"] = all(
+        before[endpoint] != after[endpoint] for endpoint in ('venues', 'show_venue')
+    ) and before['show_artist'] == after['show_artist']
+
+    before = after
+    client.post('/shows/create', data={"venue_id": "1", "artist_id": "1", "start_time": START_TIME})
+    after = etags()
+    checks["new show changes its pages"] = all(
+        before[endpoint] != after[endpoint] for endpoint in ('show_venue', 'show_artist', 'shows')
+    )
+
+    venue_page = client.get('/venues/%d' % venue_id).headers['ETag']
+    client.post('/artists/%d/edit' % artist_id, data=dict(ARTIST_FORM, name='Renamed Artist'), follow_redirects=True)
+    checks["artist rename changes its venues' pages"] = client.get('/venues/%d' % venue_id).headers['ETag'] != venue_page
+
+    before = etags()
+    client.get('/venues/%d/delete' % venue_id)
+    after = etags()
+    checks["venue delete changes the listings"] = all(
+        before[endpoint] != after[endpoint] for endpoint in ('venues', 'shows')
+    )
+
+    print(json.dumps({"checks": checks, "routes": timings}, indent=2))
+    return 0 if all(checks.values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
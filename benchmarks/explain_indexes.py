@@ -0,0 +1,116 @@
+""" Check that the hot queries are planned as index scans.
+
+Runs EXPLAIN on the statements behind the detail pages, the /shows
+listing and the booking conflict check and fails when one of them falls back to a full table scan.
+
+    python -m benchmarks.explain_indexes [--database-url URL]
+
+On PostgreSQL sequential scans are disabled for the session, since the
+planner rightly prefers them on a tiny seeded table; the check is that an
+index *can* serve the query. The genre filters are only checked there, as
+elsewhere they test the genre_mask column of every row.
+"""
+
+import sys
+import json
+import argparse
+from datetime import (
+    datetime,
+    timedelta
+)
+
+from benchmarks.common import (
+    load_app,
+    seed
+)
+
+def hot_queries(db):
+    from models import Venue, Artist, Show
+    from queries import (
+        genre_filter,
+        overlapping_shows
+    )
+
+    now = datetime.utcnow()
+    queries = {
+        "show_venue upcoming": (
+            db.session.query(Show.artist_id, Artist.name, Artist.image_link, Show.start_time)
+            .join(Artist)
+            .filter(Show.venue_id == 1, Show.start_time > now),
+            'ix_show_venue_id_start_time'
+        ),
+        "show_artist upcoming": (
+            db.session.query(Show.venue_id, Venue.name, Venue.image_link, Show.start_time)
+            .join(Venue)
+            .filter(Show.artist_id == 1, Show.start_time > now),
+            'ix_show_artist_id_start_time'
+        ),
+        "shows page": (
+            db.session.query(Show.id, Show.start_time)
+            .filter(db.tuple_(Show.start_time, Show.id) > (now, 0))
+            .order_by(Show.start_time, Show.id)
+            .limit(30),
+            'ix_show_start_time'
+        ),
+        # Each side of queries.booking_conflicts.
+        "venue booking conflicts": (
+            overlapping_shows(Show.venue_id, 1, now, now + timedelta(hours=3)),
+            'ix_show_venue_id_start_time'
+        ),
+        "artist booking conflicts": (
+            overlapping_shows(Show.artist_id, 1, now, now + timedelta(hours=3)),
+            'ix_show_artist_id_start_time'
+        ),
+        "venues in area": (
+            db.session.query(Venue.id)
+            .filter(Venue.state == 'ST', Venue.city == 'City 1'),
+            'ix_venue_state_city'
+        )
+    }
+    if db.engine.dialect.name == 'postgresql':
+        queries["artists with any genre"] = (
+            db.session.query(Artist.id).filter(genre_filter(Artist, ['Jazz', 'Blues'])),
+            'ix_artist_genres'
+        )
+        queries["venues with all genres"] = (
+            db.session.query(Venue.id).filter(genre_filter(Venue, ['Jazz', 'Punk'], 'all')),
+            'ix_venue_genres'
+        )
+    return queries
+
+def explain(connection, query):
+    # ORM queries, or Core statements.
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=connection.dialect)
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params)
+    else:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)
+    return '\n'.join(str(row[-1]) for row in rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args(argv)
+
+    app, db = load_app(args.database_url)
+    failures = 0
+    report = {}
+    with app.app_context():
+        seed(db, venues=200, artists=200, shows=5000, areas=20)
+        db.session.execute(db.text('ANALYZE'))
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET enable_seqscan = off')
+        for name, (query, index) in hot_queries(db).items():
+            plan = explain(connection, query)
+            uses_index = index in plan
+            failures += not uses_index
+            report[name] = {"index": index, "uses_index": uses_index, "plan": plan.splitlines()}
+
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+""" Micro-benchmark for the `datetime` template filter.
+
+Formats the show times of a listing page the way a render does (the same few
+hundred values over and over) with the original dateutil + babel filter and
+with formatting.format_datetime, checks both produce the same strings and
+reports the cost per call.
+
+    python -m benchmarks.format_datetime [--values N] [--rounds N]
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks.common import load_app
+
+def legacy_format_datetime(value, format='medium'):
+    # The filter as it was defined in controllers.py.
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+def measure(function, values, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for value in values:
+            function(value, 'full')
+    elapsed = time.perf_counter() - started
+    return elapsed / (rounds * len(values)) * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=300,
+        help='distinct show times, about one listing page worth')
+    parser.add_argument('--rounds', type=int, default=20,
+        help='times each value is formatted')
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    from formatting import format_datetime
+
+    rng = random.Random(0)
+    now = datetime(2030, 1, 1)
+    times = [now + timedelta(minutes=rng.randint(-500000, 500000)) for _ in range(args.values)]
+    results = []
+    with app.test_request_context('/shows'):
+        for kind, values in (('datetime', times), ('string', [str(t) for t in times])):
+            mismatches = sum(
+                legacy_format_datetime(value, 'full') != format_datetime(value, 'full')
+                for value in values
+            )
+            legacy = measure(legacy_format_datetime, values, args.rounds)
+            memoized = measure(format_datetime, values, args.rounds)
+            results.append({
+                "input": kind,
+                "legacy_us_per_call": round(legacy, 2),
+                "memoized_us_per_call": round(memoized, 2),
+                "speedup": round(legacy / memoized, 1),
+                "mismatches": mismatches
+            })
+
+    print(json.dumps(results, indent=2))
+    return 1 if any(r["mismatches"] for r in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,358 @@
+""" Load benchmark for every route in controllers.py.
+
+Seeds a synthetic dataset into a throwaway SQLite file (or the database given
+with --database-url, which is dropped and recreated), then drives each route
+through one or both of:
+
+    client   Flask's test client, one request at a time, no network
+    wsgi     a threaded Werkzeug server on localhost hit by --threads
+             concurrent HTTP clients
+
+and prints p50/p95/p99 latency, throughput and SQL statements per request
+(from the Server-Timing header of the query profiler) as JSON. Save a run
+with --output and pass it to --compare on a later commit to flag routes whose
+p95 got slower than --tolerance allows.
+
+    python -m benchmarks.load [--venues N] [--artists N] [--shows N]
+                              [--requests N] [--threads N] [--driver both]
+                              [--output run.json] [--compare base.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode
+from datetime import datetime, timedelta
+
+from benchmarks.common import (
+    load_app,
+    seed,
+    latency_summary,
+    queries_from_headers,
+    git_revision
+)
+
+#----------------------------------------------------------------------------#
+# Routes.
+#----------------------------------------------------------------------------#
+
+# Past the seeded shows (a year either side of now), so that the shows
+# created aren't double bookings.
+BOOKING_START = datetime.utcnow() + timedelta(days=400)
+START_TIME = BOOKING_START.strftime('%Y-%m-%d %H:%M:%S')
+# Longer than a show (enums.SHOW_DURATION).
+BOOKING_STEP = timedelta(hours=6)
+
+VENUE_FORM = {
+    "name": "Bench Venue", "city": "City 1", "state": "CA", "address": "1 Main St",
+    "phone": "415-555-0100", "genres": "Jazz", "facebook_link": "", "image_link": "",
+    "website_link": "", "seeking_description": ""
+}
+
+ARTIST_FORM = {
+    "name": "Bench Artist", "city": "City 1", "state": "CA", "phone": "415-555-0100",
+    "genres": "Jazz", "facebook_link": "", "image_link": "", "website_link": "",
+    "seeking_description": ""
+}
+
+# Formatted like the paths, {slot} being a start time no other request books.
+SHOW_FORM = {"artist_id": "{artist}", "venue_id": "{venue}", "start_time": "{slot}"}
+
+# (endpoint, method, path, form data, expected status). Paths are formatted
+# with the request number `n` and the dataset: `venue` and `artist` cycle
+# through the seeded rows, `spare` is a venue seeded only to be deleted.
+ROUTES = [
+    ('index', 'GET', '/', None, 200),
+    ('venues', 'GET', '/venues', None, 200),
+    ('search_venues', 'POST', '/venues/search', {"search_term": "venue 1"}, 200),
+    ('show_venue', 'GET', '/venues/{venue}', None, 200),
+    ('venue_shows_more', 'GET', '/venues/{venue}/shows/upcoming', None, 200),
+    ('create_venue_form', 'GET', '/venues/create', None, 200),
+    ('create_venue_submission', 'POST', '/venues/create', VENUE_FORM, 200),
+    ('edit_venue', 'GET', '/venues/{venue}/edit', None, 200),
+    ('edit_venue_submission', 'POST', '/venues/{venue}/edit', VENUE_FORM, 302),
+    ('artists', 'GET', '/artists', None, 200),
+    ('search_artists', 'POST', '/artists/search', {"search_term": "artist 1"}, 200),
+    ('show_artist', 'GET', '/artists/{artist}', None, 200),
+    ('artist_shows_more', 'GET', '/artists/{artist}/shows/past', None, 200),
+    ('create_artist_form', 'GET', '/artists/create', None, 200),
+    ('create_artist_submission', 'POST', '/artists/create', ARTIST_FORM, 200),
+    ('edit_artist', 'GET', '/artists/{artist}/edit', None, 200),
+    ('edit_artist_submission', 'POST', '/artists/{artist}/edit', ARTIST_FORM, 302),
+    ('shows', 'GET', '/shows', None, 200),
+    ('show_calendar', 'GET', '/shows/calendar', None, 200),
+    ('create_shows', 'GET', '/shows/create', None, 200),
+    ('create_show_submission', 'POST', '/shows/create', SHOW_FORM, 200),
+    ('cache_stats', 'GET', '/_internal/cache', None, 200),
+    ('pool_stats', 'GET', '/_internal/pool', None, 200),
+    ('replica_stats', 'GET', '/_internal/replicas', None, 200),
+    ('compression_stats', 'GET', '/_internal/compression', None, 200),
+    ('delete_venue', 'GET', '/venues/{spare}/delete', None, 200)
+]
+
+class Dataset:
+    """ Sizes of the seeded data and the ids handed out to route paths."""
+
+    def __init__(self, venues, artists, spare_from):
+        self.venues = venues
+        self.artists = artists
+        self.spare_from = spare_from
+        self._spare = 0
+        self._slot = 0
+        self._lock = threading.Lock()
+
+    def path(self, template, n):
+        if '{spare}' in template:
+            with self._lock:
+                spare = self.spare_from + self._spare
+                self._spare += 1
+        else:
+            spare = None
+        return template.format(
+            venue=1 + n % self.venues,
+            artist=1 + n % self.artists,
+            spare=spare
+        )
+
+    def form(self, data, n):
+        """ Form data of request `n`, formatted like the paths."""
+        if data is None:
+            return None
+        with self._lock:
+            slot = BOOKING_START + self._slot * BOOKING_STEP
+            self._slot += 1
+        return {name: value.format(
+            venue=1 + n % self.venues,
+            artist=1 + n % self.artists,
+            slot=slot.strftime('%Y-%m-%d %H:%M:%S')
+        ) for name, value in data.items()}
+
+def seed_dataset(app, db, args, spares):
+    """ Seed the dataset plus `spares` venues without shows for delete_venue."""
+    from models import Venue
+
+    with app.app_context():
+        seed(db, venues=args.venues, artists=args.artists, shows=args.shows, areas=args.areas)
+        spare_from = args.venues + 1
+        db.session.bulk_insert_mappings(Venue, [{
+            "id": i,
+            "name": "Spare %d" % i,
+            "city": "Spare",
+            "state": "ST",
+            "address": "",
+            "genres": ["Jazz"],
+            "seeking_talent": False
+        } for i in range(spare_from, spare_from + spares)])
+        db.session.commit()
+        if db.engine.dialect.name == 'postgresql':
+            # Ids were given explicitly, so the serials never moved.
+            for table in ('Venue', 'Artist', 'Show'):
+                db.session.execute(
+                    'SELECT setval(pg_get_serial_sequence(\'"%s"\', \'id\'), MAX(id)) FROM "%s"' % (table, table)
+                )
+            db.session.commit()
+    return Dataset(args.venues, args.artists, spare_from)
+
+def uncovered(app):
+    """ Endpoints of controllers.py with no entry in ROUTES."""
+    covered = {endpoint for endpoint, *_ in ROUTES}
+    return sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if '.' not in rule.endpoint and rule.endpoint != 'static' and rule.endpoint not in covered
+    )
+
+#----------------------------------------------------------------------------#
+# Drivers.
+#----------------------------------------------------------------------------#
+
+def summarize(endpoint, method, path, driver, samples, elapsed, expected):
+    """ One result row from a list of (seconds, status, queries) samples."""
+    queries = sorted(q for _, _, q in samples if q is not None)
+    errors = sum(1 for _, status, _ in samples if status != expected)
+    result = {
+        "endpoint": endpoint,
+        "method": method,
+        "path": path,
+        "driver": driver,
+        "requests": len(samples),
+        "errors": errors
+    }
+    result.update(latency_summary([seconds for seconds, _, _ in samples], elapsed))
+    result.update({
+        "queries_median": queries[len(queries) // 2] if queries else None,
+        "queries_max": queries[-1] if queries else None
+    })
+    return result
+
+def drive_client(app, dataset, route, requests, warmup):
+    endpoint, method, template, data, expected = route
+    client = app.test_client()
+    for n in range(warmup):
+        client.open(dataset.path(template, n), method=method, data=dataset.form(data, n))
+    samples = []
+    started = time.perf_counter()
+    for n in range(requests):
+        path = dataset.path(template, warmup + n)
+        begun = time.perf_counter()
+        response = client.open(path, method=method, data=dataset.form(data, warmup + n))
+        response.get_data()
+        samples.append((time.perf_counter() - begun, response.status_code, queries_from_headers(response.headers)))
+    elapsed = time.perf_counter() - started
+    return summarize(endpoint, method, template, 'client', samples, elapsed, expected)
+
+def drive_http(address, dataset, route, requests, warmup, threads, driver='wsgi'):
+    """ `requests` of `route` sent by `threads` concurrent HTTP clients to
+    the server listening on `address`."""
+    endpoint, method, template, data, expected = route
+    host, port = address
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data is not None else {}
+
+    def request(n):
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        body = urlencode(dataset.form(data, n), doseq=True) if data is not None else None
+        try:
+            begun = time.perf_counter()
+            connection.request(method, dataset.path(template, n), body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return time.perf_counter() - begun, response.status, queries_from_headers(response.headers)
+        finally:
+            connection.close()
+
+    for n in range(warmup):
+        request(n)
+    samples = []
+    lock = threading.Lock()
+    counter = iter(range(warmup, warmup + requests))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            sample = request(n)
+            with lock:
+                samples.append(sample)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    result = summarize(endpoint, method, template, driver, samples, elapsed, expected)
+    result["threads"] = threads
+    return result
+
+def start_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+#----------------------------------------------------------------------------#
+# Comparison.
+#----------------------------------------------------------------------------#
+
+def compare(results, baseline, tolerance):
+    """ Routes whose p95 grew by more than `tolerance` (0.2 = 20%) or that
+    issue more queries than in `baseline`."""
+    previous = {(r["endpoint"], r["driver"]): r for r in baseline["routes"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["endpoint"], result["driver"]))
+        if before is None or not before["p95_ms"]:
+            continue
+        ratio = result["p95_ms"] / before["p95_ms"]
+        more_queries = (result["queries_max"] or 0) > (before["queries_max"] or 0)
+        if ratio > 1 + tolerance or more_queries:
+            regressions.append({
+                "endpoint": result["endpoint"],
+                "driver": result["driver"],
+                "p95_ms": [before["p95_ms"], result["p95_ms"]],
+                "p95_ratio": round(ratio, 2),
+                "queries_max": [before["queries_max"], result["queries_max"]]
+            })
+    return regressions
+
+#----------------------------------------------------------------------------#
+# Main.
+#----------------------------------------------------------------------------#
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--areas', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route and driver')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route first')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients of the wsgi driver')
+    parser.add_argument('--driver', choices=['client', 'wsgi', 'both'], default='both')
+    parser.add_argument('--route', action='append', help='only run this endpoint (repeatable)')
+    parser.add_argument('--cache', default='null', help='CACHE_TYPE to run with')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--compare', help='JSON report of an earlier run to check against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help='allowed p95 growth over --compare before a route counts as regressed')
+    args = parser.parse_args(argv)
+
+    os.environ['CACHE_TYPE'] = args.cache
+    app, db = load_app(args.database_url)
+    routes = [route for route in ROUTES if not args.route or route[0] in args.route]
+    drivers = ['client', 'wsgi'] if args.driver == 'both' else [args.driver]
+    spares = (args.requests + args.warmup) * len(drivers)
+    dataset = seed_dataset(app, db, args, spares)
+
+    results = []
+    server = start_server(app) if 'wsgi' in drivers else None
+    try:
+        for route in routes:
+            if 'client' in drivers:
+                results.append(drive_client(app, dataset, route, args.requests, args.warmup))
+            if server is not None:
+                results.append(drive_http(
+                    server.server_address[:2], dataset, route, args.requests, args.warmup, args.threads
+                ))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    report = {
+        "revision": git_revision(),
+        "database": dialect,
+        "cache": args.cache,
+        "dataset": {"venues": args.venues, "artists": args.artists, "shows": args.shows, "areas": args.areas},
+        "uncovered": uncovered(app),
+        "routes": results
+    }
+    status = 1 if any(r["errors"] for r in results) else 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+        status = status or (1 if report["regressions"] else 0)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
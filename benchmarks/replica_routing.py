@@ -0,0 +1,115 @@
+""" Check read replica routing against local databases.
+
+Seeds a primary SQLite database, copies it to two replica files (which then
+never receive the writes, like badly lagging replicas), and checks that:
+
+    * read-only routes run on the replicas, spread by REPLICA_SELECTION
+    * form submissions run on the primary
+    * the page a submission redirects to reads the write from the primary,
+      even after another client read the stale page from a replica (which
+      the page cache must not keep)
+    * once REPLICA_STICKY_SECONDS have passed reads go back to the replicas
+
+    python -m benchmarks.replica_routing [--selection least_latency]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from collections import Counter
+
+from sqlalchemy import event
+
+from benchmarks.common import (
+    load_app,
+    seed
+)
+
+STICKY_SECONDS = 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--selection', choices=['round_robin', 'least_latency'], default='round_robin')
+    parser.add_argument('--requests', type=int, default=20, help='reads sent to check the spread')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='fyyur-replicas-')
+    primary = os.path.join(directory, 'primary.db')
+    replicas = [os.path.join(directory, 'replica_%d.db' % i) for i in range(2)]
+    os.environ['DATABASE_REPLICA_URLS'] = ','.join('sqlite:///' + path for path in replicas)
+    os.environ['REPLICA_SELECTION'] = args.selection
+    os.environ['REPLICA_STICKY_SECONDS'] = str(STICKY_SECONDS)
+    os.environ.setdefault('CACHE_TYPE', 'lru')
+    app, db = load_app('sqlite:///' + primary)
+
+    with app.app_context():
+        seed(db, venues=20, artists=20, shows=200, areas=4)
+        engines = {"primary": db.get_engine(app)}
+        engines.update((key, db.get_engine(app, bind=key)) for key in sorted(app.config['SQLALCHEMY_BINDS']))
+        db.session.remove()
+        engines["primary"].dispose()
+    for path in replicas:
+        shutil.copyfile(primary, path)
+
+    statements = Counter()
+    for name, engine in engines.items():
+        def count(conn, cursor, statement, parameters, context, executemany, name=name):
+            statements[name] += 1
+        event.listen(engine, 'before_cursor_execute', count)
+
+    def served_by(method, path, **kwargs):
+        statements.clear()
+        response = client.open(path, method=method, **kwargs)
+        return response, sorted(statements)
+
+    client = app.test_client()
+    checks = {}
+
+    spread = Counter()
+    for n in range(args.requests):
+        response, used = served_by('GET', '/venues/%d' % (1 + n % 20))
+        spread.update(used)
+    checks["reads go to the replicas"] = "primary" not in spread and len(spread) == (
+        2 if args.selection == 'round_robin' else len(spread)
+    )
+    checks["reads are spread over the replicas"] = dict(spread)
+
+    response, used = served_by('POST', '/venues/1/edit', data={
+        "name": "Renamed Venue", "city": "City 1", "state": "CA", "address": "1 Main St",
+        "phone": "415-555-0100", "genres": "Jazz"
+    })
+    checks["submission goes to the primary"] = response.status_code == 302 and used == ["primary"]
+
+    response, used = served_by('GET', '/venues/1')
+    checks["redirect target reads its write"] = used == ["primary"] and b"Renamed Venue" in response.data
+
+    # /venues is page cached: the stale copy rendered for another client
+    # must not be what the writer gets next.
+    other = app.test_client()
+    statements.clear()
+    response = other.get('/venues')
+    checks["other clients read the replicas"] = "primary" not in statements and b"Renamed Venue" not in response.data
+    response, used = served_by('GET', '/venues')
+    checks["the page cache keeps no stale page"] = b"Renamed Venue" in response.data
+
+    time.sleep(STICKY_SECONDS + 0.1)
+    response, used = served_by('GET', '/venues/1')
+    checks["reads return to the replicas"] = "primary" not in used and b"Renamed Venue" not in response.data
+
+    response, used = served_by('GET', '/artists/1/edit')
+    checks["other routes stay on the primary"] = used == ["primary"]
+
+    print(json.dumps({
+        "selection": args.selection,
+        "checks": checks,
+        "router": client.get('/_internal/replicas').get_json()
+    }, indent=2))
+    shutil.rmtree(directory, ignore_errors=True)
+    return 0 if all(value for value in checks.values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+""" Static requests and bytes of a cold page load, per asset mode.
+
+Builds the assets (`flask assets build`), then renders the home page with
+ASSET_MODE development and production and fetches every local stylesheet,
+script and image it links, as a browser with an empty cache accepting gzip
+and brotli would. Prints the request count, bytes on the wire and the
+Cache-Control of the responses for both modes.
+
+    python -m benchmarks.static_assets
+"""
+
+import re
+import sys
+import json
+import argparse
+
+from benchmarks.common import load_app
+
+LINKS = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+def page_load(client, path):
+    html = client.get(path).get_data(as_text=True)
+    urls = sorted(set(LINKS.findall(html)))
+    requests, transferred, missing, policies = 0, 0, [], set()
+    for url in urls:
+        response = client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+        if response.status_code != 200:
+            missing.append(url)
+            continue
+        requests += 1
+        transferred += len(response.get_data())
+        policies.add(response.headers.get('Cache-Control'))
+        response.close()
+    return {
+        "requests": requests,
+        "bytes": transferred,
+        "cache_control": sorted(policy or 'none' for policy in policies),
+        "missing": missing
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default='/', help='page to load')
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    from app import assets
+    from assets import build
+
+    client = app.test_client()
+    app.config['ASSET_MODE'] = 'development'
+    assets.files = {}
+    report = {"development": page_load(client, args.path)}
+
+    manifest = build(app.static_folder, app.static_url_path)
+    app.config['ASSET_MODE'] = 'production'
+    assets.load()
+    report["production"] = page_load(client, args.path)
+    report["bundles"] = {bundle: manifest['sizes'][manifest['files'][bundle]] for bundle in manifest['bundles']}
+
+    print(json.dumps(report, indent=2))
+    return 0 if report["production"]["requests"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+""" Time to first byte, total time and peak memory of the listing pages,
+streamed and rendered whole, as the listings grow.
+
+Serves the app from a threaded WSGI server in this process and, for each
+dataset size, fetches /venues (every venue, so it grows with the table) and
+the largest pages of /artists and /shows, with STREAM_TEMPLATES on and off.
+Peak memory is the tracemalloc peak while the request is served, over what
+was allocated before it. Streamed,
+time to first byte and peak memory should stay flat as the size grows.
+
+    python -m benchmarks.streaming [--sizes 1000 5000 20000]
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import http.client
+
+from benchmarks.common import (
+    load_app,
+    seed
+)
+from benchmarks.load import start_server
+
+def fetch(port, path, requests):
+    # Median first byte and total times, and the largest tracemalloc peak.
+    first_bytes, totals, peaks, size = [], [], [], 0
+    for _ in range(requests):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        gc.collect()
+        tracemalloc.reset_peak()
+        # Memory still held from earlier runs doesn't count.
+        base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        connection.request('GET', path, headers={'Accept-Encoding': 'identity'})
+        response = connection.getresponse()
+        response.read(1)
+        first_bytes.append(time.perf_counter() - started)
+        # Read in blocks, not to count the client's copy of the page.
+        size = 1
+        while True:
+            block = response.read(65536)
+            if not block:
+                break
+            size += len(block)
+        totals.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError('%s answered %d' % (path, response.status))
+    return {
+        "ttfb_ms": round(sorted(first_bytes)[len(first_bytes) // 2] * 1000, 2),
+        "total_ms": round(sorted(totals)[len(totals) // 2] * 1000, 2),
+        "peak_kib": round(max(peaks) / 1024, 1),
+        "bytes": size
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000],
+        help='venues, artists and shows seeded per run')
+    parser.add_argument('--requests', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    server = start_server(app)
+    port = server.server_port
+    limit = app.config['MAX_PAGE_SIZE']
+    paths = ['/venues', '/artists?limit=%d' % limit, '/shows?limit=%d' % limit]
+
+    tracemalloc.start()
+    results = []
+    try:
+        for size in args.sizes:
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                seed(db, venues=size, artists=size, shows=size, areas=max(1, size // 20))
+            for path in paths:
+                for streamed in (False, True):
+                    app.config['STREAM_TEMPLATES'] = streamed
+                    result = fetch(port, path, args.requests)
+                    result.update(size=size, path=path, streamed=streamed)
+                    results.append(result)
+    finally:
+        tracemalloc.stop()
+        server.shutdown()
+
+    print(json.dumps({"chunk_size": app.config['STREAM_CHUNK_SIZE'], "results": results}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+""" Template load time of a cold worker, per template mode.
+
+Starts a fresh interpreter per scenario (as a newly forked worker would be)
+and times loading every template once:
+
+    development      TEMPLATE_MODE=development, compiled from source
+    production_cold  TEMPLATE_MODE=production, empty bytecode cache
+    production_warm  TEMPLATE_MODE=production, after `flask templates
+                     precompile` filled the cache
+
+    python -m benchmarks.template_compile
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+from benchmarks.common import ROOT
+
+def child():
+    from benchmarks.common import load_app
+    from templating import page_templates
+
+    app, db = load_app()
+    env = app.jinja_env
+    timings = {}
+    for name in page_templates(env):
+        started = time.perf_counter()
+        env.get_template(name)
+        timings[name] = (time.perf_counter() - started) * 1000
+    print(json.dumps({
+        "auto_reload": env.auto_reload,
+        "bytecode_cache": env.bytecode_cache is not None,
+        "templates": len(timings),
+        "total_ms": round(sum(timings.values()), 2),
+        "slowest": sorted(timings, key=timings.get)[-1]
+    }))
+
+def run(mode, cache_dir):
+    environ = dict(os.environ, TEMPLATE_MODE=mode, TEMPLATE_CACHE_DIR=cache_dir, LOG_LEVEL='WARNING')
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.template_compile', '--child'], cwd=ROOT, env=environ
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child()
+
+    cache_dir = tempfile.mkdtemp(prefix='fyyur-templates-')
+    try:
+        report = {"development": run('development', cache_dir)}
+        shutil.rmtree(cache_dir)
+        report["production_cold"] = run('production', cache_dir)
+        shutil.rmtree(cache_dir)
+        subprocess.check_call(
+            [sys.executable, '-m', 'flask', 'templates', 'precompile'], cwd=ROOT,
+            env=dict(os.environ, FLASK_APP='app', TEMPLATE_MODE='production', TEMPLATE_CACHE_DIR=cache_dir,
+                     DATABASE_URL='sqlite://', LOG_LEVEL='WARNING'),
+            stdout=sys.stderr
+        )
+        report["production_warm"] = run('production', cache_dir)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    sys.exit(main())
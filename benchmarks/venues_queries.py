@@ -0,0 +1,57 @@
+""" Regression benchmark for the /venues listing.
+
+Seeds datasets of growing size and checks that the number of SQL statements
+issued per request stays constant.
+
+    python -m benchmarks.venues_queries [--budget N]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from benchmarks.common import (
+    load_app,
+    seed,
+    count_queries
+)
+
+SIZES = [10, 100, 1000]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=int, default=None,
+        help='maximum number of queries allowed per /venues request '
+             '(default: QUERY_BUDGETS[\'venues\'] of config.py)')
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    budget = args.budget if args.budget is not None else app.config['QUERY_BUDGETS']['venues']
+    client = app.test_client()
+    results = []
+    for size in SIZES:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(db, venues=size, artists=size, shows=size * 10, areas=max(1, size // 10))
+            engine = db.engine
+
+        with count_queries(engine) as statements:
+            started = time.perf_counter()
+            response = client.get('/venues')
+            elapsed = time.perf_counter() - started
+
+        results.append({
+            "venues": size,
+            "status": response.status_code,
+            "queries": len(statements),
+            "seconds": round(elapsed, 4)
+        })
+
+    print(json.dumps(results, indent=2))
+    failed = [r for r in results if r["status"] != 200 or r["queries"] > budget]
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
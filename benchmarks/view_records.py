@@ -0,0 +1,98 @@
+""" Memory and time of the show listings as records and as dicts.
+
+Seeds a throwaway SQLite database, fetches the rows of the /shows listing
+and of a venue's and an artist's show lists once, then turns them into the
+records.py records and into the dicts the controllers used to build, and
+prints, per shape, the memory the converted items hold (tracemalloc), the
+conversion time and the time to render them through a template reading
+every field, as JSON.
+
+    python -m benchmarks.view_records [--shows 20000] [--repeat 5]
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.common import (
+    load_app,
+    seed
+)
+
+def as_dict(record):
+    # What the controllers built per row before records.py.
+    def convert(row):
+        return {name: getattr(row, name) for name in record._fields}
+    return convert
+
+def measure(rows, convert, template, repeat):
+    gc.collect()
+    tracemalloc.start()
+    items = [convert(row) for row in rows]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        [convert(row) for row in rows]
+        timings.append(time.perf_counter() - started)
+    renders = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        template.render(shows=items)
+        renders.append(time.perf_counter() - started)
+    return {
+        "held_kib": round(held / 1024, 1),
+        "bytes_per_item": round(held / len(items), 1) if items else None,
+        "convert_ms": round(min(timings) * 1000, 2),
+        "render_ms": round(min(renders) * 1000, 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=20)
+    parser.add_argument('--artists', type=int, default=20)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app, db = load_app()
+    from models import Venue, Artist, Show
+    from records import (
+        ListedShow,
+        VenueShow,
+        ArtistShow,
+        columns
+    )
+
+    with app.app_context():
+        seed(db, venues=args.venues, artists=args.artists, shows=args.shows, areas=5)
+        shapes = {
+            "listing": (ListedShow, db.select(*columns(ListedShow)).join(Venue).join(Artist)),
+            # Every show of one venue, and of one artist.
+            "venue": (VenueShow, db.select(*columns(VenueShow)).join(Artist).filter(Show.venue_id == 1)),
+            "artist": (ArtistShow, db.select(*columns(ArtistShow)).join(Venue).filter(Show.artist_id == 1))
+        }
+        report = {}
+        for shape, (record, statement) in shapes.items():
+            rows = db.session.execute(statement).all()
+            template = app.jinja_env.from_string(
+                '{% for show in shows %}' +
+                ''.join('{{ show.%s }}' % name for name in record._fields) +
+                '{% endfor %}'
+            )
+            report[shape] = {
+                "rows": len(rows),
+                "dicts": measure(rows, as_dict(record), template, args.repeat),
+                "records": measure(rows, record._make, template, args.repeat)
+            }
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,513 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import time
+import uuid
+import pickle
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from functools import wraps
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from werkzeug.http import is_resource_modified
+
+from flask import (
+    Response,
+    request,
+    session,
+    g,
+    has_request_context,
+    make_response
+)
+
+# Tables whose writes invalidate cached pages and fragments.
+TABLES = ('Venue', 'Artist', 'Show')
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class NullBackend:
+    """ Never stores anything; CACHE_TYPE = 'null'."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=0):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def __len__(self):
+        return 0
+
+class LRUBackend:
+    """ In-process least recently used cache with per entry expiry.
+
+    Entries and table generations are private to the worker process: writes
+    handled by another worker, or by the CLI (`flask import`, `flask
+    show-counts roll-over`, `flask genres reconcile --fix`), are only picked
+    up once the entries expire, after CACHE_DEFAULT_TTL. Single process
+    deployments only; use the file or memcached backend otherwise."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=0):
+        expires = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class FileBackend:
+    """ Pickled entries in a local directory, shared by every worker on the
+    host."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=0):
+        expires = time.time() + ttl if ttl else 0
+        handle, path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        # Atomic on POSIX, readers never see a half written entry.
+        os.replace(path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(os.listdir(self.directory))
+
+class MemcachedBackend:
+    """ memcached (or any server speaking its protocol), through the optional
+    pymemcache client."""
+
+    def __init__(self, servers):
+        try:
+            from pymemcache.client.hash import HashClient
+            from pymemcache import serde
+        except ImportError:
+            raise RuntimeError("CACHE_TYPE = 'memcached' requires the pymemcache package")
+        self._client = HashClient(servers, serde=serde.pickle_serde)
+
+    @staticmethod
+    def _key(key):
+        # memcached keys are limited to 250 bytes without whitespace.
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self._client.get(self._key(key))
+
+    def set(self, key, value, ttl=0):
+        self._client.set(self._key(key), value, expire=ttl)
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def __len__(self):
+        return 0
+
+def make_backend(config):
+    cache_type = config['CACHE_TYPE']
+    if cache_type == 'null':
+        return NullBackend()
+    if cache_type == 'lru':
+        return LRUBackend(config['CACHE_MAX_ENTRIES'])
+    if cache_type == 'file':
+        return FileBackend(config['CACHE_DIR'])
+    if cache_type == 'memcached':
+        return MemcachedBackend(config['CACHE_MEMCACHED_SERVERS'])
+    raise ValueError('Unknown CACHE_TYPE %r' % cache_type)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+def _new_generation():
+    # A fresh token rather than a counter: if the backend dropped the
+    # generation, restarting from 0 could resurrect stale entries. Prefixed
+    # with its creation time in milliseconds, see Cache.generation_age().
+    return '%d:%s' % (time.time() * 1000, uuid.uuid4().hex)
+
+def _generation_time(generation):
+    # Tokens of earlier versions carry no time: as good as old.
+    stamp, _, token = generation.partition(':')
+    return int(stamp) / 1000 if token and stamp.isdigit() else 0
+
+class Cache:
+    """ Rendered page and template fragment cache.
+
+    Every entry is stored under its key plus the current generation of each
+    table it depends on. Committing a write to a table moves that table to a
+    new generation, so dependent entries are never read again and simply
+    age out of the backend; entries depending on other tables stay valid."""
+
+    def __init__(self, app=None, db=None):
+        self.backend = NullBackend()
+        self.default_ttl = 0
+        self.variants = []
+        self.store_checks = []
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('CACHE_TYPE', 'lru')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_DIR', os.path.join(app.root_path, '.cache'))
+        app.config.setdefault('CACHE_MEMCACHED_SERVERS', ['127.0.0.1:11211'])
+        app.config.setdefault('CACHE_CONTROL', {})
+        self.backend = make_backend(app.config)
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.app = app
+        self.db = db
+
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+        # Mapper events note which tables a flush touched; the tables only
+        # move to a new generation once the transaction actually commits.
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(db.Model, name, self._record_write, propagate=True)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+        app.after_request(self._cache_control)
+
+    # Generations
+
+    def _request_generations(self):
+        # Generations read during the current request, so that a page and
+        # all of its fragments look each table up once (a round trip each
+        # with memcached). None outside of requests.
+        if not has_request_context():
+            return None
+        if 'cache_generations' not in g:
+            g.cache_generations = {}
+        return g.cache_generations
+
+    def _generation(self, table):
+        seen = self._request_generations()
+        if seen is not None and table in seen:
+            return seen[table]
+        key = 'generation:' + table
+        generation = self.backend.get(key)
+        if generation is None:
+            generation = _new_generation()
+            self.backend.set(key, generation)
+        if seen is not None:
+            seen[table] = generation
+        return generation
+
+    def _key(self, key, depends):
+        generations = ','.join(self._generation(table) for table in depends)
+        return '%s|%s' % (key, generations)
+
+    def invalidate(self, *tables):
+        """ Move `tables` to a new generation. Called on commit; call it by
+        hand after bulk writes that bypass the ORM."""
+        seen = self._request_generations()
+        for table in tables:
+            generation = _new_generation()
+            self.backend.set('generation:' + table, generation)
+            if seen is not None:
+                seen[table] = generation
+            self.invalidations += 1
+        if isinstance(self.backend, LRUBackend) and not has_request_context():
+            self.app.logger.warning(
+                'CACHE_TYPE = \'lru\' is private to each process: web workers keep serving '
+                'their cached %s pages for up to %ds' % (', '.join(tables), self.default_ttl)
+            )
+
+    def _record_write(self, mapper, connection, target):
+        db_session = object_session(target)
+        if db_session is not None:
+            db_session.info.setdefault('cache_dirty', set()).add(mapper.local_table.name)
+
+    def _after_commit(self, db_session):
+        dirty = db_session.info.pop('cache_dirty', None)
+        if dirty:
+            self.invalidate(*sorted(dirty))
+
+    def _after_rollback(self, db_session):
+        db_session.info.pop('cache_dirty', None)
+
+    def generation(self, table):
+        """ Current generation of `table`, for other in-process caches (the
+        search.py indexes) to follow the same invalidations as the pages.
+        None when the backend keeps no generations (CACHE_TYPE = 'null')."""
+        if isinstance(self.backend, NullBackend):
+            return None
+        return self._generation(table)
+
+    def generation_age(self, table):
+        """ Seconds since `table` last moved to a new generation."""
+        return max(0.0, time.time() - _generation_time(self._generation(table)))
+
+    def add_store_check(self, check):
+        """ Register a callable deciding whether the current request may
+        store what it rendered: check({table: generation_age}) for the
+        tables the entry depends on returns False to skip storing (e.g. when
+        the rows were read from a replica that may lag behind the latest
+        write, see routing.py)."""
+        self.store_checks.append(check)
+
+    def may_store(self, depends):
+        if not self.store_checks:
+            return True
+        ages = {table: self.generation_age(table) for table in depends}
+        return all(check(ages) for check in self.store_checks)
+
+    def add_variant(self, variant):
+        """ Register a callable whose result is part of every page and
+        fragment key, for output that varies per request beyond its URL
+        (e.g. the locale dates are formatted in)."""
+        self.variants.append(variant)
+
+    def variant_key(self, key):
+        if not self.variants:
+            return key
+        return '%s|%s' % (key, ':'.join(str(variant()) for variant in self.variants))
+
+    # Entries
+
+    def get(self, key, depends=TABLES):
+        value = self.backend.get(self._key(key, depends))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, depends=TABLES, ttl=None):
+        if not self.may_store(depends):
+            return
+        self.backend.set(self._key(key, depends), value, self.default_ttl if ttl is None else ttl)
+        self.sets += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "sets": self.sets,
+            "invalidations": self.invalidations
+        }
+
+    def page_key(self):
+        """ Key of the page rendered for the current request, None when it
+        can't be cached: anything but GET, or flashed messages pending, since
+        those are rendered into the page for a single visitor."""
+        if request.method != 'GET' or '_flashes' in session:
+            return None
+        return self.variant_key('page:' + request.full_path)
+
+    def _set_streamed(self, key, response, depends, ttl):
+        # Store a streamed page once it has been sent in full, under the
+        # generations its tables had before its rows were read.
+        key = self._key(key, depends)
+        chunks = response.response
+
+        def tee():
+            parts = []
+            try:
+                for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+            self.backend.set(key, b''.join(parts).decode('utf-8'), self.default_ttl if ttl is None else ttl)
+            self.sets += 1
+
+        response.response = tee()
+        return response
+
+    def cached(self, *depends, ttl=None):
+        """ Cache the rendered page of a GET view under its full path; pages
+        streamed by templating.stream_template() are stored once sent. The
+        tables are kept on the view as `cache_depends`."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self.page_key()
+                if key is None:
+                    return view(*args, **kwargs)
+                body = self.get(key, depends)
+                if body is None:
+                    body = view(*args, **kwargs)
+                    if isinstance(body, str):
+                        self.set(key, body, depends, ttl)
+                    elif (
+                        isinstance(body, Response) and body.is_streamed and body.status_code == 200
+                        and not isinstance(self.backend, NullBackend) and self.may_store(depends)
+                    ):
+                        body = self._set_streamed(key, body, depends, ttl)
+                return body
+            wrapper.cache_depends = depends
+            wrapper.cache_ttl = ttl
+            return wrapper
+        return decorator
+
+    # HTTP
+
+    def revalidates(self):
+        """ Whether the current request may be answered from the client's
+        copy: GETs without flashed messages pending, as for page_key()."""
+        return request.method in ('GET', 'HEAD') and '_flashes' not in session
+
+    def validators(self, row):
+        """ (ETag, Last-Modified) of the current page from the row of its
+        validator statement, None without a row."""
+        if row is None:
+            return None
+        etag = hashlib.sha1(repr((self.variant_key(request.full_path), tuple(row))).encode('utf-8')).hexdigest()
+        times = [value for value in row if isinstance(value, datetime)]
+        return etag, max(times) if times else None
+
+    def not_modified(self, validators):
+        """ 304 Not Modified response when the request's If-None-Match (or,
+        without one, If-Modified-Since) matches, None otherwise."""
+        etag, last_modified = validators
+        if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return None
+        return self.with_validators(Response(status=304), validators)
+
+    def with_validators(self, rv, validators):
+        response = make_response(rv)
+        etag, last_modified = validators
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Pages are rendered in the negotiated locale and timezone.
+        response.vary.update(('Accept-Language', 'Cookie'))
+        return response
+
+    def conditional(self, validator):
+        """ Weak ETag and Last-Modified on the GET responses of a view, and
+        304 Not Modified without running it when the client's copy is
+        current. `validator(**view_args)` returns a statement selecting one
+        row that changes along with the page (see queries.py), its latest
+        datetime being the Last-Modified; no row runs the view as is (e.g.
+        for its 404). Kept on the view as `cache_validator`.
+
+        Stack it above cached(), so that revalidations skip the page cache
+        too."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.revalidates():
+                    return view(*args, **kwargs)
+                validators = self.validators(self.db.session.execute(validator(*args, **kwargs)).first())
+                if validators is None:
+                    return view(*args, **kwargs)
+                return self.not_modified(validators) or self.with_validators(view(*args, **kwargs), validators)
+            wrapper.cache_validator = validator
+            return wrapper
+        return decorator
+
+    def _cache_control(self, response):
+        # CACHE_CONTROL policy of the endpoint, on successful GETs only. A
+        # response that changed the session (e.g. consumed flashed
+        # messages) is for this visitor only.
+        policy = self.app.config['CACHE_CONTROL'].get(request.endpoint)
+        if (
+            policy and request.method in ('GET', 'HEAD') and response.status_code in (200, 304)
+            and not session.modified and 'Cache-Control' not in response.headers
+        ):
+            response.headers['Cache-Control'] = policy
+        return response
+
+#----------------------------------------------------------------------------#
+# Fragments.
+#----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+    """ {% cache key [, depends] %}...{% endcache %}
+
+    `key` is any hashable expression identifying the fragment, `depends` a
+    tuple of table names (all tables when omitted)."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(TABLES))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key, depends, caller):
+        cache = self.environment.fragment_cache
+        key = cache.variant_key('fragment:%r' % (key,))
+        rendered = cache.get(key, depends)
+        if rendered is None:
+            rendered = caller()
+            cache.set(key, str(rendered), depends)
+        return Markup(rendered)
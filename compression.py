@@ -0,0 +1,265 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import zlib
+import threading
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Response compression.
+#
+# WSGI middleware compressing responses with the best encoding the client
+# accepts (br when the brotli package is installed, else gzip):
+#
+# * only COMPRESS_MIMETYPES, at least COMPRESS_MIN_SIZE bytes long, with a
+#   200 status and no Content-Encoding of their own (assets.py serves
+#   precompressed files) or Cache-Control: no-transform
+# * responses with a Content-Length are compressed in one go and get their
+#   new Content-Length
+# * streamed responses (no Content-Length) are buffered up to the threshold
+#   only, then compressed chunk by chunk, each chunk flushed so that it still
+#   reaches the client as soon as it is produced
+# * compressible responses and every 304 Not Modified get Vary:
+#   Accept-Encoding
+#
+# Byte counts before and after compression are kept per encoding, see
+# stats() and /_internal/compression.
+#----------------------------------------------------------------------------#
+
+class _Gzip:
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS: gzip header and trailer.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+class EncodingStats:
+    def __init__(self):
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def snapshot(self):
+        return {
+            "responses": self.responses,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None
+        }
+
+class Compression:
+    """ See above. Wraps app.wsgi_app; call it as wsgi_app(environ,
+    start_response, app=...) to compress the output of any other WSGI app
+    (asgi.py passes its responses)."""
+
+    def __init__(self, app=None):
+        self.encodings = {'gzip': EncodingStats(), 'br': EncodingStats()}
+        self.skipped = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESS_MIMETYPES', {'text/html'})
+        self.config = app.config
+        self.wrapped = app.wsgi_app
+        app.wsgi_app = self.wsgi_app
+
+    # Negotiation
+
+    def encoding(self, environ):
+        """ Content-Encoding to use for the request, None for identity."""
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        choices = [('gzip', accept['gzip'])]
+        if brotli is not None:
+            # Preferred over gzip at equal quality.
+            choices.insert(0, ('br', accept['br']))
+        encoding, quality = max(choices, key=lambda choice: choice[1])
+        return encoding if quality > 0 else None
+
+    def compressor(self, encoding):
+        if encoding == 'br':
+            return _Brotli(self.config['COMPRESS_BROTLI_QUALITY'])
+        return _Gzip(self.config['COMPRESS_GZIP_LEVEL'])
+
+    def _skip(self, status, headers, environ):
+        # Reason not to compress the response, None to compress it.
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return 'head'
+        if not status.startswith('200'):
+            return 'status'
+        names = {name.lower(): value for name, value in headers}
+        mimetype = names.get('content-type', '').split(';')[0].strip()
+        if mimetype not in self.config['COMPRESS_MIMETYPES']:
+            return 'mimetype'
+        if 'content-encoding' in names:
+            return 'encoded'
+        if 'no-transform' in names.get('cache-control', ''):
+            return 'no_transform'
+        length = names.get('content-length')
+        if length is not None and int(length) < self.config['COMPRESS_MIN_SIZE']:
+            return 'small'
+        return None
+
+    def _record(self, encoding, bytes_in, bytes_out):
+        with self._lock:
+            stats = self.encodings[encoding]
+            stats.responses += 1
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+
+    def _record_skip(self, reason):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    # Middleware
+
+    def wsgi_app(self, environ, start_response, app=None):
+        app = app or self.wrapped
+        encoding = self.encoding(environ)
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            if exc_info is not None and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = status
+            response['headers'] = headers
+            response['exc_info'] = exc_info
+
+        iterable = app(environ, capture)
+        try:
+            yield from self._respond(iterable, encoding, response, environ, start_response)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    def _start(self, response, headers, start_response):
+        response['sent'] = True
+        start_response(response['status'], headers, response.get('exc_info'))
+
+    def _respond(self, iterable, encoding, response, environ, start_response):
+        chunks = iter(iterable)
+        # Apps may call start_response() as late as their first chunk.
+        buffered = []
+        for chunk in chunks:
+            if chunk:
+                buffered.append(chunk)
+                break
+        headers = list(response['headers'])
+        reason = self._skip(response['status'], headers, environ)
+        if reason is None or response['status'].startswith('304'):
+            # The body depends on Accept-Encoding, whatever the outcome. A
+            # 304 has lost the Content-Type that would tell whether its 200
+            # was compressible: it always gets the Vary, so that shared
+            # caches never pair a revalidated gzip body with a client that
+            # can't decode it (for other responses it only narrows reuse).
+            headers = _vary(headers)
+        if reason is not None or encoding is None:
+            self._record_skip(reason or 'identity')
+            self._start(response, headers, start_response)
+            yield from buffered
+            yield from chunks
+            return
+
+        has_length = any(name.lower() == 'content-length' for name, _ in headers)
+        if not has_length:
+            # Streamed: read up to the threshold before deciding.
+            size = sum(map(len, buffered))
+            for chunk in chunks:
+                buffered.append(chunk)
+                size += len(chunk)
+                if size >= self.config['COMPRESS_MIN_SIZE']:
+                    break
+            else:
+                self._record_skip('small')
+                self._start(response, headers + [('Content-Length', str(size))], start_response)
+                yield from buffered
+                return
+
+        compressor = self.compressor(encoding)
+        headers = _encoded(headers, encoding)
+        if has_length:
+            body = b''.join(buffered) + b''.join(chunks)
+            data = compressor.compress(body) + compressor.finish()
+            self._record(encoding, len(body), len(data))
+            self._start(response, headers + [('Content-Length', str(len(data)))], start_response)
+            yield data
+            return
+
+        self._start(response, headers, start_response)
+        bytes_in = bytes_out = 0
+        for chunk in buffered:
+            bytes_in += len(chunk)
+            data = compressor.compress(chunk)
+            bytes_out += len(data)
+            yield data
+        for chunk in chunks:
+            bytes_in += len(chunk)
+            data = compressor.compress(chunk) + compressor.flush()
+            bytes_out += len(data)
+            yield data
+        data = compressor.finish()
+        bytes_out += len(data)
+        self._record(encoding, bytes_in, bytes_out)
+        yield data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min_size": self.config['COMPRESS_MIN_SIZE'],
+                "brotli": brotli is not None,
+                "encodings": {name: stats.snapshot() for name, stats in self.encodings.items()},
+                "skipped": dict(self.skipped)
+            }
+
+def _vary(headers):
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers[i] = (name, value + ', Accept-Encoding')
+            return headers
+    return headers + [('Vary', 'Accept-Encoding')]
+
+def _encoded(headers, encoding):
+    # Headers of the compressed body: no length (set by the caller when
+    # known) nor byte ranges of the identity body, and strong ETags made weak
+    # as the bytes differ.
+    result = [('Content-Encoding', encoding)]
+    for name, value in headers:
+        lower = name.lower()
+        if lower in ('content-length', 'accept-ranges', 'content-md5'):
+            continue
+        if lower == 'etag' and not value.startswith('W/'):
+            value = 'W/' + value
+        result.append((name, value))
+    return result
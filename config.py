@@ -5,9 +5,186 @@ SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Debug mode: FLASK_DEBUG=1, or FLASK_ENV=development as in the README.
+# Off by default, which also makes production the default TEMPLATE_MODE and
+# ASSET_MODE below.
+DEBUG = os.environ.get('FLASK_DEBUG', '1' if os.environ.get('FLASK_ENV') == 'development' else '0') == '1'
+
+# Template mode, see templating.py: 'development' reloads changed templates,
+# 'production' never does and shares compiled templates between workers
+# through TEMPLATE_CACHE_DIR (fill it with `flask templates precompile`).
+TEMPLATE_MODE = os.environ.get('TEMPLATE_MODE', 'development' if DEBUG else 'production')
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(basedir, '.template-cache'))
+
+# The listings (/venues, /artists, /shows) stream their HTML in chunks of
+# STREAM_CHUNK_SIZE bytes while reading their rows STREAM_YIELD_PER at a
+# time, see templating.stream_template. STREAM_TEMPLATES=0 renders them
+# whole instead.
+STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '1') == '1'
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 8192))
+STREAM_YIELD_PER = int(os.environ.get('STREAM_YIELD_PER', 500))
+
+# Static assets, see assets.py: 'production' links the bundled, minified and
+# fingerprinted copies `flask assets build` writes to static/dist,
+# 'development' the source files.
+ASSET_MODE = os.environ.get('ASSET_MODE', 'development' if DEBUG else 'production')
+
+# Structured (JSON lines) application log, see instrumentation.py.
+# Written to stderr unless LOG_FILE is set.
+LOG_FILE = os.environ.get('LOG_FILE')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+# /_internal/cache, /_internal/pool, /_internal/replicas and
+# /_internal/compression report cache, pool, replica and compression
+# statistics. They are unauthenticated, so they are only served with
+# INTERNAL_ENDPOINTS=1, behind a network that keeps them private.
+INTERNAL_ENDPOINTS = os.environ.get('INTERNAL_ENDPOINTS', '0') == '1'
+
+# Per-request query profiling. Statements slower than QUERY_SLOW_MS are
+# logged; QUERY_BUDGETS caps the number of queries per endpoint and is
+# enforced (the request fails) when QUERY_BUDGET_ENFORCE is set, as in tests.
+QUERY_SLOW_MS = int(os.environ.get('QUERY_SLOW_MS', 100))
+QUERY_BUDGET_ENFORCE = os.environ.get('QUERY_BUDGET_ENFORCE', '0') == '1'
+QUERY_BUDGETS = {
+    'index': 0,
+    'venues': 2,
+    'search_venues': 2,
+    'show_venue': 4,
+    'artists': 2,
+    'search_artists': 2,
+    'show_artist': 4,
+    'shows': 2,
+    'show_calendar': 2
+}
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = "postgresql://postgres@localhost:5432/fyyur"
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', "postgresql://postgres@localhost:5432/fyyur"
+)
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, see pool.py. Size it so that workers * (size + overflow)
+# stays below the server's max_connections. With DB_PGBOUNCER the app keeps
+# no pool of its own and leaves pooling to PgBouncer.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
+# Read replicas, see routing.py. DATABASE_REPLICA_URLS is a comma separated
+# list of replica URLs; the endpoints in REPLICA_ENDPOINTS read from them,
+# picked per request by REPLICA_SELECTION ('round_robin' or
+# 'least_latency'). A client that wrote reads from the primary for the next
+# REPLICA_STICKY_SECONDS.
+SQLALCHEMY_BINDS = {
+    'replica_%d' % i: url
+    for i, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')))
+}
+REPLICA_SELECTION = os.environ.get('REPLICA_SELECTION', 'round_robin')
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+REPLICA_ENDPOINTS = {
+    'venues',
+    'search_venues',
+    'show_venue',
+    'venue_shows_more',
+    'artists',
+    'search_artists',
+    'show_artist',
+    'artist_shows_more',
+    'shows',
+    'show_calendar',
+    'api.venues',
+    'api.search_venues',
+    'api.venue',
+    'api.venue_shows_window',
+    'api.artists',
+    'api.search_artists',
+    'api.artist',
+    'api.artist_shows_window',
+    'api.shows',
+    'api.show'
+}
+
+# Database of the async routes of asgi.py. Defaults to the one above with its
+# async driver (asyncpg, or aiosqlite for SQLite).
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+# Threads running the requests asgi.py hands to the Flask app; more wait
+# for a free one.
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+
+# Date formatting, see formatting.py. The locale is negotiated from
+# Accept-Language among SUPPORTED_LOCALES; a `tz` query argument or cookie
+# picks the display timezone, stored (naive) times being read as UTC.
+BABEL_DEFAULT_LOCALE = 'en'
+SUPPORTED_LOCALES = ['en', 'es', 'fr', 'de']
+DISPLAY_TIMEZONE = os.environ.get('DISPLAY_TIMEZONE')
+
+# Keyset pagination of the /shows and /artists listings, see pagination.py.
+# Clients may ask for a different page size with ?limit=, capped at the max.
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+# Results of a venue or artist search, best first, see search.py: the
+# search pages show the first SEARCH_LIMIT, the API pages through them.
+# At most MAX_PAGE_SIZE.
+SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', 50))
+
+# Number of upcoming / past shows rendered per window on the venue and
+# artist pages; older windows are fetched through the "load more" links.
+DETAIL_SHOWS_WINDOW = 20
+
+# Month calendar of shows (/shows/calendar): shows listed per day before a
+# "+N more" link to the day's listing, and shows fetched per month at most.
+CALENDAR_SHOWS_PER_DAY = 3
+CALENDAR_MAX_SHOWS = 2000
+
+# Rendered page and fragment cache, see cache.py.
+# CACHE_TYPE is one of 'lru' (in-process), 'file', 'memcached' or 'null'.
+# 'lru' suits a single process only: other workers and CLI commands can't
+# invalidate its entries, which then live out CACHE_DEFAULT_TTL.
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 60))
+CACHE_MAX_ENTRIES = 1024
+CACHE_DIR = os.path.join(basedir, '.cache')
+CACHE_MEMCACHED_SERVERS = os.environ.get('CACHE_MEMCACHED_SERVERS', '127.0.0.1:11211').split(',')
+
+# Response compression, see compression.py. Responses of these types of at
+# least COMPRESS_MIN_SIZE bytes are sent with gzip or brotli (when the brotli
+# package is installed), whichever the client accepts. Higher levels trade
+# CPU for size: gzip 1-9, brotli 0-11.
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+COMPRESS_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/x-ndjson',
+    'image/svg+xml'
+}
+
+# HTTP caching, see Cache.conditional in cache.py. Cache-Control of the
+# successful GET responses of each endpoint. Pages carrying validators (weak
+# ETag and Last-Modified, from the updated_at columns) are revalidated on
+# every use with 'no-cache': browsers and CDNs keep them and get a bodiless
+# 304 back, costing one query, while they are current.
+CACHE_CONTROL = {
+    'index': 'public, max-age=300',
+    'venues': 'public, no-cache',
+    'show_venue': 'public, no-cache',
+    'artists': 'public, no-cache',
+    'show_artist': 'public, no-cache',
+    'shows': 'public, no-cache',
+    'show_calendar': 'public, no-cache',
+    'api.venues': 'public, no-cache',
+    'api.venue': 'public, no-cache',
+    'api.artists': 'public, no-cache',
+    'api.artist': 'public, no-cache',
+    'api.shows': 'public, no-cache',
+    'api.show': 'public, no-cache'
+}
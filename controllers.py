@@ -3,12 +3,16 @@
 #----------------------------------------------------------------------------#
 
 import sys
-import babel
-import dateutil.parser
+
+from sqlalchemy.exc import IntegrityError
 
 from app import (
   app,
-  db
+  db,
+  cache,
+  pool_monitor,
+  replica_router,
+  compression
 )
 
 from forms import *
@@ -21,6 +25,57 @@ from models import (
   Show
 )
 
+from queries import (
+  streamed_venue_areas,
+  venue_shows,
+  artist_shows,
+  streamed_artist_list,
+  streamed_show_list,
+  venue_validator,
+  artist_validator,
+  venues_validator,
+  artists_validator,
+  shows_validator,
+  show_filters,
+  genre_filters,
+  show_calendar as calendar_of_shows,
+  calendar_month,
+  booking_conflicts,
+  InvalidFilter,
+  SHOW_FILTERS,
+  GENRE_FILTERS
+)
+
+from search import (
+  find_venues,
+  find_artists,
+  search_results,
+  InvalidSearch
+)
+
+from pagination import InvalidCursor
+
+from templating import stream_template
+
+from formatting import (
+  format_datetime,
+  request_variant,
+  current_locale,
+  current_timezone,
+  stored_time
+)
+
+from babel.dates import (
+  format_date,
+  get_day_names
+)
+
+from enums import (
+  States,
+  Genres,
+  SHOW_DURATION
+)
+
 from flask import (
   Blueprint,
   render_template,
@@ -28,7 +83,8 @@ from flask import (
   abort,
   flash,
   redirect,
-  url_for
+  url_for,
+  jsonify
 )
 
 #----------------------------------------------------------------------------#
@@ -41,24 +97,151 @@ controller = Blueprint('controller', __name__)
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  if isinstance(value, datetime):
-    date = value
-  else:
-    date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
+# Memoized and locale aware, see formatting.py
 app.jinja_env.filters['datetime'] = format_datetime
+cache.add_variant(request_variant)
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def page_url(**cursor):
+  # Another page of the current listing, keeping its other query arguments
+  # (filters, limit).
+  args = request.args.to_dict(flat=False)
+  args.pop('after', None)
+  args.pop('before', None)
+  args.update(request.view_args or {})
+  args.update(cursor)
+  return url_for(request.endpoint, **args)
+
+app.jinja_env.globals['page_url'] = page_url
+
+def request_show_filters():
+  # Show filters of the query string, see queries.show_filters.
+  try:
+    return show_filters(request.args, current_timezone())
+  except InvalidFilter:
+    abort(400)
+
+def request_genre_filters(args=None):
+  # Genre filters of the query string (or of `args`), see
+  # queries.genre_filters.
+  try:
+    return genre_filters(request.args if args is None else args)
+  except InvalidFilter:
+    abort(400)
+
+def genre_filter_choices(args=None):
+  # Options of the genre filter form.
+  args = request.args if args is None else args
+  return {
+    "genres": Genres.choices(),
+    "selected": args.getlist('genre'),
+    "match": args.get('genre_match') or 'any'
+  }
+
+def search_listing(endpoint):
+  # Empty searches show the paginated listing, with the same genre filters.
+  return redirect(url_for(endpoint, **{name: request.form.getlist(name) for name in GENRE_FILTERS}), 303)
+
+def search_refused(template, search_term, error):
+  # A term too short to search for, see search.search_term.
+  flash(str(error))
+  return render_template(
+    template,
+    results={"count": 0, "more": False, "data": []},
+    search_term=search_term,
+    genre_filter=genre_filter_choices(request.form)
+  ), 400
+
+def filter_choices():
+  # Options of the show filter form.
+  return {
+    "states": [state.value for state in States],
+    "genres": Genres.choices(),
+    "args": {name: request.args.get(name, '') for name in SHOW_FILTERS + ('month',)},
+    # The filters alone, without cursors or month, for links between the
+    # list and the calendar.
+    "query": {name: request.args.getlist(name) for name in SHOW_FILTERS if name in request.args}
+  }
+
+def more_shows_url(kind, owner_id, when, page):
+  # "Load more" link of a detail page show window, None on the last window.
+  if page.next_cursor is None:
+    return None
+  return url_for(kind + '_shows_more', **{kind + '_id': owner_id}, when=when, after=page.next_cursor)
+
+def calendar_data(year, month, weeks, truncated):
+  # Template data of the show calendar, from queries.show_calendar.
+  first = datetime(year, month, 1)
+  previous = first.replace(year=year - (month == 1), month=12 if month == 1 else month - 1)
+  following = first.replace(year=year + (month == 12), month=1 if month == 12 else month + 1)
+  locale = current_locale()
+  day_names = get_day_names('abbreviated', locale=locale)
+  return {
+    "title": format_date(first, 'MMMM y', locale=locale),
+    "day_names": [day_names[day] for day in range(7)],
+    "weeks": weeks,
+    "truncated": truncated,
+    "previous_month": previous.strftime('%Y-%m'),
+    "next_month": following.strftime('%Y-%m'),
+    "filters": filter_choices()
+  }
+
+def venue_data(venue, upcoming_shows, past_shows):
+  # Template data of the venue page. `venue` is a Venue or a row of its
+  # columns (asgi.py), the shows are windows from queries.venue_shows.
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "address": venue.address,
+    "phone": venue.phone,
+    "genres": venue.genres,
+    "image_link": venue.image_link,
+    "facebook_link": venue.facebook_link,
+    "website": venue.website_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "past_shows": past_shows.items,
+    "upcoming_shows": upcoming_shows.items,
+    "past_shows_more": more_shows_url('venue', venue.id, 'past', past_shows),
+    "upcoming_shows_more": more_shows_url('venue', venue.id, 'upcoming', upcoming_shows),
+    # Denormalized counters, see counters.py
+    "upcoming_shows_count": venue.upcoming_shows_count,
+    "past_shows_count": venue.past_shows_count
+  }
+
+def artist_data(artist, upcoming_shows, past_shows):
+  # Template data of the artist page, see venue_data.
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "genres": artist.genres,
+    "image_link": artist.image_link,
+    "facebook_link": artist.facebook_link,
+    "website": artist.website_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "past_shows": past_shows.items,
+    "upcoming_shows": upcoming_shows.items,
+    "past_shows_more": more_shows_url('artist', artist.id, 'past', past_shows),
+    "upcoming_shows_more": more_shows_url('artist', artist.id, 'upcoming', upcoming_shows),
+    "upcoming_shows_count": artist.upcoming_shows_count,
+    "past_shows_count": artist.past_shows_count
+  }
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@cache.cached()
 def index():
   return render_template('pages/home.html')
 
@@ -66,58 +249,33 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.conditional(venues_validator)
+@cache.cached('Venue', 'Show')
 def venues():
-  data = []
-  venueLocList = Venue.query.distinct(Venue.state, Venue.city).all()
-  for venueLocation in venueLocList:
-    city = venueLocation.city
-    state = venueLocation.state
-
-    venues = []
-    current_time = datetime.now()
-    venueList = Venue.query.filter_by(city = city, state = state).all()
-
-    for venue in venueList:
-      upcomingShows = list(filter(lambda show: show.start_time > current_time, venue.shows))
-
-      venues.append({
-        "id" : venue.id,
-        "name" : venue.name,
-        "num_upcoming_shows" : len(upcomingShows)
-      })
-
-    data.append({
-      "city" : city,
-      "state" : state,
-      "venues" : venues
-    })
-  return render_template('pages/venues.html', areas=data)
+  # Single query over the show counters, see queries.streamed_venue_areas, read as
+  # the page streams out
+  data = streamed_venue_areas(**request_genre_filters())
+  return stream_template('pages/venues.html', areas=data, genre_filter=genre_filter_choices())
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   searchTerm = request.form.get('search_term', '')
+  if not searchTerm.strip():
+    return search_listing('venues')
+  try:
+    result = search_results(find_venues(searchTerm, **request_genre_filters(request.form)))
+  except InvalidSearch as e:
+    return search_refused('pages/search_venues.html', searchTerm, e)
 
-  venues = Venue.query.filter(Venue.name.ilike("%" + searchTerm + "%")).all()
-  
-  data = []
-  current_time = datetime.now()
-
-  for venue in venues:
-    upcomingShows = list(filter(lambda show: show.start_time > current_time, venue.shows))
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(upcomingShows)
-    })
-
-  result={
-    "count": len(venues),
-    "data": data
-  }
-  
-  return render_template('pages/search_venues.html', results=result, search_term=searchTerm)
+  return render_template(
+    'pages/search_venues.html',
+    results=result,
+    search_term=searchTerm,
+    genre_filter=genre_filter_choices(request.form)
+  )
 
 @app.route('/venues/<int:venue_id>')
+@cache.conditional(venue_validator)
 def show_venue(venue_id):
   error = False
   data = {}
@@ -125,50 +283,11 @@ def show_venue(venue_id):
   try:
     venue = Venue.query.filter_by(id = venue_id).first()
 
-    data["id"] = venue.id
-    data["name"] = venue.name
-    data["city"] = venue.city
-    data["state"] = venue.state
-    data["address"] = venue.address
-    data["phone"] = venue.phone
-    data["genres"] = venue.genres
-    data["image_link"] = venue.image_link
-    data["facebook_link"] = venue.facebook_link
-    data["website"] = venue.website_link
-    data["seeking_talent"] = venue.seeking_talent
-    data["seeking_description"] = venue.seeking_description
-
-    past_shows = []
-    upcoming_shows = []
-    current_time = datetime.now()
-
-    artistShows = db.session.query(
-      Show.artist_id, 
-      Artist.name, 
-      Artist.image_link, 
-      Show.start_time
-    ).filter_by(
-      venue_id = venue.id
-    ).join(Artist).all()
-
-    for artistShow in artistShows:
-      artistId, artistName, artistImgLink, showtime  = artistShow
-      artistShowRecord = {
-        "artist_id" : artistId,
-        "artist_name": artistName,
-        "artist_image_link": artistImgLink,
-        "start_time": showtime
-      }
-      if (showtime > current_time):
-        upcoming_shows.append(artistShowRecord)
-      else: 
-        past_shows.append(artistShowRecord)
-
-    data["past_shows"] = past_shows
-    data["upcoming_shows"] = upcoming_shows
-
-    data["past_shows_count"] = len(past_shows)
-    data["upcoming_shows_count"] = len(upcoming_shows)
+    current_time = datetime.utcnow()
+    upcoming_shows = venue_shows(venue.id, 'upcoming', current_time=current_time)
+    past_shows = venue_shows(venue.id, 'past', current_time=current_time)
+
+    data = venue_data(venue, upcoming_shows, past_shows)
   except:
     error = True
     print(sys.exc_info())
@@ -180,6 +299,18 @@ def show_venue(venue_id):
   else:
     return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+def venue_shows_more(venue_id, when):
+  try:
+    page = venue_shows(venue_id, when, after=request.args.get('after'))
+  except InvalidCursor:
+    abort(400)
+  return render_template(
+    'pages/venue_show_tiles.html',
+    shows=page.items,
+    more_url=more_shows_url('venue', venue_id, when, page)
+  )
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -217,7 +348,9 @@ def create_venue_submission():
 def delete_venue(venue_id):
   error = False
   try:
-    venue = Venue.query.get(venue_id)
+    # The cascade deletes the venue's shows one by one (keeping the show
+    # counters of their artists right), so load them in one query.
+    venue = Venue.query.options(db.selectinload(Venue.shows)).get(venue_id)
 
     db.session.delete(venue)
     db.session.commit()
@@ -240,34 +373,40 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.conditional(artists_validator)
+@cache.cached('Artist')
 def artists():
-  return render_template('pages/artists.html', artists=Artist.query.order_by("id").all())
+  filters = request_genre_filters()
+  try:
+    page = streamed_artist_list(
+      after=request.args.get('after'),
+      before=request.args.get('before'),
+      limit=request.args.get('limit', type=int),
+      **filters
+    )
+  except InvalidCursor:
+    abort(400)
+  return stream_template('pages/artists.html', artists=page.items, page=page, genre_filter=genre_filter_choices())
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   searchTerm = request.form.get('search_term', '')
+  if not searchTerm.strip():
+    return search_listing('artists')
+  try:
+    result = search_results(find_artists(searchTerm, **request_genre_filters(request.form)))
+  except InvalidSearch as e:
+    return search_refused('pages/search_artists.html', searchTerm, e)
 
-  artists = Artist.query.filter(Artist.name.ilike("%" + searchTerm + "%")).all()
-  
-  data = []
-  current_time = datetime.now()
-
-  for artist in artists:
-    upcomingShows = list(filter(lambda show: show.start_time > current_time, artist.shows))
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(upcomingShows)
-    })
-
-  result={
-    "count": len(artists),
-    "data": data
-  }
-
-  return render_template('pages/search_artists.html', results=result, search_term=searchTerm)
+  return render_template(
+    'pages/search_artists.html',
+    results=result,
+    search_term=searchTerm,
+    genre_filter=genre_filter_choices(request.form)
+  )
 
 @app.route('/artists/<int:artist_id>')
+@cache.conditional(artist_validator)
 def show_artist(artist_id):
   error = False
   data = {}
@@ -275,49 +414,11 @@ def show_artist(artist_id):
   try:
     artist = Artist.query.filter_by(id = artist_id).first()
 
-    data["id"] = artist.id
-    data["name"] = artist.name
-    data["city"] = artist.city
-    data["state"] = artist.state
-    data["phone"] = artist.phone
-    data["genres"] = artist.genres
-    data["image_link"] = artist.image_link
-    data["facebook_link"] = artist.facebook_link
-    data["website"] = artist.website_link
-    data["seeking_venue"] = artist.seeking_venue
-    data["seeking_description"] = artist.seeking_description
-
-    past_shows = []
-    upcoming_shows = []
-    current_time = datetime.now()
-
-    venueShows = db.session.query(
-      Show.venue_id, 
-      Venue.name, 
-      Venue.image_link, 
-      Show.start_time
-    ).filter_by(
-      artist_id = artist.id
-    ).join(Venue).all()
-
-    for venueShow in venueShows:
-      venueId, venueName, venueImgLink, showtime  = venueShow
-      venueShowRecord = {
-        "venue_id" : venueId,
-        "venue_name": venueName,
-        "venue_image_link": venueImgLink,
-        "start_time": showtime
-      }
-      if (showtime > current_time):
-        upcoming_shows.append(venueShowRecord)
-      else: 
-        past_shows.append(venueShowRecord)
-
-    data["past_shows"] = past_shows
-    data["upcoming_shows"] = upcoming_shows
-
-    data["past_shows_count"] = len(past_shows)
-    data["upcoming_shows_count"] = len(upcoming_shows)
+    current_time = datetime.utcnow()
+    upcoming_shows = artist_shows(artist.id, 'upcoming', current_time=current_time)
+    past_shows = artist_shows(artist.id, 'past', current_time=current_time)
+
+    data = artist_data(artist, upcoming_shows, past_shows)
   except:
     error = True
     print(sys.exc_info())
@@ -329,6 +430,18 @@ def show_artist(artist_id):
   else:
     return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+def artist_shows_more(artist_id, when):
+  try:
+    page = artist_shows(artist_id, when, after=request.args.get('after'))
+  except InvalidCursor:
+    abort(400)
+  return render_template(
+    'pages/artist_show_tiles.html',
+    shows=page.items,
+    more_url=more_shows_url('artist', artist_id, when, page)
+  )
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
@@ -430,30 +543,33 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.conditional(shows_validator)
+@cache.cached('Show', 'Venue', 'Artist')
 def shows():
-  data = []
-
-  shows = db.session.query(
-    Show.venue_id,
-    Show.artist_id,
-    Show.start_time,
-    Venue.name,
-    Artist.name,
-    Artist.image_link
-  ).join(Venue, Artist).all()
-
-  for show in shows:
-    venue_id, artist_id, start_time, venue_name, artist_name, artist_image_link = show
-    data.append({
-      "venue_id": venue_id,
-      "venue_name": venue_name,
-      "artist_id": artist_id,
-      "artist_name": artist_name,
-      "artist_image_link": artist_image_link,
-      "start_time": start_time
-    })
-
-  return render_template('pages/shows.html', shows=data)
+  filters = request_show_filters()
+  try:
+    page = streamed_show_list(
+      after=request.args.get('after'),
+      before=request.args.get('before'),
+      limit=request.args.get('limit', type=int),
+      **filters
+    )
+  except InvalidCursor:
+    abort(400)
+
+  return stream_template('pages/shows.html', shows=page.items, page=page, filters=filter_choices())
+
+@app.route('/shows/calendar')
+@cache.conditional(shows_validator)
+@cache.cached('Show', 'Venue', 'Artist')
+def show_calendar():
+  filters = request_show_filters()
+  try:
+    year, month = calendar_month(request.args.get('month'), current_timezone())
+  except InvalidFilter:
+    abort(400)
+  weeks, truncated = calendar_of_shows(year, month, current_timezone(), **filters)
+  return render_template('pages/show_calendar.html', **calendar_data(year, month, weeks, truncated))
 
 @app.route('/shows/create')
 def create_shows():
@@ -461,15 +577,53 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+def booking_conflict_message(show):
+  """ The shows in the way of booking `show`, as a sentence; None when it
+  can be booked."""
+  conflicts = booking_conflicts(show.venue_id, show.artist_id, show.start_time, show.end_time)
+  if not conflicts:
+    return None
+  return 'Already booked: ' + '; '.join('%s, show %d from %s to %s' % (
+    'venue %d' % conflict.venue_id if conflict.venue_id == show.venue_id else 'artist %d' % conflict.artist_id,
+    conflict.id,
+    format_datetime(conflict.start_time),
+    format_datetime(conflict.end_time)
+  ) for conflict in conflicts) + '.'
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   error = False
+  # (message, status) when the show can't be booked as given.
+  refused = None
   form = ShowForm(request.form)
   try:
     show = Show()
     form.populate_obj(show)
-    db.session.add(show)
-    db.session.commit()
+    # Entered in the display timezone, stored in UTC.
+    show.start_time = stored_time(show.start_time, current_timezone())
+    if show.end_time is None:
+      show.end_time = show.start_time + SHOW_DURATION
+    else:
+      show.end_time = stored_time(show.end_time, current_timezone())
+    message = show_interval_error(show.start_time, show.end_time)
+    if message:
+      refused = (message, 400)
+    else:
+      message = booking_conflict_message(show)
+      if message:
+        refused = (message, 409)
+    if refused is None:
+      db.session.add(show)
+      db.session.commit()
+  except IntegrityError as e:
+    db.session.rollback()
+    if 'ex_show_' in str(e.orig):
+      # Booked by a concurrent request since the check, and refused by the
+      # exclusion constraints (PostgreSQL).
+      refused = ('The venue or the artist was booked meanwhile, try again.', 409)
+    else:
+      error = True
+      print(sys.exc_info())
   except:
     db.session.rollback()
     error = True
@@ -481,11 +635,37 @@ def create_show_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     flash('An error occurred. Show could not be listed.')
     abort(500)
+  elif refused is not None:
+    message, status = refused
+    flash('Show could not be listed. ' + message)
+    return render_template('forms/new_show.html', form=form), status
   else:
     # on successful db insert, flash success
     flash('Show was successfully listed!')
     return render_template('pages/home.html')
 
+#  Internal
+#  ----------------------------------------------------------------
+
+# Operational statistics, naming replica hosts among others: only
+# registered when INTERNAL_ENDPOINTS is set.
+if app.config['INTERNAL_ENDPOINTS']:
+  @app.route('/_internal/cache')
+  def cache_stats():
+    return jsonify(cache.stats())
+
+  @app.route('/_internal/pool')
+  def pool_stats():
+    return jsonify(pools=pool_monitor.stats())
+
+  @app.route('/_internal/replicas')
+  def replica_stats():
+    return jsonify(replica_router.stats())
+
+  @app.route('/_internal/compression')
+  def compression_stats():
+    return jsonify(compression.stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,189 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import (
+    AppGroup,
+    with_appcontext
+)
+
+from sqlalchemy import (
+    event,
+    inspect
+)
+
+from app import (
+    db,
+    cache
+)
+
+from models import (
+    Venue,
+    Artist,
+    Show
+)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count and past_shows_count so that
+# listings, search results and detail pages read them off the row instead of
+# counting shows. Each row also has show_counts_at: its shows starting after
+# that instant are counted as upcoming, the others as past.
+#
+# * Creating, moving or deleting a show adjusts the counters of its venue and
+#   artist in the same flush, with relative UPDATEs that can't lose a
+#   concurrent increment.
+# * `flask show-counts rollover`, run periodically (e.g. every few minutes
+#   from cron), moves the shows that started since show_counts_at over to
+#   past. Between runs "upcoming" lags by at most that interval.
+# * `flask show-counts reconcile` reports rows whose counters disagree with
+#   an actual count, and repairs them with --fix.
+#----------------------------------------------------------------------------#
+
+# (owner model, foreign key of Show pointing to it)
+OWNERS = (
+    (Venue, Show.venue_id),
+    (Artist, Show.artist_id)
+)
+
+def _adjust(connection, model, owner_id, start_time, delta):
+    table = model.__table__
+    upcoming = start_time > table.c.show_counts_at
+    connection.execute(table.update().where(table.c.id == owner_id).values(
+        upcoming_shows_count=table.c.upcoming_shows_count + db.case((upcoming, delta), else_=0),
+        past_shows_count=table.c.past_shows_count + db.case((upcoming, 0), else_=delta)
+    ))
+
+def _after_insert(mapper, connection, show):
+    _adjust(connection, Venue, show.venue_id, show.start_time, 1)
+    _adjust(connection, Artist, show.artist_id, show.start_time, 1)
+
+def _after_delete(mapper, connection, show):
+    _adjust(connection, Venue, show.venue_id, show.start_time, -1)
+    _adjust(connection, Artist, show.artist_id, show.start_time, -1)
+
+def _before_value(state, name):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(state.obj(), name)
+
+def _after_update(mapper, connection, show):
+    state = inspect(show)
+    if not any(state.attrs[name].history.has_changes() for name in ('venue_id', 'artist_id', 'start_time')):
+        return
+    start_time = _before_value(state, 'start_time')
+    _adjust(connection, Venue, _before_value(state, 'venue_id'), start_time, -1)
+    _adjust(connection, Artist, _before_value(state, 'artist_id'), start_time, -1)
+    _after_insert(mapper, connection, show)
+
+event.listen(Show, 'after_insert', _after_insert)
+event.listen(Show, 'after_update', _after_update)
+event.listen(Show, 'after_delete', _after_delete)
+
+#----------------------------------------------------------------------------#
+# Maintenance.
+#----------------------------------------------------------------------------#
+
+def _count(model, foreign_key, *conditions):
+    return db.select(db.func.count(Show.id)).where(
+        foreign_key == model.id, *conditions
+    ).scalar_subquery()
+
+def roll_over(now=None):
+    """ Move shows that started since each row's show_counts_at from the
+    upcoming to the past counter. Only rows with such shows are written, each
+    found through the (foreign key, start_time) index. Returns the number of
+    rows updated."""
+    if now is None:
+        now = datetime.utcnow()
+    updated = 0
+    with db.engine.begin() as connection:
+        for model, foreign_key in OWNERS:
+            started = (Show.start_time > model.show_counts_at, Show.start_time <= now)
+            moved = _count(model, foreign_key, *started)
+            updated += connection.execute(db.update(model).where(
+                db.exists().where(foreign_key == model.id, *started)
+            ).values(
+                upcoming_shows_count=model.upcoming_shows_count - moved,
+                past_shows_count=model.past_shows_count + moved,
+                show_counts_at=now
+            ).execution_options(synchronize_session=False)).rowcount
+    if updated:
+        cache.invalidate('Venue', 'Artist')
+    return updated
+
+def drift():
+    """ [(table, id, (upcoming, past) stored, (upcoming, past) counted)] for
+    every row whose counters disagree with its shows."""
+    rows = []
+    for model, foreign_key in OWNERS:
+        upcoming = _count(model, foreign_key, Show.start_time > model.show_counts_at)
+        past = _count(model, foreign_key, Show.start_time <= model.show_counts_at)
+        query = db.session.query(
+            model.id, model.upcoming_shows_count, model.past_shows_count, upcoming, past
+        ).filter(db.or_(
+            model.upcoming_shows_count != upcoming,
+            model.past_shows_count != past
+        )).order_by(model.id)
+        rows.extend(
+            (model.__tablename__, row_id, (stored_upcoming, stored_past), (counted_upcoming, counted_past))
+            for row_id, stored_upcoming, stored_past, counted_upcoming, counted_past in query
+        )
+    return rows
+
+def recount(now=None, ids=None):
+    """ Recompute the counters from the shows table as of `now`, for every
+    row or only the (table, id) pairs in `ids`. Used to repair drift and after
+    bulk loads that bypass the ORM events above."""
+    if now is None:
+        now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        for model, foreign_key in OWNERS:
+            statement = db.update(model).values(
+                upcoming_shows_count=_count(model, foreign_key, Show.start_time > now),
+                past_shows_count=_count(model, foreign_key, Show.start_time <= now),
+                show_counts_at=now
+            ).execution_options(synchronize_session=False)
+            if ids is not None:
+                owned = [row_id for table, row_id in ids if table == model.__tablename__]
+                if not owned:
+                    continue
+                statement = statement.where(model.id.in_(owned))
+            connection.execute(statement)
+    cache.invalidate('Venue', 'Artist')
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+show_counts_command = AppGroup('show-counts', help='Maintain the denormalized show counters.')
+
+@show_counts_command.command('rollover')
+@with_appcontext
+def rollover_command():
+    """ Move shows that have started to the past counters. Run it
+    periodically; "upcoming" lags by at most the interval between runs."""
+    click.echo('Rolled over %d rows.' % roll_over())
+
+@show_counts_command.command('reconcile')
+@click.option('--fix', is_flag=True, help='Recount the rows that drifted.')
+@with_appcontext
+def reconcile_command(fix):
+    """ Report venues and artists whose show counters disagree with their
+    shows, and repair them with --fix."""
+    rows = drift()
+    for table, row_id, stored, counted in rows:
+        click.echo('%s %d: stored %d upcoming / %d past, counted %d / %d' % (
+            (table, row_id) + stored + counted
+        ), err=True)
+    if rows and fix:
+        recount(ids=[(table, row_id) for table, row_id, _, _ in rows])
+        click.echo('Repaired %d rows.' % len(rows))
+    else:
+        click.echo('%d rows drifted.' % len(rows))
+    if rows and not fix:
+        sys.exit(1)
@@ -1,5 +1,12 @@
+from datetime import timedelta
 from enum import Enum
 
+# Shows listed without an end time last SHOW_DURATION. None may last longer
+# than SHOW_MAX_DURATION (forms.show_interval_error): queries.booking_conflicts
+# relies on it to bound its index scans.
+SHOW_DURATION = timedelta(hours=3)
+SHOW_MAX_DURATION = timedelta(hours=24)
+
 class States(Enum):
     AL = 'AL'
     AK = 'AK'
@@ -79,9 +86,26 @@ class Genres(Enum):
     RockNRoll = 'Rock n Roll'
     Soul = 'Soul'
     Other = 'Other'
+    # Genre masks number genres in this order: add new genres at the end,
+    # then run `flask genres reconcile --fix`.
 
     @classmethod
     def choices(cls):
         """ Methods decorated with @classmethod can be called 
         statically without having an instance of the class."""
         return [(choice.name, choice.value) for choice in cls]
+
+    @classmethod
+    def mask(cls, names):
+        """ Bitmask of the genre names in `names`, one bit per genre in
+        declaration order. Names that aren't genres set no bit."""
+        bits = 0
+        for position, choice in enumerate(cls):
+            if choice.name in (names or ()):
+                bits |= 1 << position
+        return bits
+
+    @classmethod
+    def from_mask(cls, bits):
+        """ Genre names of the bitmask `bits`, the inverse of mask()."""
+        return [choice.name for position, choice in enumerate(cls) if bits & (1 << position)]
@@ -0,0 +1,121 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+from flask import (
+    g,
+    request,
+    current_app,
+    has_request_context
+)
+
+#----------------------------------------------------------------------------#
+# Formatting Config.
+#----------------------------------------------------------------------------#
+
+# Named formats accepted by the `datetime` filter; anything else is used as
+# a Babel pattern as is.
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+# Distinct (timestamp, format, locale, timezone) strings kept. A listing page
+# repeats the same few hundred show times, so this covers the working set.
+FORMAT_CACHE_SIZE = 4096
+
+#----------------------------------------------------------------------------#
+# Request locale and timezone.
+#----------------------------------------------------------------------------#
+
+def _negotiate():
+    config = current_app.config
+    locale = request.accept_languages.best_match(
+        config['SUPPORTED_LOCALES'], default=config['BABEL_DEFAULT_LOCALE']
+    )
+    name = request.args.get('tz') or request.cookies.get('tz')
+    timezone = name if name in pytz.all_timezones_set else config['DISPLAY_TIMEZONE']
+    return locale, timezone
+
+def request_settings():
+    """ (locale, timezone) to format dates in, worked out once per request.
+
+    The locale is the best match of Accept-Language among SUPPORTED_LOCALES.
+    The timezone comes from the `tz` query argument or cookie when it names
+    a known zone, DISPLAY_TIMEZONE otherwise (None shows stored times as
+    is). Looked up on every filter call, so it stays to a single context
+    local access once negotiated."""
+    if not has_request_context():
+        return current_app.config['BABEL_DEFAULT_LOCALE'], current_app.config['DISPLAY_TIMEZONE']
+    settings = g.get('_format_settings')
+    if settings is None:
+        settings = g._format_settings = _negotiate()
+    return settings
+
+def current_locale():
+    return request_settings()[0]
+
+def current_timezone():
+    return request_settings()[1]
+
+def request_variant():
+    """ Locale and timezone of the request, for keys of cached output that
+    contains formatted dates."""
+    return '%s/%s' % request_settings()
+
+#----------------------------------------------------------------------------#
+# Formatting.
+#----------------------------------------------------------------------------#
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+    """ Babel pattern and locale objects for (format, locale), built once."""
+    return parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _parse(value):
+    return dateutil.parser.parse(value)
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _format(value, format, locale, timezone):
+    pattern, babel_locale = compiled_pattern(format, locale)
+    # Stored times are naive; like babel.dates.format_datetime treat them
+    # as UTC, then move them to the display timezone when there is one.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=pytz.utc)
+    if timezone is not None:
+        value = value.astimezone(pytz.timezone(timezone))
+    return pattern.apply(value, babel_locale)
+
+def stored_time(value, timezone):
+    """ Stored (naive UTC) time of `value`, a naive time in `timezone`;
+    None leaves it as is, like the `datetime` filter."""
+    if timezone is None:
+        return value
+    return pytz.timezone(timezone).localize(value).astimezone(pytz.utc).replace(tzinfo=None)
+
+def display_time(value, timezone):
+    """ Naive time in `timezone` of the stored time `value`, the inverse of
+    stored_time()."""
+    if timezone is None:
+        return value
+    return pytz.utc.localize(value).astimezone(pytz.timezone(timezone)).replace(tzinfo=None)
+
+def format_datetime(value, format='medium', locale=None, timezone=None):
+    """ The `datetime` Jinja filter. Accepts datetime objects or strings,
+    in the request's locale and timezone unless given."""
+    if not isinstance(value, datetime):
+        value = _parse(value)
+    if locale is None or timezone is None:
+        settings = request_settings()
+        locale = locale or settings[0]
+        timezone = timezone or settings[1]
+    return _format(value, format, locale, timezone)
@@ -3,7 +3,14 @@ from datetime import datetime
 
 from enums import (
     States,
-    Genres
+    Genres,
+    SHOW_DURATION,
+    SHOW_MAX_DURATION
+)
+
+from formatting import (
+    current_timezone,
+    display_time
 )
 
 from flask_wtf import FlaskForm as Form
@@ -20,6 +27,7 @@ from wtforms import (
 from wtforms.validators import (
     NumberRange,
     DataRequired,
+    Optional,
     URL
 )
 
@@ -35,7 +43,15 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        # Now, in the display timezone the form is filled in.
+        default=lambda: display_time(datetime.utcnow(), current_timezone())
+    )
+    # Blank: SHOW_DURATION after start_time. Checked against start_time by
+    # show_interval_error().
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()],
+        description='Leave blank for the default duration of %d hours' % (SHOW_DURATION.total_seconds() // 3600)
     )
 
 class VenueForm(Form):
@@ -157,3 +173,14 @@ def is_valid_phone(number):
     """
     regex = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
     return regex.match(number)
+
+def show_interval_error(start_time, end_time):
+    """ Why a show can't run from start_time to end_time, None if it can
+    (or has no end_time yet)."""
+    if end_time is None:
+        return None
+    if end_time <= start_time:
+        return 'The show must end after it starts.'
+    if end_time - start_time > SHOW_MAX_DURATION:
+        return 'A show lasts at most %d hours.' % (SHOW_MAX_DURATION.total_seconds() // 3600)
+    return None
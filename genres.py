@@ -0,0 +1,88 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import sys
+
+import click
+from flask.cli import (
+    AppGroup,
+    with_appcontext
+)
+
+from app import (
+    db,
+    cache
+)
+
+from models import (
+    Venue,
+    Artist
+)
+
+from enums import Genres
+
+import search
+
+#----------------------------------------------------------------------------#
+# Genre masks.
+#
+# Venue and Artist keep, next to their genres array, genre_mask: one bit per
+# enums.Genres member in declaration order. It is filled in on insert (a
+# column default, so bulk inserts get it too) and whenever genres is
+# assigned through the ORM, and is what the genre filters test where there
+# is no GIN index on the array (SQLite), see queries.genre_filter.
+#
+# Masks go stale when genres are written behind the ORM's back, or when
+# enums.Genres is reordered. `flask genres reconcile` reports the rows whose
+# mask disagrees with their genres, and rewrites them with --fix.
+#----------------------------------------------------------------------------#
+
+MODELS = (Venue, Artist)
+
+def drift(batch_size=5000):
+    """ [(table, id, stored mask, expected mask)] for every row whose
+    genre_mask disagrees with its genres."""
+    rows = []
+    for model in MODELS:
+        query = db.session.query(model.id, model.genres, model.genre_mask).order_by(model.id)
+        for row_id, genres, stored in query.yield_per(batch_size):
+            expected = Genres.mask(genres)
+            if stored != expected:
+                rows.append((model.__tablename__, row_id, stored, expected))
+    return rows
+
+def resync(rows):
+    """ Write the expected masks of drift() rows."""
+    tables = {model.__tablename__: model for model in MODELS}
+    with db.engine.begin() as connection:
+        for table, row_id, stored, expected in rows:
+            model = tables[table]
+            connection.execute(
+                db.update(model.__table__).where(model.id == row_id).values(genre_mask=expected)
+            )
+    cache.invalidate(*tables)
+    search.reset_indexes()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+genres_command = AppGroup('genres', help='Maintain the genre masks.')
+
+@genres_command.command('reconcile')
+@click.option('--fix', is_flag=True, help='Rewrite the masks that drifted.')
+@with_appcontext
+def reconcile_command(fix):
+    """ Report venues and artists whose genre_mask disagrees with their
+    genres, and repair them with --fix."""
+    rows = drift()
+    for table, row_id, stored, expected in rows:
+        click.echo('%s %d: stored mask %d, genres give %d' % (table, row_id, stored, expected), err=True)
+    if rows and fix:
+        resync(rows)
+        click.echo('Repaired %d rows.' % len(rows))
+    else:
+        click.echo('%d rows drifted.' % len(rows))
+    if rows and not fix:
+        sys.exit(1)
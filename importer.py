@@ -0,0 +1,395 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import io
+import csv
+import sys
+import json
+import time
+import bisect
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+
+from wtforms import (
+    IntegerField,
+    DateTimeField,
+    BooleanField,
+    SelectField,
+    SelectMultipleField
+)
+from sqlalchemy.exc import (
+    IntegrityError,
+    DataError
+)
+from wtforms.fields.core import UnboundField
+from wtforms.validators import (
+    ValidationError,
+    StopValidation
+)
+
+from app import (
+    db,
+    cache
+)
+
+from forms import (
+    VenueForm,
+    ArtistForm,
+    ShowForm,
+    is_valid_phone,
+    show_interval_error
+)
+
+from models import (
+    Venue,
+    Artist,
+    Show
+)
+from enums import SHOW_DURATION
+
+import search
+import counters
+
+from queries import booking_conflicts
+
+from enums import Genres
+
+#----------------------------------------------------------------------------#
+# Row validation.
+#----------------------------------------------------------------------------#
+
+_TRUE = {'y', 'yes', 'true', 't', 'on', '1'}
+
+class RowError(ValueError):
+    pass
+
+class _Cell:
+    """ Just enough of a WTForms field for the form's validators to run
+    against a single value, without building a form per row."""
+
+    def __init__(self, data):
+        self.data = data
+        self.raw_data = [] if data is None else [data]
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+    def ngettext(self, singular, plural, n):
+        return singular if n == 1 else plural
+
+class RowSchema:
+    """ The field rules of a WTForms form class, compiled once.
+
+    Reads the unbound fields declared on the form (type, validators and
+    choices) and applies them to plain dict rows, plus the checks the forms
+    make in their validate() methods, so an imported row is accepted exactly
+    when the same data would pass the web form."""
+
+    def __init__(self, form_class):
+        self.fields = sorted(
+            ((name, field) for name, field in vars(form_class).items() if isinstance(field, UnboundField)),
+            key=lambda item: item[1].creation_counter
+        )
+        self.columns = [name for name, field in self.fields]
+
+    @staticmethod
+    def _coerce(field, value):
+        if value is None or value == '':
+            if field.field_class is BooleanField:
+                return False
+            if field.field_class is SelectMultipleField:
+                return []
+            return None
+        if field.field_class is IntegerField:
+            return int(value)
+        if field.field_class is DateTimeField:
+            if isinstance(value, datetime):
+                return value
+            return datetime.strptime(value, field.kwargs.get('format', '%Y-%m-%d %H:%M:%S'))
+        if field.field_class is BooleanField:
+            return value if isinstance(value, bool) else str(value).strip().lower() in _TRUE
+        if field.field_class is SelectMultipleField:
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(';' if ';' in value else ',')]
+            return [item for item in value if item]
+        return str(value)
+
+    def validate(self, row):
+        """ Column values for `row`, or RowError naming the failing field."""
+        values = {}
+        for name, field in self.fields:
+            try:
+                data = self._coerce(field, row.get(name))
+            except (TypeError, ValueError):
+                raise RowError('%s: not a valid %s' % (name, field.field_class.__name__))
+            cell = _Cell(data)
+            for validator in field.kwargs.get('validators') or ():
+                try:
+                    validator(None, cell)
+                except StopValidation as e:
+                    # Without a message: Optional() on a blank value.
+                    if e.args and e.args[0]:
+                        raise RowError('%s: %s' % (name, e.args[0]))
+                    break
+                except ValidationError as e:
+                    raise RowError('%s: %s' % (name, e.args[0] if e.args else 'invalid'))
+            choices = field.kwargs.get('choices')
+            if choices and data:
+                allowed = {choice[0] for choice in choices}
+                if not set(data if isinstance(data, list) else [data]) <= allowed:
+                    raise RowError('%s: not a valid choice' % name)
+            values[name] = data
+
+        if 'phone' in values and not is_valid_phone(values['phone'] or ''):
+            raise RowError('phone: Invalid phone.')
+        if 'end_time' in values:
+            error = show_interval_error(values['start_time'], values['end_time'])
+            if error:
+                raise RowError('end_time: %s' % error)
+        if row.get('id') not in (None, ''):
+            try:
+                values['id'] = int(row['id'])
+            except (TypeError, ValueError):
+                raise RowError('id: not a valid integer')
+        return values
+
+ENTITIES = {
+    'venues': (Venue, RowSchema(VenueForm)),
+    'artists': (Artist, RowSchema(ArtistForm)),
+    'shows': (Show, RowSchema(ShowForm))
+}
+
+#----------------------------------------------------------------------------#
+# Readers.
+#----------------------------------------------------------------------------#
+
+def read_rows(stream, fmt):
+    """ Yield dict rows from a CSV (with header) or NDJSON stream."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+#----------------------------------------------------------------------------#
+# Loaders.
+#----------------------------------------------------------------------------#
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, list):
+        return '{%s}' % ','.join(
+            '"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value
+        )
+    return value
+
+def copy_rows(connection, table, columns, rows):
+    """ Load rows through PostgreSQL COPY, the fastest bulk path."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row.get(column)) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')' % (
+                table.name, ', '.join('"%s"' % column for column in columns)
+            ),
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def insert_rows(connection, table, columns, rows):
+    """ Load rows with a single executemany INSERT."""
+    connection.execute(table.insert(), [{column: row.get(column) for column in columns} for row in rows])
+
+def _database_error(error):
+    # First line of the driver's message, e.g. the violated constraint.
+    message = str(getattr(error, 'orig', error)).strip()
+    return 'database: %s' % (message.splitlines()[0] if message else type(error).__name__)
+
+def load_batch(engine, loader, table, columns, rows):
+    """ Load `rows`, (line, values) pairs, in one transaction. When the
+    database refuses the batch (a foreign key, a duplicate id, a constraint),
+    load its halves instead, down to the single rows it refuses: a few bad
+    rows cost a few transactions each, not one per row.
+
+    Returns (loaded, [(line, error)])."""
+    if not rows:
+        return 0, []
+    try:
+        with engine.begin() as connection:
+            loader(connection, table, columns, [values for line, values in rows])
+        return len(rows), []
+    except (IntegrityError, DataError) as e:
+        if len(rows) == 1:
+            return 0, [(rows[0][0], _database_error(e))]
+    middle = len(rows) // 2
+    loaded, errors = load_batch(engine, loader, table, columns, rows[:middle])
+    more, more_errors = load_batch(engine, loader, table, columns, rows[middle:])
+    return loaded + more, errors + more_errors
+
+def _overlaps(booked, start_time, end_time):
+    # `booked`: sorted, non-overlapping (start_time, end_time) pairs.
+    index = bisect.bisect_left(booked, (start_time,))
+    if index and booked[index - 1][1] > start_time:
+        return True
+    return index < len(booked) and booked[index][0] < end_time
+
+def unbooked(rows):
+    """ Show rows, (line, values) pairs, split into those that can be
+    booked and the (line, error) of those overlapping another show of their
+    venue or artist, in the database (queries.booking_conflicts, an index
+    range scan per row) or on an earlier line of `rows`.
+
+    For databases without the exclusion constraints of migration
+    c4d7e2a9f0b3, which refuse these rows themselves on PostgreSQL."""
+    accepted, refused = [], []
+    # (kind, owner id) -> the accepted shows' intervals, sorted.
+    booked = {}
+    for line, values in rows:
+        start_time, end_time = values['start_time'], values['end_time']
+        owners = [('venue', values['venue_id']), ('artist', values['artist_id'])]
+        clash = next((owner for owner in owners if _overlaps(booked.get(owner, []), start_time, end_time)), None)
+        if clash is not None:
+            refused.append((line, 'booking: %s %d has another show in this file at that time' % clash))
+            continue
+        conflicts = booking_conflicts(values['venue_id'], values['artist_id'], start_time, end_time, limit=1)
+        if conflicts:
+            conflict = conflicts[0]
+            if conflict.venue_id == values['venue_id']:
+                owner = ('venue', conflict.venue_id)
+            else:
+                owner = ('artist', conflict.artist_id)
+            refused.append((line, 'booking: %s %d already has show %d from %s to %s' % (
+                owner + (conflict.id, conflict.start_time, conflict.end_time)
+            )))
+            continue
+        for owner in owners:
+            bisect.insort(booked.setdefault(owner, []), (start_time, end_time))
+        accepted.append((line, values))
+    # Not to hold SQLite's read lock while the batch is written.
+    db.session.rollback()
+    return accepted, refused
+
+def load(kind, stream, fmt='csv', batch_size=5000, report=None):
+    """ Validate and load every row of `stream`, one transaction per batch.
+
+    Returns (loaded, rejected). Invalid rows, and rows the database refuses,
+    are skipped and passed to `report` along with the running totals after
+    each batch. Whatever happens, the caches, search indexes and show
+    counters are brought up to date with the rows loaded."""
+    model, schema = ENTITIES[kind]
+    table = model.__table__
+    engine = db.engine
+    loader = copy_rows if engine.dialect.name == 'postgresql' else insert_rows
+    loaded = rejected = 0
+    explicit_ids = False
+    errors = []
+
+    try:
+        for number, batch in enumerate(batches(read_rows(stream, fmt), batch_size)):
+            rows = []
+            for offset, row in enumerate(batch):
+                line = number * batch_size + offset + 1
+                try:
+                    rows.append((line, schema.validate(row)))
+                except RowError as e:
+                    rejected += 1
+                    errors.append((line, str(e)))
+            if rows:
+                columns = schema.columns + (['id'] if 'id' in rows[0][1] else [])
+                if 'genres' in columns:
+                    # COPY skips the column defaults, among them genre_mask's.
+                    columns = columns + ['genre_mask']
+                    for line, values in rows:
+                        values['genre_mask'] = Genres.mask(values['genres'])
+                if 'end_time' in columns:
+                    # Likewise end_time's, and blank end times are explicit NULLs.
+                    for line, values in rows:
+                        if values['end_time'] is None:
+                            values['end_time'] = values['start_time'] + SHOW_DURATION
+                explicit_ids = explicit_ids or 'id' in columns
+                if model is Show and engine.dialect.name != 'postgresql':
+                    rows, refused = unbooked(rows)
+                    rejected += len(refused)
+                    errors.extend(refused)
+                batch_loaded, refused = load_batch(engine, loader, table, columns, rows)
+                loaded += batch_loaded
+                rejected += len(refused)
+                errors.extend(refused)
+            if report is not None:
+                report(loaded, rejected, sorted(errors))
+            errors = []
+
+        if explicit_ids and engine.dialect.name == 'postgresql':
+            # Rows loaded with their own ids leave the serial sequence behind.
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'SELECT setval(pg_get_serial_sequence(\'"%s"\', \'id\'), '
+                    'COALESCE(MAX(id), 1)) FROM "%s"' % (table.name, table.name)
+                )
+    finally:
+        # Bulk loads bypass the ORM events that keep these in sync, and the
+        # batches committed before an error stay.
+        cache.invalidate(table.name)
+        search.reset_indexes()
+        if model is Show and loaded:
+            counters.recount()
+    return loaded, rejected
+
+#----------------------------------------------------------------------------#
+# Command.
+#----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(ENTITIES)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+    help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True,
+    help='Rows validated and committed per transaction.')
+@with_appcontext
+def import_command(kind, source, fmt, batch_size):
+    """ Bulk load venues, artists or shows from a CSV or NDJSON file
+    ('-' reads stdin). Rows are validated with the rules of the web forms;
+    shows double booking a venue or an artist are rejected too."""
+    if fmt is None:
+        fmt = 'ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+    started = time.perf_counter()
+
+    def report(loaded, rejected, errors):
+        for line, error in errors[:10]:
+            click.echo('row %d rejected: %s' % (line, error), err=True)
+        elapsed = time.perf_counter() - started
+        click.echo('%s: %d loaded, %d rejected, %.0f rows/s' % (
+            kind, loaded, rejected, (loaded + rejected) / elapsed if elapsed else 0
+        ), err=True)
+
+    loaded, rejected = load(kind, source, fmt, batch_size, report)
+    elapsed = time.perf_counter() - started
+    click.echo('Imported %d %s in %.1fs (%d rejected).' % (loaded, kind, elapsed, rejected))
+    if rejected:
+        sys.exit(1)
@@ -0,0 +1,202 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import sys
+import json
+import time
+import heapq
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flask import (
+    g,
+    request,
+    has_request_context
+)
+from flask.logging import default_handler
+
+#----------------------------------------------------------------------------#
+# Logging.
+#----------------------------------------------------------------------------#
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line. Fields passed through `extra={'fields':
+    {...}}` are merged into the object."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        entry["source"] = '%s:%d' % (record.pathname, record.lineno)
+        return json.dumps(entry, default=str)
+
+def configure_logging(app):
+    """ Send app.logger to LOG_FILE (stderr when unset) as JSON lines."""
+    if app.config.get('LOG_FILE'):
+        handler = logging.FileHandler(app.config['LOG_FILE'])
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    app.logger.removeHandler(default_handler)
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    handler.setLevel(level)
+    app.logger.setLevel(level)
+    app.logger.addHandler(handler)
+
+#----------------------------------------------------------------------------#
+# Query statistics.
+#----------------------------------------------------------------------------#
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class RequestStats:
+    """ Database work done on behalf of one request."""
+
+    def __init__(self, keep=5):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.keep = keep
+        self._slowest = []
+
+    def record(self, statement, milliseconds):
+        self.queries += 1
+        self.db_ms += milliseconds
+        entry = (milliseconds, self.queries, statement)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [
+            {"ms": round(ms, 3), "statement": statement}
+            for ms, _, statement in sorted(self._slowest, reverse=True)
+        ]
+
+    @property
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+def current_stats():
+    """ RequestStats of the running request, None outside of one."""
+    if has_request_context():
+        return g.get('_query_stats')
+    return None
+
+@contextmanager
+def assert_max_queries(limit):
+    """ Fail the enclosed test code when it runs more than `limit` queries,
+    wherever they come from (not only inside a request)."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+    if len(statements) > limit:
+        raise QueryBudgetExceeded('%d queries issued, budget is %d:\n%s' % (
+            len(statements), limit, '\n'.join(statements)
+        ))
+
+#----------------------------------------------------------------------------#
+# Profiler.
+#----------------------------------------------------------------------------#
+
+class QueryProfiler:
+    """ Counts and times every statement issued while handling a request.
+
+    Each response gets a Server-Timing header with the database and total
+    time, and a structured `request` log line with the slowest statements.
+    Statements over QUERY_SLOW_MS are also logged on their own. Routes listed
+    in QUERY_BUDGETS (endpoint -> max queries) that go over their budget are
+    logged, or fail the request when QUERY_BUDGET_ENFORCE is set, which is
+    how tests catch a new N+1."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_SLOW_MS', 100)
+        app.config.setdefault('QUERY_KEEP_SLOWEST', 5)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.config.setdefault('QUERY_BUDGET_ENFORCE', False)
+        self.app = app
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        milliseconds = (time.perf_counter() - started) * 1000
+        if milliseconds >= self.app.config['QUERY_SLOW_MS']:
+            self.app.logger.warning('slow query', extra={'fields': {
+                "event": "slow_query",
+                "ms": round(milliseconds, 3),
+                "statement": statement,
+                "path": request.path if has_request_context() else None
+            }})
+        stats = current_stats()
+        if stats is not None:
+            stats.record(statement, milliseconds)
+
+    def _handle_error(self, context):
+        started = context.connection.info.get('query_started') if context.connection else None
+        if started:
+            started.pop()
+
+    def _before_request(self):
+        g._query_stats = RequestStats(self.app.config['QUERY_KEEP_SLOWEST'])
+
+    def _after_request(self, response):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return response
+        elapsed_ms = stats.elapsed_ms
+        response.headers.add(
+            'Server-Timing',
+            'db;dur=%.2f;desc="%d queries", app;dur=%.2f' % (stats.db_ms, stats.queries, elapsed_ms)
+        )
+        fields = {
+            "event": "request",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "duration_ms": round(elapsed_ms, 3),
+            "db_queries": stats.queries,
+            "db_ms": round(stats.db_ms, 3),
+            "slowest": stats.slowest
+        }
+        self.app.logger.info('request', extra={'fields': fields})
+
+        budget = self.app.config['QUERY_BUDGETS'].get(request.endpoint)
+        if budget is not None and stats.queries > budget:
+            message = '%s issued %d queries, budget is %d' % (request.endpoint, stats.queries, budget)
+            if self.app.config['QUERY_BUDGET_ENFORCE']:
+                raise QueryBudgetExceeded(message)
+            self.app.logger.warning(message, extra={'fields': dict(fields, event="query_budget")})
+        return response
@@ -0,0 +1,40 @@
+"""add a BRIN index on show start_time
+
+Revision ID: 7a41c8d2e5b9
+Revises: 5c3e9f1a7d24
+Create Date: 2026-10-18 23:04:12.681945
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a41c8d2e5b9'
+down_revision = '5c3e9f1a7d24'
+branch_labels = None
+depends_on = None
+
+
+# Shows are mostly inserted in start_time order, so a block range index
+# summarises the table in a few pages and serves the month and date range
+# scans of the calendar and of /shows?from=&to= combined with the venue,
+# artist and genre filters (bitmap AND with their indexes), where the
+# (start_time, id) btree only helps the ordered keyset pages.
+# pages_per_range is kept small as a calendar month is a narrow slice.
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.create_index(
+        'ix_show_start_time_brin', 'Show', ['start_time'],
+        postgresql_using='brin',
+        postgresql_with={'pages_per_range': 32}
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_show_start_time_brin', table_name='Show')
@@ -0,0 +1,59 @@
+"""add genre masks and GIN indexes on genres
+
+Revision ID: 9e2b6d4f1c38
+Revises: 7a41c8d2e5b9
+Create Date: 2026-10-19 09:41:26.204517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b6d4f1c38'
+down_revision = '7a41c8d2e5b9'
+branch_labels = None
+depends_on = None
+
+
+# enums.Genres names as of this revision, in bit order. Frozen here so that
+# the backfill doesn't change meaning with later edits of the enum; masks of
+# genres added since are rewritten by `flask genres reconcile --fix`.
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'HipHop', 'HeavyMetal', 'Instrumental', 'Jazz', 'MusicalTheatre',
+    'Pop', 'Punk', 'RAndB', 'Reggae', 'RockNRoll', 'Soul', 'Other'
+]
+
+
+def _mask_expression(dialect):
+    # Sum of the bits of the genres present in the row's genres.
+    terms = []
+    for position, genre in enumerate(GENRES):
+        if dialect == 'postgresql':
+            present = "'%s' = ANY(genres)" % genre
+        else:
+            # JSON list elsewhere; genre names are plain words.
+            present = "CAST(genres AS VARCHAR) LIKE '%%\"%s\"%%'" % genre
+        terms.append('CASE WHEN %s THEN %d ELSE 0 END' % (present, 1 << position))
+    return ' + '.join(terms)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+        op.execute('UPDATE "%s" SET genre_mask = %s' % (table, _mask_expression(dialect)))
+        if dialect == 'postgresql':
+            op.create_index(
+                'ix_%s_genres' % table.lower(), table, ['genres'],
+                postgresql_using='gin'
+            )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('Artist', 'Venue'):
+        if dialect == 'postgresql':
+            op.drop_index('ix_%s_genres' % table.lower(), table_name=table)
+        op.drop_column(table, 'genre_mask')
@@ -0,0 +1,64 @@
+"""add show end times and booking exclusion constraints
+
+Revision ID: c4d7e2a9f0b3
+Revises: 9e2b6d4f1c38
+Create Date: 2026-10-20 10:17:52.304861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e2a9f0b3'
+down_revision = '9e2b6d4f1c38'
+branch_labels = None
+depends_on = None
+
+
+# enums.SHOW_DURATION and SHOW_MAX_DURATION as of this revision, in hours.
+DURATION = 3
+MAX_DURATION = 24
+
+
+# Existing shows get the default duration. On PostgreSQL two exclusion
+# constraints then refuse any show whose [start_time, end_time) overlaps
+# another of the same venue, or of the same artist: GiST indexes on (foreign
+# key, tsrange), btree_gist providing the equality part. Creating them fails,
+# naming both shows, if the table already holds double bookings; move or
+# shorten those first.
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if dialect == 'postgresql':
+        op.execute('UPDATE "Show" SET end_time = start_time + interval \'%d hours\'' % DURATION)
+    else:
+        op.execute('UPDATE "Show" SET end_time = datetime(start_time, \'+%d hours\')' % DURATION)
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_show_end_after_start', 'end_time > start_time')
+
+    if dialect != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.create_check_constraint(
+        'ck_show_max_duration', 'Show', "end_time <= start_time + interval '%d hours'" % MAX_DURATION
+    )
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            'ALTER TABLE "Show" ADD CONSTRAINT ex_show_%s_booking '
+            'EXCLUDE USING gist (%s WITH =, tsrange(start_time, end_time) WITH &&)' % (
+                column.split('_')[0], column
+            )
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for owner in ('artist', 'venue'):
+            op.drop_constraint('ex_show_%s_booking' % owner, 'Show')
+        op.drop_constraint('ck_show_max_duration', 'Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_constraint('ck_show_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
@@ -0,0 +1,75 @@
+"""add trigram and full text search indexes
+
+Revision ID: d057998b6e10
+Revises: 514528277cfa
+Create Date: 2026-10-18 10:12:40.117302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd057998b6e10'
+down_revision = '514528277cfa'
+branch_labels = None
+depends_on = None
+
+
+# to_tsvector() with an explicit configuration is immutable but
+# array_to_string() is only stable, so the search document is wrapped in an
+# IMMUTABLE function to make it usable in an expression index. search.py
+# queries through the same function so the planner can match the index.
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(
+    name varchar, city varchar, state varchar, genres varchar[]
+) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT to_tsvector('simple',
+        coalesce(name, '') || ' ' ||
+        coalesce(city, '') || ' ' ||
+        coalesce(state, '') || ' ' ||
+        coalesce(array_to_string(genres, ' '), ''))
+$$
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(SEARCH_DOCUMENT_FUNCTION)
+
+    for table in ('Venue', 'Artist'):
+        prefix = table.lower()
+        op.create_index(
+            'ix_%s_name_trgm' % prefix, table, ['name'],
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        )
+        op.create_index(
+            'ix_%s_city_trgm' % prefix, table, ['city'],
+            postgresql_using='gin',
+            postgresql_ops={'city': 'gin_trgm_ops'}
+        )
+        op.execute(
+            'CREATE INDEX ix_%s_search_document ON "%s" '
+            'USING gin (fyyur_search_document(name, city, state, genres))'
+            % (prefix, table)
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('Artist', 'Venue'):
+        prefix = table.lower()
+        op.drop_index('ix_%s_search_document' % prefix, table_name=table)
+        op.drop_index('ix_%s_city_trgm' % prefix, table_name=table)
+        op.drop_index('ix_%s_name_trgm' % prefix, table_name=table)
+
+    op.execute(
+        'DROP FUNCTION IF EXISTS fyyur_search_document(varchar, varchar, varchar, varchar[])'
+    )
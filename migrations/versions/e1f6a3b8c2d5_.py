@@ -0,0 +1,98 @@
+"""search genres by their display values
+
+Revision ID: e1f6a3b8c2d5
+Revises: c4d7e2a9f0b3
+Create Date: 2026-10-21 09:26:48.613027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f6a3b8c2d5'
+down_revision = 'c4d7e2a9f0b3'
+branch_labels = None
+depends_on = None
+
+
+# enums.Genres (name, value) pairs as of this revision. Frozen here, like
+# the function itself: a genre added to the enum later is searched by its
+# name until a migration adds its value.
+GENRES = (
+    ('Alternative', 'Alternative'),
+    ('Blues', 'Blues'),
+    ('Classical', 'Classical'),
+    ('Country', 'Country'),
+    ('Electronic', 'Electronic'),
+    ('Folk', 'Folk'),
+    ('Funk', 'Funk'),
+    ('HipHop', 'Hip-Hop'),
+    ('HeavyMetal', 'Heavy Metal'),
+    ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'),
+    ('MusicalTheatre', 'Musical Theatre'),
+    ('Pop', 'Pop'),
+    ('Punk', 'Punk'),
+    ('RAndB', 'R&B'),
+    ('Reggae', 'Reggae'),
+    ('RockNRoll', 'Rock n Roll'),
+    ('Soul', 'Soul'),
+    ('Other', 'Other'),
+)
+
+# Genres are stored by enum name ("RockNRoll"), which no one types: the
+# document now holds each genre's name and display value ("Rock n Roll",
+# "Hip-Hop", "R&B"), so "rock", "hip hop" and "r&b" match. search.py's
+# SearchIndex does the same on SQLite.
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(
+    name varchar, city varchar, state varchar, genres varchar[]
+) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT to_tsvector('simple',
+        coalesce(name, '') || ' ' ||
+        coalesce(city, '') || ' ' ||
+        coalesce(state, '') || ' ' ||
+        coalesce((
+            SELECT string_agg(genre || ' ' || coalesce(display.value, ''), ' ')
+            FROM unnest(genres) AS genre
+            LEFT JOIN (VALUES %s) AS display(name, value) ON display.name = genre
+        ), ''))
+$$
+""" % ', '.join("('%s', '%s')" % pair for pair in GENRES)
+
+# The function of revision d057998b6e10.
+PREVIOUS_SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(
+    name varchar, city varchar, state varchar, genres varchar[]
+) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT to_tsvector('simple',
+        coalesce(name, '') || ' ' ||
+        coalesce(city, '') || ' ' ||
+        coalesce(state, '') || ' ' ||
+        coalesce(array_to_string(genres, ' '), ''))
+$$
+"""
+
+
+# The expression indexes hold the function's output, which PostgreSQL
+# trusts to be immutable: rebuild them after replacing it.
+def _reindex():
+    for table in ('Venue', 'Artist'):
+        op.execute('REINDEX INDEX ix_%s_search_document' % table.lower())
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(SEARCH_DOCUMENT_FUNCTION)
+    _reindex()
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(PREVIOUS_SEARCH_DOCUMENT_FUNCTION)
+    _reindex()
@@ -4,6 +4,29 @@
 
 from app import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+
+from enums import (
+    Genres,
+    SHOW_DURATION
+)
+
+# Times are stored naive, in UTC (see formatting.py): compare them against
+# datetime.utcnow(), never the server's local datetime.now().
+
+# Postgres stores genres natively as an ARRAY; SQLite (local benchmark and
+# smoke runs) has no array type, so the same list is kept as JSON there.
+GenreList = db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite')
+
+def _genre_mask(context):
+    # Column default of genre_mask, so that Core and bulk inserts fill it in
+    # too; ORM writes go through the validates('genres') hooks below.
+    return Genres.mask(context.get_current_parameters().get('genres'))
+
+def _show_end_time(context):
+    # Column default of end_time, for inserts that only give a start_time.
+    start_time = context.get_current_parameters().get('start_time')
+    return start_time + SHOW_DURATION if start_time is not None else None
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -11,6 +34,21 @@ from datetime import datetime
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # Trigram indexes backing substring search, see search.py. The
+        # full text index on fyyur_search_document() lives in migration
+        # d057998b6e10 only, as it depends on a SQL function.
+        db.Index('ix_venue_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_city_trgm', 'city',
+            postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        # Grouping of the /venues listing by area.
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        # Latest change of the /venues listing, see queries.venues_validator.
+        db.Index('ix_venue_updated_at', 'updated_at'),
+        # Genre filters (contains any / all), see queries.genre_filter.
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -18,13 +56,36 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String()), nullable=False, default=[])
+    genres = db.Column(GenreList, nullable=False, default=[])
+    # enums.Genres.mask() of genres, filtered on where there is no GIN index
+    # on the array (SQLite). `flask genres reconcile` checks it.
+    genre_mask = db.Column(db.BigInteger, nullable=False, default=_genre_mask, server_default='0')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship("Show", backref="venue_shows_list", lazy=True, cascade="all, delete-orphan")
+    # Denormalized show counters maintained by counters.py. Shows starting
+    # after show_counts_at are counted as upcoming, the rest as past.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.func.now())
+    # Time of the last write to the row, including the counter updates of
+    # counters.py; feeds the HTTP validators of cache.Cache.conditional.
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+    # Never loaded implicitly, as a lazy load per parent turns any loop into
+    # N+1 queries; call sites opt in with selectinload(), see delete_venue.
+    shows = db.relationship(
+        "Show",
+        backref=db.backref("venue_shows_list", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan"
+    )
+
+    @validates('genres')
+    def _sync_genre_mask(self, key, genres):
+        self.genre_mask = Genres.mask(genres)
+        return genres
 
     # Equivalent of toString()
     def __repr__(self) -> str:
@@ -41,24 +102,61 @@ class Venue(db.Model):
         website_link: {self.website_link}, 
         seeking_talent: {self.seeking_talent}, 
         seeking_description: {self.seeking_description}, 
-        shows: {self.shows}
+        upcoming_shows_count: {self.upcoming_shows_count}, 
+        past_shows_count: {self.past_shows_count}
       >"""
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # Trigram indexes backing substring search, see search.py. The
+        # full text index on fyyur_search_document() lives in migration
+        # d057998b6e10 only, as it depends on a SQL function.
+        db.Index('ix_artist_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_city_trgm', 'city',
+            postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        # Latest change of the /artists listing, see queries.artists_validator.
+        db.Index('ix_artist_updated_at', 'updated_at'),
+        # Genre filters (contains any / all), see queries.genre_filter.
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String()), nullable=False, default=[])
+    genres = db.Column(GenreList, nullable=False, default=[])
+    # enums.Genres.mask() of genres, filtered on where there is no GIN index
+    # on the array (SQLite). `flask genres reconcile` checks it.
+    genre_mask = db.Column(db.BigInteger, nullable=False, default=_genre_mask, server_default='0')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship("Show", backref="artist_shows_list", lazy=True, cascade="all, delete-orphan")
+    # Denormalized show counters maintained by counters.py. Shows starting
+    # after show_counts_at are counted as upcoming, the rest as past.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.func.now())
+    # Time of the last write to the row, including the counter updates of
+    # counters.py; feeds the HTTP validators of cache.Cache.conditional.
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+    # Never loaded implicitly, as a lazy load per parent turns any loop into
+    # N+1 queries; call sites opt in with selectinload(), see delete_venue.
+    shows = db.relationship(
+        "Show",
+        backref=db.backref("artist_shows_list", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan"
+    )
+
+    @validates('genres')
+    def _sync_genre_mask(self, key, genres):
+        self.genre_mask = Genres.mask(genres)
+        return genres
 
     # Equivalent of toString()
     def __repr__(self) -> str:
@@ -74,16 +172,35 @@ class Artist(db.Model):
         website_link: {self.website_link}, 
         seeking_venue: {self.seeking_venue}, 
         seeking_description: {self.seeking_description}, 
-        shows: {self.shows}
+        upcoming_shows_count: {self.upcoming_shows_count}, 
+        past_shows_count: {self.past_shows_count}
       >"""
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    # Detail pages filter on one foreign key and split on start_time.
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    # Keyset pagination of /shows seeks on (start_time, id). The date range
+    # and calendar scans also use the BRIN index on start_time, which lives
+    # in migration 7a41c8d2e5b9 only (PostgreSQL).
+    db.Index('ix_show_start_time', 'start_time', 'id'),
+    # Latest change of the /shows listing, see queries.shows_validator.
+    db.Index('ix_show_updated_at', 'updated_at'),
+    # A show runs over [start_time, end_time). On PostgreSQL, exclusion
+    # constraints (GiST, tsrange overlap) refuse double bookings of a venue
+    # or an artist and cap the duration. They live in migration c4d7e2a9f0b3
+    # only; elsewhere queries.booking_conflicts checks before inserting.
+    db.CheckConstraint('end_time > start_time', name='ck_show_end_after_start'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False, default=datetime.today())
+  start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  end_time = db.Column(db.DateTime, nullable=False, default=_show_end_time)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
 
   # Equivalent of toString()
   def __repr__(self) -> str:
@@ -91,5 +208,6 @@ class Show(db.Model):
       id: {self.id}, 
         venue_id: {self.venue_id}, 
         artist_id: {self.artist_id}, 
-        start_time: {self.start_time}
+        start_time: {self.start_time},
+        end_time: {self.end_time}
       >"""
@@ -0,0 +1,164 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import json
+import base64
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.sql import Select
+
+from app import db
+
+#----------------------------------------------------------------------------#
+# Cursors.
+#----------------------------------------------------------------------------#
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(values):
+    """ Opaque, URL safe token for the sort key of a row."""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor, columns):
+    """ Sort key encoded by encode_cursor, coerced back to the python types
+    of `columns`."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor(cursor)
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                decoded.append(datetime.fromisoformat(value))
+            else:
+                decoded.append(python_type(value))
+        return tuple(decoded)
+    except InvalidCursor:
+        raise
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+class Page:
+    """ One page of rows plus the cursors of its neighbours (None when there
+    is no neighbour in that direction)."""
+
+    def __init__(self, items, limit, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+def page_size(limit=None):
+    """ Requested page size clamped to [1, MAX_PAGE_SIZE]."""
+    if limit is None:
+        return current_app.config['PAGE_SIZE']
+    return max(1, min(int(limit), current_app.config['MAX_PAGE_SIZE']))
+
+def keyset(query, columns, after=None, before=None, limit=None, descending=False):
+    """ Seek pagination over `query` ordered by `columns`.
+
+    Rather than OFFSET, each page filters on the sort key of the last row
+    seen (`after`) or of the first row of the current page (`before`), so
+    the database walks the index straight to the page and page N costs the
+    same as page 1. `columns` must end with a unique column (the primary
+    key) so the order is total.
+
+    Works on ORM queries and select() statements alike and returns the
+    filtered, ordered statement fetching one row more than the page size,
+    plus that page size; run it and hand the rows to page_of()."""
+    limit = page_size(limit)
+    position = db.tuple_(*columns)
+    leading = columns[0]
+
+    def following(cursor):
+        # The bound on the leading column is implied by the row comparison,
+        # but lets indexes that don't end with the primary key seek as well.
+        if descending:
+            return db.and_(leading <= cursor[0], position < cursor)
+        return db.and_(leading >= cursor[0], position > cursor)
+
+    def preceding(cursor):
+        if descending:
+            return db.and_(leading >= cursor[0], position > cursor)
+        return db.and_(leading <= cursor[0], position < cursor)
+
+    forward = [column.desc() if descending else column for column in columns]
+    backward = [column if descending else column.desc() for column in columns]
+
+    if before is not None:
+        query = query.filter(preceding(decode_cursor(before, columns))).order_by(*backward)
+    else:
+        if after is not None:
+            query = query.filter(following(decode_cursor(after, columns)))
+        query = query.order_by(*forward)
+    return query.limit(limit + 1), limit
+
+def page_of(rows, key, limit, after=None, before=None):
+    """ Page from the rows fetched by a keyset() statement. `key(row)`
+    returns the values of its `columns` for a row."""
+    if before is not None:
+        has_prev = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_next = True
+    else:
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = after is not None
+
+    return Page(
+        rows,
+        limit,
+        next_cursor=encode_cursor(key(rows[-1])) if rows and has_next else None,
+        prev_cursor=encode_cursor(key(rows[0])) if rows and has_prev else None
+    )
+
+class StreamedPage(Page):
+    """ Page whose items are read off `rows`, the result of a keyset()
+    statement paging forward, while they are rendered. Its cursors are only
+    known once the items have been iterated over (below the loop in a
+    template). Iterate over the items once; `item(row)` shapes each row."""
+
+    def __init__(self, rows, key, limit, after=None, item=None):
+        super().__init__(None, limit)
+        self.key = key
+        self.after = after
+        self.items = self._items(rows, item or (lambda row: row))
+
+    def _items(self, rows, item):
+        last = None
+        for count, row in enumerate(rows):
+            if count == self.limit:
+                # The extra row keyset() fetches: there is a next page.
+                self.next_cursor = encode_cursor(self.key(last))
+                break
+            if count == 0 and self.after is not None:
+                self.prev_cursor = encode_cursor(self.key(row))
+            last = row
+            yield item(row)
+
+def streamed_page(rows, key, limit, after=None, before=None, item=None):
+    """ StreamedPage of `rows`, or a Page of them when paging backward, as
+    those rows come last first and have to be read to be reversed."""
+    if before is not None:
+        page = page_of(rows.all(), key, limit, after, before)
+        if item is not None:
+            page.items = [item(row) for row in page.items]
+        return page
+    return StreamedPage(rows, key, limit, after, item)
+
+def paginate(query, columns, key, after=None, before=None, limit=None, descending=False):
+    """ Page of an ORM query or select() statement, see keyset()."""
+    query, limit = keyset(query, columns, after, before, limit, descending)
+    rows = db.session.execute(query).all() if isinstance(query, Select) else query.all()
+    return page_of(rows, key, limit, after, before)
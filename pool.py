@@ -0,0 +1,185 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import time
+import bisect
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import (
+    NullPool,
+    QueuePool
+)
+
+#----------------------------------------------------------------------------#
+# Histograms.
+#----------------------------------------------------------------------------#
+
+# Upper bounds, in milliseconds, of the histogram buckets.
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+class Histogram:
+    """ Fixed bucket latency histogram, cheap enough to update on every
+    checkout."""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, milliseconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, milliseconds)] += 1
+            self.total += milliseconds
+            self.maximum = max(self.maximum, milliseconds)
+
+    def snapshot(self):
+        count = sum(self.counts)
+        buckets = {'le_%s' % bound: n for bound, n in zip(self.bounds, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            "count": count,
+            "mean_ms": round(self.total / count, 3) if count else 0.0,
+            "max_ms": round(self.maximum, 3),
+            "buckets": buckets
+        }
+
+#----------------------------------------------------------------------------#
+# Pool.
+#----------------------------------------------------------------------------#
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool recording how long each checkout waited for a free
+    connection, which is where pool exhaustion shows up first."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_histogram = Histogram()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_histogram.observe((time.perf_counter() - started) * 1000)
+
+def engine_options(config):
+    """ SQLALCHEMY_ENGINE_OPTIONS for the DB_POOL_* settings.
+
+    SQLite keeps the defaults picked by Flask-SQLAlchemy. DB_PGBOUNCER
+    hands pooling over to PgBouncer (transaction mode): no pool on our side
+    and no server side prepared statements, which do not survive being
+    moved between server connections."""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return options
+
+    if config['DB_PGBOUNCER']:
+        options['poolclass'] = NullPool
+        connect_args = options.setdefault('connect_args', {})
+        if url.get_driver_name() == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+        elif url.get_driver_name() == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        return options
+
+    options.update({
+        "poolclass": TimedQueuePool,
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING']
+    })
+    return options
+
+#----------------------------------------------------------------------------#
+# Monitor.
+#----------------------------------------------------------------------------#
+
+class PoolMonitor:
+    """ Connection pool statistics gathered from SQLAlchemy pool events."""
+
+    def __init__(self, app=None, db=None):
+        self.pools = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('DB_POOL_SIZE', 5)
+        app.config.setdefault('DB_MAX_OVERFLOW', 10)
+        app.config.setdefault('DB_POOL_TIMEOUT', 30)
+        app.config.setdefault('DB_POOL_RECYCLE', 1800)
+        app.config.setdefault('DB_POOL_PRE_PING', True)
+        app.config.setdefault('DB_PGBOUNCER', False)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+        self.watch('default', db.get_engine(app))
+
+    def watch(self, name, engine):
+        """ Start collecting statistics for the pool of `engine`."""
+        stats = {
+            "name": name,
+            "pool": engine.pool,
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "hold_histogram": Histogram()
+        }
+
+        def connect(dbapi_connection, connection_record):
+            stats["connects"] += 1
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            stats["checkouts"] += 1
+            connection_record.info['checked_out_at'] = time.perf_counter()
+
+        def checkin(dbapi_connection, connection_record):
+            stats["checkins"] += 1
+            started = connection_record.info.pop('checked_out_at', None)
+            if started is not None:
+                stats["hold_histogram"].observe((time.perf_counter() - started) * 1000)
+
+        def invalidate(dbapi_connection, connection_record, exception):
+            stats["invalidations"] += 1
+
+        event.listen(engine.pool, 'connect', connect)
+        event.listen(engine.pool, 'checkout', checkout)
+        event.listen(engine.pool, 'checkin', checkin)
+        event.listen(engine.pool, 'invalidate', invalidate)
+        with self._lock:
+            self.pools.append((engine, stats))
+
+    def stats(self):
+        result = []
+        for engine, stats in self.pools:
+            # engine.dispose() swaps in a fresh pool sharing our listeners.
+            pool = engine.pool
+            entry = {
+                "name": stats["name"],
+                "class": type(pool).__name__,
+                "status": pool.status(),
+                "connects": stats["connects"],
+                "checkouts": stats["checkouts"],
+                "checkins": stats["checkins"],
+                "invalidations": stats["invalidations"],
+                "checked_out": stats["checkouts"] - stats["checkins"],
+                "hold_time": stats["hold_histogram"].snapshot()
+            }
+            if isinstance(pool, QueuePool):
+                entry.update({
+                    "size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "overflow": max(0, pool.overflow())
+                })
+            if isinstance(pool, TimedQueuePool):
+                entry["wait_time"] = pool.wait_histogram.snapshot()
+            result.append(entry)
+        return result
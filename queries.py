@@ -0,0 +1,514 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import calendar
+from itertools import groupby
+from datetime import (
+    datetime,
+    timedelta
+)
+
+from flask import current_app
+
+from app import db
+
+from models import (
+    Venue,
+    Artist,
+    Show
+)
+
+from pagination import (
+    keyset,
+    page_of,
+    streamed_page
+)
+
+from formatting import (
+    stored_time,
+    display_time
+)
+
+from enums import (
+    Genres,
+    SHOW_MAX_DURATION
+)
+
+from records import (
+    ListedShow,
+    VenueShow,
+    ArtistShow,
+    CalendarShow,
+    BookedShow,
+    columns,
+    records
+)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+def streamed(statement):
+    """ Result of `statement` fetched STREAM_YIELD_PER rows at a time (from
+    a server-side cursor on PostgreSQL), for templating.stream_template().
+    Iterate over it once, within the request."""
+    return db.session.execute(
+        statement.execution_options(yield_per=current_app.config['STREAM_YIELD_PER'])
+    )
+
+#----------------------------------------------------------------------------#
+# Venue areas.
+#----------------------------------------------------------------------------#
+
+def venue_area_statement(genres=None, genre_match='any'):
+    """ (id, name, city, state, num_upcoming_shows) for every venue, or the
+    venues of genre_filters(), ordered so that venues of the same area are
+    adjacent. The count is the venue's show counter, see counters.py."""
+    return filter_genres(db.select(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ), Venue, genres, genre_match).order_by(
+        Venue.state, Venue.city, Venue.id
+    )
+
+def iter_areas(rows):
+    """ Rows of venue_area_statement() grouped by (city, state) in the shape
+    pages/venues.html expects, as they are read:
+    {"city", "state", "venues": iterator of {"id", "name", "num_upcoming_shows"}}
+    per area. Iterate over the venues of an area before moving to the next."""
+    for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        yield {
+            "city": city,
+            "state": state,
+            "venues": ({
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": venue.num_upcoming_shows
+            } for venue in venues)
+        }
+
+def group_areas(rows):
+    """ iter_areas() as a list of areas with venue lists."""
+    return [dict(area, venues=list(area["venues"])) for area in iter_areas(rows)]
+
+def streamed_venue_areas(**filters):
+    """ iter_areas() of the venues, read while they are rendered."""
+    return iter_areas(streamed(venue_area_statement(**filters)))
+
+#----------------------------------------------------------------------------#
+# Detail page shows.
+#----------------------------------------------------------------------------#
+
+def _show_key(show):
+    return (show.start_time, show.id)
+
+def show_window(statement, when, after=None, current_time=None, limit=None):
+    """ keyset() arguments for a bounded window of `statement`: upcoming
+    shows soonest first, past shows most recent first. `after` is the cursor
+    of the previous window. Returns (statement, limit)."""
+    if current_time is None:
+        current_time = datetime.utcnow()
+    if when == 'upcoming':
+        statement = statement.filter(Show.start_time > current_time)
+    else:
+        statement = statement.filter(Show.start_time <= current_time)
+    return keyset(
+        statement,
+        columns=(Show.start_time, Show.id),
+        after=after,
+        limit=limit or current_app.config['DETAIL_SHOWS_WINDOW'],
+        descending=(when == 'past')
+    )
+
+def show_page(rows, limit, after=None):
+    """ Page of the rows fetched by a show_window() statement."""
+    return page_of(rows, _show_key, limit, after)
+
+def venue_shows_statement(venue_id):
+    return db.select(*columns(VenueShow)).join(Artist).filter(
+        Show.venue_id == venue_id
+    )
+
+def venue_show_items(rows):
+    """ Rows of venue_shows_statement() as the records.VenueShow
+    pages/show_venue.html expects."""
+    return records(VenueShow, rows)
+
+def artist_shows_statement(artist_id):
+    return db.select(*columns(ArtistShow)).join(Venue).filter(
+        Show.artist_id == artist_id
+    )
+
+def artist_show_items(rows):
+    """ Rows of artist_shows_statement() as the records.ArtistShow
+    pages/show_artist.html expects."""
+    return records(ArtistShow, rows)
+
+def venue_shows(venue_id, when, after=None, current_time=None, limit=None):
+    """ Page of upcoming or past shows at a venue."""
+    statement, limit = show_window(venue_shows_statement(venue_id), when, after, current_time, limit)
+    page = show_page(db.session.execute(statement).all(), limit, after)
+    page.items = venue_show_items(page.items)
+    return page
+
+def artist_shows(artist_id, when, after=None, current_time=None, limit=None):
+    """ Page of upcoming or past shows of an artist."""
+    statement, limit = show_window(artist_shows_statement(artist_id), when, after, current_time, limit)
+    page = show_page(db.session.execute(statement).all(), limit, after)
+    page.items = artist_show_items(page.items)
+    return page
+
+#----------------------------------------------------------------------------#
+# Genre filters.
+#----------------------------------------------------------------------------#
+
+class InvalidFilter(ValueError):
+    """ A filter of the query string that doesn't parse."""
+
+# Query string arguments filtering by genre, see genre_filters().
+GENRE_FILTERS = ('genre', 'genre_match')
+
+# Genres are stored by enum name; filters accept names and values.
+GENRE_NAMES = dict(
+    [(genre.name.lower(), genre.name) for genre in Genres] +
+    [(genre.value.lower(), genre.name) for genre in Genres]
+)
+
+GENRE_MATCHES = ('any', 'all')
+
+def genre_filters(args):
+    """ genre_filter() keyword arguments from `args`, a query string
+    MultiDict:
+
+        genre           enums.Genres names or values, repeated or comma
+                        separated
+        genre_match     'any' (the default) or 'all' of them
+
+    Raises InvalidFilter."""
+    genres = []
+    for value in args.getlist('genre'):
+        for part in value.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            genre = GENRE_NAMES.get(part.lower())
+            if genre is None:
+                raise InvalidFilter('Unknown genre %r' % part)
+            if genre not in genres:
+                genres.append(genre)
+    if not genres:
+        return {}
+    match = args.get('genre_match') or 'any'
+    if match not in GENRE_MATCHES:
+        raise InvalidFilter('genre_match must be one of %s' % ', '.join(GENRE_MATCHES))
+    return {"genres": genres, "genre_match": match}
+
+def genre_filter(model, genres, genre_match='any'):
+    """ Condition on the rows of `model` (Venue or Artist) having any or
+    all of `genres`. On PostgreSQL an array overlap (&&) or containment (@>)
+    served by the GIN index on genres; elsewhere a test of the genre_mask
+    bits."""
+    if db.engine.dialect.name == 'postgresql':
+        if genre_match == 'all':
+            return model.genres.contains(genres)
+        return model.genres.overlap(genres)
+    mask = Genres.mask(genres)
+    matched = model.genre_mask.op('&')(mask)
+    if genre_match == 'all':
+        return matched == mask
+    return matched != 0
+
+def filter_genres(statement, model, genres=None, genre_match='any'):
+    """ `statement` narrowed to genre_filter(), when genres are given."""
+    if not genres:
+        return statement
+    return statement.filter(genre_filter(model, genres, genre_match))
+
+#----------------------------------------------------------------------------#
+# Show filters.
+#----------------------------------------------------------------------------#
+
+# Query string arguments filtering the show listings, see show_filters().
+SHOW_FILTERS = ('from', 'to', 'city', 'state', 'venue_id', 'artist_id') + GENRE_FILTERS
+
+def _time_bound(value, timezone, end=False):
+    # A date covers the whole day, an ISO datetime is taken as is.
+    try:
+        if len(value) == 10:
+            bound = datetime.strptime(value, '%Y-%m-%d')
+            if end:
+                bound += timedelta(days=1)
+        else:
+            bound = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidFilter('%r is not a date (YYYY-MM-DD) or ISO datetime' % value)
+    if bound.tzinfo is not None:
+        # An explicit offset wins over the display timezone.
+        return stored_time(bound.replace(tzinfo=None) - bound.utcoffset(), None)
+    return stored_time(bound, timezone)
+
+def _id(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidFilter('%s must be an integer' % name)
+
+def show_filters(args, timezone=None):
+    """ filter_shows() keyword arguments from the SHOW_FILTERS of `args`, a
+    query string MultiDict:
+
+        from, to            dates (YYYY-MM-DD, both days included) or ISO
+                            datetimes (`to` excluded), in `timezone`
+        city, state         of the venue
+        genre, genre_match  genres of the artist, see genre_filters()
+        venue_id, artist_id
+
+    Raises InvalidFilter."""
+    filters = {}
+    if args.get('from'):
+        filters['start'] = _time_bound(args['from'], timezone)
+    if args.get('to'):
+        filters['end'] = _time_bound(args['to'], timezone, end=True)
+    if args.get('city'):
+        filters['city'] = args['city'].strip()
+    if args.get('state'):
+        filters['state'] = args['state'].strip().upper()
+    filters.update(genre_filters(args))
+    for name in ('venue_id', 'artist_id'):
+        if args.get(name):
+            filters[name] = _id(args[name], name)
+    return filters
+
+def filter_shows(statement, start=None, end=None, city=None, state=None, venue_id=None, artist_id=None,
+                 genres=None, genre_match='any'):
+    """ `statement` (a select or query of shows joined to their venue and
+    artist) narrowed to the filters given. Ranges seek on the start_time
+    indexes of Show."""
+    if start is not None:
+        statement = statement.filter(Show.start_time >= start)
+    if end is not None:
+        statement = statement.filter(Show.start_time < end)
+    if venue_id is not None:
+        statement = statement.filter(Show.venue_id == venue_id)
+    if artist_id is not None:
+        statement = statement.filter(Show.artist_id == artist_id)
+    if state is not None:
+        statement = statement.filter(Venue.state == state)
+    if city is not None:
+        statement = statement.filter(Venue.city == city)
+    return filter_genres(statement, Artist, genres, genre_match)
+
+#----------------------------------------------------------------------------#
+# Listings.
+#----------------------------------------------------------------------------#
+
+def _artist_key(artist):
+    return (artist.id,)
+
+def artist_list_window(after=None, before=None, limit=None, **filters):
+    """ keyset() statement and page size for a page of /artists, narrowed by
+    genre_filters()."""
+    return keyset(
+        filter_genres(db.select(Artist.id, Artist.name), Artist, **filters),
+        columns=(Artist.id,),
+        after=after,
+        before=before,
+        limit=limit
+    )
+
+def artist_list_page(rows, limit, after=None, before=None):
+    return page_of(rows, _artist_key, limit, after, before)
+
+def streamed_artist_list(after=None, before=None, limit=None, **filters):
+    """ Page of (id, name) rows of /artists, read while it is rendered, see
+    pagination.StreamedPage."""
+    statement, limit = artist_list_window(after, before, limit, **filters)
+    return streamed_page(streamed(statement), _artist_key, limit, after, before)
+
+def show_list_window(after=None, before=None, limit=None, **filters):
+    """ keyset() statement and page size for a page of /shows, narrowed by
+    show_filters()."""
+    return keyset(
+        filter_shows(db.select(*columns(ListedShow)).join(Venue).join(Artist), **filters),
+        columns=(Show.start_time, Show.id),
+        after=after,
+        before=before,
+        limit=limit
+    )
+
+def show_list_page(rows, limit, after=None, before=None):
+    """ Page of the rows fetched by a show_list_window() statement, with
+    the records.ListedShow items pages/shows.html expects."""
+    page = page_of(rows, _show_key, limit, after, before)
+    page.items = records(ListedShow, page.items)
+    return page
+
+def streamed_show_list(after=None, before=None, limit=None, **filters):
+    """ Page of /shows, its records.ListedShow items read while they are
+    rendered, see pagination.StreamedPage."""
+    statement, limit = show_list_window(after, before, limit, **filters)
+    return streamed_page(streamed(statement), _show_key, limit, after, before, ListedShow._make)
+
+#----------------------------------------------------------------------------#
+# Show calendar.
+#----------------------------------------------------------------------------#
+
+def calendar_month(value=None, timezone=None):
+    """ (year, month) of a YYYY-MM string, the current month in `timezone`
+    when empty."""
+    if not value:
+        today = display_time(datetime.utcnow(), timezone)
+        return today.year, today.month
+    try:
+        month = datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise InvalidFilter('%r is not a month (YYYY-MM)' % value)
+    return month.year, month.month
+
+def calendar_weeks(year, month):
+    """ Weeks (Monday first) of dates covering the month."""
+    return calendar.Calendar().monthdatescalendar(year, month)
+
+def calendar_window(weeks, timezone=None, limit=None, **filters):
+    """ Statement of the shows of the days in `weeks`, soonest first, at
+    most CALENDAR_MAX_SHOWS (plus one, to tell a truncated month). Days
+    start at midnight in `timezone`."""
+    if limit is None:
+        limit = current_app.config['CALENDAR_MAX_SHOWS']
+    first, last = weeks[0][0], weeks[-1][-1] + timedelta(days=1)
+    filters.pop('start', None)
+    filters.pop('end', None)
+    return filter_shows(
+        db.select(*columns(CalendarShow)).join(Venue).join(Artist),
+        start=stored_time(datetime(first.year, first.month, first.day), timezone),
+        end=stored_time(datetime(last.year, last.month, last.day), timezone),
+        **filters
+    ).order_by(
+        Show.start_time, Show.id
+    ).limit(limit + 1), limit
+
+def calendar_days(rows, weeks, month, limit, timezone=None):
+    """ Rows of a calendar_window() statement by day, in the shape
+    pages/show_calendar.html expects: ([[{"date", "in_month", "shows",
+    "more"}]], truncated), shows being records.CalendarShow. A day lists its
+    first CALENDAR_SHOWS_PER_DAY shows, `more` counts the others."""
+    per_day = current_app.config['CALENDAR_SHOWS_PER_DAY']
+    truncated = len(rows) > limit
+    shows = {}
+    for show in records(CalendarShow, rows[:limit]):
+        shows.setdefault(display_time(show.start_time, timezone).date(), []).append(show)
+    return [[{
+        "date": day,
+        "in_month": day.month == month,
+        "shows": shows.get(day, [])[:per_day],
+        "more": max(0, len(shows.get(day, [])) - per_day)
+    } for day in week] for week in weeks], truncated
+
+def show_calendar(year, month, timezone=None, **filters):
+    weeks = calendar_weeks(year, month)
+    statement, limit = calendar_window(weeks, timezone, **filters)
+    return calendar_days(db.session.execute(statement).all(), weeks, month, limit, timezone)
+
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# A show runs over [start_time, end_time), and a venue or an artist can't
+# have two shows at once. On PostgreSQL exclusion constraints enforce this
+# (migration c4d7e2a9f0b3); booking_conflicts() finds the clashes on any
+# database, so that forms can name them.
+#
+# A show that overlaps [start, end) starts before `end` and, lasting at most
+# SHOW_MAX_DURATION, after `start - SHOW_MAX_DURATION`. That bounds a range
+# scan of the (venue_id, start_time) and (artist_id, start_time) indexes:
+# O(log n) plus the few shows of the venue or artist in that window,
+# whatever the size of the table.
+#----------------------------------------------------------------------------#
+
+def overlapping_shows(foreign_key, owner_id, start_time, end_time):
+    """ Shows with `foreign_key` (Show.venue_id or Show.artist_id) equal to
+    `owner_id` overlapping [start_time, end_time)."""
+    return db.select(*columns(BookedShow)).filter(
+        foreign_key == owner_id,
+        Show.start_time > start_time - SHOW_MAX_DURATION,
+        Show.start_time < end_time,
+        Show.end_time > start_time
+    )
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time, exclude_id=None, limit=5):
+    """ The first `limit` shows of the venue or of the artist overlapping
+    [start_time, end_time), as records.BookedShow, soonest first. A show
+    being moved passes its own id as `exclude_id`."""
+    overlapping = db.union(
+        overlapping_shows(Show.venue_id, venue_id, start_time, end_time),
+        overlapping_shows(Show.artist_id, artist_id, start_time, end_time)
+    ).subquery()
+    statement = db.select(overlapping).order_by(overlapping.c.start_time, overlapping.c.id).limit(limit)
+    if exclude_id is not None:
+        statement = statement.filter(overlapping.c.id != exclude_id)
+    return records(BookedShow, db.session.execute(statement))
+
+#----------------------------------------------------------------------------#
+# Validators.
+#
+# Statements selecting one row that changes whenever the matching page does,
+# for the ETag / Last-Modified of cache.Cache.conditional. They rely on the
+# updated_at columns: creating, moving or deleting a show updates the show
+# counters, and with them updated_at, of its venue and artist.
+#----------------------------------------------------------------------------#
+
+def _detail_validator(model, foreign_key, other, other_key, owner_id, current_time):
+    # The owner, its shows and the rows on the other end of them, plus the
+    # start of the latest past show: the page's upcoming/past split moves
+    # with the clock, not with a write. No row when the owner doesn't exist.
+    if current_time is None:
+        current_time = datetime.utcnow()
+    return db.select(
+        model.updated_at,
+        db.func.max(Show.updated_at),
+        db.func.max(other.updated_at),
+        db.func.max(db.case((Show.start_time <= current_time, Show.start_time)))
+    ).select_from(model).outerjoin(
+        Show, foreign_key == model.id
+    ).outerjoin(
+        other, other.id == other_key
+    ).where(
+        model.id == owner_id
+    ).group_by(
+        model.id, model.updated_at
+    )
+
+def venue_validator(venue_id, current_time=None):
+    return _detail_validator(Venue, Show.venue_id, Artist, Show.artist_id, venue_id, current_time)
+
+def artist_validator(artist_id, current_time=None):
+    return _detail_validator(Artist, Show.artist_id, Venue, Show.venue_id, artist_id, current_time)
+
+def venues_validator():
+    # Deleting a venue leaves no updated_at behind, hence the count.
+    return db.select(db.func.max(Venue.updated_at), db.func.count(Venue.id))
+
+def artists_validator():
+    return db.select(db.func.max(Artist.updated_at), db.func.count(Artist.id))
+
+def shows_validator():
+    # Deleting a show (or a venue, and its shows with it) updates the
+    # counters of the venues and artists on the other end.
+    return db.select(
+        db.select(db.func.max(Show.updated_at)).scalar_subquery(),
+        db.select(db.func.max(Venue.updated_at)).scalar_subquery(),
+        db.select(db.func.max(Artist.updated_at)).scalar_subquery()
+    )
+
+def show_validator(show_id):
+    # The show and the names on both ends of it.
+    return db.select(
+        Show.updated_at,
+        Venue.updated_at,
+        Artist.updated_at
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).where(
+        Show.id == show_id
+    )
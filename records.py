@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from typing import NamedTuple
+
+from models import (
+    Venue,
+    Artist,
+    Show
+)
+
+#----------------------------------------------------------------------------#
+# View records.
+#
+# Rows of the show listings are handed to templates and to the API as
+# records: NamedTuple classes, so a record is a bare tuple with its field
+# names kept once on the class, where a dict per row carries its own hash
+# table. Templates read them like dicts (show.start_time).
+#
+# Each record lists in `source` the columns it is read from, in field
+# order. Statements select columns(record) and rows become records with
+# record._make(row), so the HTML pages and the API share one projection and
+# can't drift apart. JSON output converts them with record._asdict().
+#----------------------------------------------------------------------------#
+
+class ListedShow(NamedTuple):
+    """ A show of /shows and /api/v1/shows."""
+    id: int
+    venue_id: int
+    venue_name: str
+    artist_id: int
+    artist_name: str
+    artist_image_link: str
+    start_time: datetime
+    end_time: datetime
+
+    source = (
+        Show.id,
+        Show.venue_id,
+        Venue.name,
+        Show.artist_id,
+        Artist.name,
+        Artist.image_link,
+        Show.start_time,
+        Show.end_time
+    )
+
+class VenueShow(NamedTuple):
+    """ A show of a venue's page and of its API show windows."""
+    id: int
+    artist_id: int
+    artist_name: str
+    artist_image_link: str
+    start_time: datetime
+
+    source = (
+        Show.id,
+        Show.artist_id,
+        Artist.name,
+        Artist.image_link,
+        Show.start_time
+    )
+
+class ArtistShow(NamedTuple):
+    """ A show of an artist's page and of its API show windows."""
+    id: int
+    venue_id: int
+    venue_name: str
+    venue_image_link: str
+    start_time: datetime
+
+    source = (
+        Show.id,
+        Show.venue_id,
+        Venue.name,
+        Venue.image_link,
+        Show.start_time
+    )
+
+class CalendarShow(NamedTuple):
+    """ A show of /shows/calendar."""
+    id: int
+    start_time: datetime
+    venue_id: int
+    venue_name: str
+    artist_id: int
+    artist_name: str
+
+    source = (
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name,
+        Show.artist_id,
+        Artist.name
+    )
+
+class BookedShow(NamedTuple):
+    """ A show in the way of a new booking, see queries.booking_conflicts."""
+    id: int
+    venue_id: int
+    artist_id: int
+    start_time: datetime
+    end_time: datetime
+
+    source = (
+        Show.id,
+        Show.venue_id,
+        Show.artist_id,
+        Show.start_time,
+        Show.end_time
+    )
+
+def columns(record):
+    """ The source columns of `record`, labelled with its field names."""
+    return [column.label(name) for name, column in zip(record._fields, record.source)]
+
+def records(record, rows):
+    """ Rows of a statement selecting columns(record), as records."""
+    return [record._make(row) for row in rows]
+
+def as_dicts(items):
+    """ Records (or rows, which have _asdict() too) as dicts, for JSON
+    output."""
+    return [item._asdict() for item in items]
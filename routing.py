@@ -0,0 +1,208 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import time
+import random
+import threading
+from itertools import count
+
+from sqlalchemy import (
+    event,
+    orm
+)
+from flask_sqlalchemy import (
+    SQLAlchemy,
+    SignallingSession
+)
+from flask import (
+    g,
+    request,
+    session,
+    has_request_context
+)
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# Requests to the endpoints in REPLICA_ENDPOINTS run their statements on one
+# of the replica binds (SQLALCHEMY_BINDS 'replica_*', built from
+# DATABASE_REPLICA_URLS in config.py); everything else, writes and anything
+# outside a request (CLI, jobs) uses the primary. A request that commits a
+# write pins its client to the primary for REPLICA_STICKY_SECONDS through
+# the session cookie, so the page it redirects to reads its own write even
+# while the replicas lag behind.
+#
+# The page cache is shared by every client, pinned or not: a page rendered
+# from a replica within REPLICA_STICKY_SECONDS of a write to one of its
+# tables may miss that write, so it isn't stored (ReplicaRouter.may_store,
+# a cache.Cache store check) and the writer's next request can't be served
+# it from the cache.
+#
+# Callers reading from the primary whatever the endpoint (asgi.py's async
+# views) set PRIMARY_ONLY in the WSGI environ.
+#----------------------------------------------------------------------------#
+
+# Session cookie key holding the time until which reads stay on the primary.
+STICKY_KEY = '_read_primary_until'
+
+PRIMARY_ONLY = 'fyyur.read_primary'
+
+class RoutingSession(SignallingSession):
+    """ Session sending reads to the replica picked for the request."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = g.get('_replica') if has_request_context() else None
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy with RoutingSession as its session class."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+#----------------------------------------------------------------------------#
+# Replica selection.
+#----------------------------------------------------------------------------#
+
+class RoundRobin:
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self._counter = count()
+
+    def pick(self):
+        return self.replicas[next(self._counter) % len(self.replicas)]
+
+class LeastLatency:
+    """ Replica with the lowest moving average statement time. Every
+    `explore`-th pick is random so that the averages of replicas that fell
+    out of favour keep being refreshed."""
+
+    def __init__(self, replicas, explore=20):
+        self.replicas = replicas
+        self.explore = explore
+        self._counter = count()
+
+    def pick(self):
+        if next(self._counter) % self.explore == 0:
+            return random.choice(self.replicas)
+        return min(self.replicas, key=lambda replica: replica.latency_ms)
+
+SELECTION = {
+    'round_robin': RoundRobin,
+    'least_latency': LeastLatency
+}
+
+class Replica:
+    """ A replica engine with an exponentially weighted moving average of
+    its statement times."""
+
+    def __init__(self, name, engine, weight=0.2):
+        self.name = name
+        self.engine = engine
+        self.weight = weight
+        self.latency_ms = 0.0
+        self.statements = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('replica_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        milliseconds = (time.perf_counter() - conn.info['replica_started'].pop()) * 1000
+        with self._lock:
+            self.statements += 1
+            if self.statements == 1:
+                self.latency_ms = milliseconds
+            else:
+                self.latency_ms += self.weight * (milliseconds - self.latency_ms)
+
+#----------------------------------------------------------------------------#
+# Router.
+#----------------------------------------------------------------------------#
+
+class ReplicaRouter:
+    """ Picks the database of each request, see above. Disabled when no
+    replica is configured."""
+
+    def __init__(self, app=None, db=None, pool_monitor=None):
+        self.replicas = []
+        self.primary_requests = 0
+        if app is not None:
+            self.init_app(app, db, pool_monitor)
+
+    def init_app(self, app, db, pool_monitor=None):
+        app.config.setdefault('REPLICA_SELECTION', 'round_robin')
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_ENDPOINTS', set())
+        self.app = app
+        for key in sorted(app.config.get('SQLALCHEMY_BINDS') or {}):
+            if key.startswith('replica'):
+                engine = db.get_engine(app, bind=key)
+                self.replicas.append(Replica(key, engine))
+                if pool_monitor is not None:
+                    pool_monitor.watch(key, engine)
+        if not self.replicas:
+            return
+        self.selection = SELECTION[app.config['REPLICA_SELECTION']](self.replicas)
+
+        event.listen(db.session, 'after_flush', self._after_flush)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _reads_from_replica(self):
+        if request.endpoint not in self.app.config['REPLICA_ENDPOINTS'] or request.environ.get(PRIMARY_ONLY):
+            return False
+        return session.get(STICKY_KEY, 0) < time.time()
+
+    def _before_request(self):
+        if self._reads_from_replica():
+            replica = self.selection.pick()
+            replica.requests += 1
+            g._replica = replica.engine
+        else:
+            self.primary_requests += 1
+            g._replica = None
+
+    # A committed write, not merely attempted, is what needs to be read back.
+    def _after_flush(self, db_session, flush_context):
+        db_session.info['replica_wrote'] = True
+
+    def _after_commit(self, db_session):
+        if db_session.info.pop('replica_wrote', False) and has_request_context():
+            g._wrote_primary = True
+
+    def _after_rollback(self, db_session):
+        db_session.info.pop('replica_wrote', None)
+
+    def _after_request(self, response):
+        if g.pop('_wrote_primary', False):
+            session[STICKY_KEY] = time.time() + self.app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+    def may_store(self, ages):
+        """ Store check of the page cache, see above: `ages` maps the tables
+        of the entry to the seconds since their last write."""
+        if not has_request_context() or g.get('_replica') is None:
+            return True
+        return min(ages.values(), default=float('inf')) >= self.app.config['REPLICA_STICKY_SECONDS']
+
+    def stats(self):
+        return {
+            "selection": self.app.config['REPLICA_SELECTION'] if self.replicas else None,
+            "primary_requests": self.primary_requests,
+            "replicas": [{
+                "name": replica.name,
+                "requests": replica.requests,
+                "statements": replica.statements,
+                "latency_ms": round(replica.latency_ms, 3)
+            } for replica in self.replicas]
+        }
@@ -0,0 +1,333 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import re
+import heapq
+from typing import NamedTuple
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event
+
+from app import (
+    db,
+    cache
+)
+
+from models import (
+    Venue,
+    Artist
+)
+
+from enums import Genres
+
+from queries import filter_genres
+
+from pagination import (
+    keyset,
+    page_of,
+    decode_cursor
+)
+
+#----------------------------------------------------------------------------#
+# Search Config.
+#----------------------------------------------------------------------------#
+
+# Text search configuration used by the fyyur_search_document() function
+# created in the search index migration (d057998b6e10; e1f6a3b8c2d5 adds the
+# genres' display values). 'simple' lowercases and splits on word
+# boundaries without stemming, which suits names, cities and genres.
+TS_CONFIG = 'simple'
+
+# Chunk size for IN (...) lists sent by the fallback path.
+_ID_CHUNK = 500
+
+# Shortest term searched: one trigram, so that a term always narrows the
+# candidates through the indexes. Empty terms go to the listings instead.
+MIN_TERM_LENGTH = 3
+
+class InvalidSearch(ValueError):
+    pass
+
+def search_term(term):
+    """ `term` stripped. Raises InvalidSearch when shorter than
+    MIN_TERM_LENGTH."""
+    term = (term or '').strip()
+    if len(term) < MIN_TERM_LENGTH:
+        raise InvalidSearch('Search for at least %d characters.' % MIN_TERM_LENGTH)
+    return term
+
+def search_limit(limit=None):
+    """ Requested number of results clamped to [1, SEARCH_LIMIT]."""
+    cap = current_app.config['SEARCH_LIMIT']
+    if limit is None:
+        return cap
+    return max(1, min(int(limit), cap))
+
+def _rank_key(row):
+    return (row.rank, row.id)
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _words(*values):
+    words = set()
+    for value in values:
+        if value:
+            words.update(word.lower() for word in _WORD.findall(value))
+    return words
+
+def _genre_texts(genres):
+    # Stored enum names ("RockNRoll") and the display values people type
+    # ("Rock n Roll"), as fyyur_search_document() indexes them.
+    for name in genres or ():
+        yield name
+        if name in Genres.__members__:
+            yield Genres[name].value
+
+def _similarity(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+#----------------------------------------------------------------------------#
+# PostgreSQL: ranked query on the trigram and tsvector indexes.
+#----------------------------------------------------------------------------#
+
+def ranked_statement(model, term, genres=None, genre_match='any', after=None, limit=None):
+    """ keyset() statement returning (id, name, upcoming_shows_count, rank)
+    ordered by relevance, then id, both descending, and its limit (see
+    search_limit()). Matches on a case-insensitive substring of the name
+    (served by the gin_trgm_ops index) or on every word of the term appearing
+    in the name, city, state or genres (served by the tsvector expression
+    index), among the rows of queries.genre_filters() (the GIN index on
+    genres). `after` is the cursor of the previous page."""
+    document = db.func.fyyur_search_document(
+        model.name, model.city, model.state, model.genres
+    )
+    tsquery = db.func.plainto_tsquery(TS_CONFIG, term)
+    # Double precision, so that the rank a cursor carries compares equal to
+    # the one computed again for the next page.
+    rank = db.cast(db.func.greatest(
+        db.func.similarity(model.name, term),
+        db.func.ts_rank(document, tsquery)
+    ), db.Float)
+    query = filter_genres(db.select(
+        model.id,
+        model.name,
+        model.upcoming_shows_count,
+        rank.label('rank')
+    ), model, genres, genre_match).filter(db.or_(
+        model.name.ilike('%' + _escape_like(term) + '%', escape='\\'),
+        document.op('@@')(tsquery)
+    ))
+    return keyset(query, (rank, model.id), after=after, limit=search_limit(limit), descending=True)
+
+def _ranked_search(model, term, after=None, limit=None, **filters):
+    statement, limit = ranked_statement(model, term, after=after, limit=limit, **filters)
+    return db.session.execute(statement).all(), limit
+
+#----------------------------------------------------------------------------#
+# Fallback: in-process index for databases without pg_trgm (SQLite).
+#----------------------------------------------------------------------------#
+
+class SearchIndex:
+    """ Pure-Python equivalent of the PostgreSQL search indexes.
+
+    Keeps a trigram posting list over names and a word posting list over
+    name, city, state and genres, so a lookup only touches the candidate
+    rows instead of scanning the table, and the enums.Genres.mask() of each
+    row for the genre filters."""
+
+    def __init__(self, rows):
+        self.names = {}
+        self.name_trigrams = {}
+        self.genre_masks = {}
+        self.trigrams = defaultdict(set)
+        self.words = defaultdict(set)
+        for row_id, name, city, state, genres in rows:
+            self.add(row_id, name, city, state, genres)
+
+    def add(self, row_id, name, city, state, genres):
+        trigrams = _trigrams(name)
+        self.names[row_id] = name
+        self.name_trigrams[row_id] = trigrams
+        self.genre_masks[row_id] = Genres.mask(genres)
+        for trigram in trigrams:
+            self.trigrams[trigram].add(row_id)
+        for word in _words(name, city, state, *_genre_texts(genres)):
+            self.words[word].add(row_id)
+
+    def _name_matches(self, term):
+        needle = term.lower()
+        # Terms are at least a trigram long (MIN_TERM_LENGTH).
+        postings = sorted((self.trigrams.get(t, set()) for t in _trigrams(needle)), key=len)
+        candidates = set.intersection(*postings)
+        return {row_id for row_id in candidates if needle in self.names[row_id].lower()}
+
+    def _word_matches(self, term):
+        words = _words(term)
+        if not words:
+            return set()
+        postings = sorted((self.words.get(word, set()) for word in words), key=len)
+        return set.intersection(*postings)
+
+    def _genre_matches(self, ids, genres, genre_match):
+        mask = Genres.mask(genres)
+        if genre_match == 'all':
+            return {row_id for row_id in ids if self.genre_masks[row_id] & mask == mask}
+        return {row_id for row_id in ids if self.genre_masks[row_id] & mask}
+
+    def search(self, term, genres=None, genre_match='any', after=None, limit=None):
+        """ (rank, id) of the `limit` best matches of `term` and the genre
+        filters ranked below `after`, a (rank, id) pair, best match first:
+        the order of ranked_statement()."""
+        matches = self._name_matches(term) | self._word_matches(term)
+        if genres:
+            matches = self._genre_matches(matches, genres, genre_match)
+        trigrams = _trigrams(term)
+        ranked = ((_similarity(trigrams, self.name_trigrams[row_id]), row_id) for row_id in matches)
+        if after is not None:
+            ranked = (key for key in ranked if key < after)
+        return heapq.nlargest(limit, ranked)
+
+# model: (cache generation of its table, SearchIndex). Keyed on the page
+# cache generations, an index is rebuilt once its table is written by any
+# process sharing the cache backend (another worker, `flask import`), not
+# only by this one. Without generations (CACHE_TYPE = 'null') only the
+# writes of this process, through the events below, and reset_indexes()
+# drop it.
+_indexes = {}
+
+def index_statement(model):
+    """ Rows a SearchIndex of `model` is built from."""
+    return db.select(model.id, model.name, model.city, model.state, model.genres)
+
+def index_generation(model):
+    """ Generation to look an index up and build it under; read it before
+    the rows, so that a write in between makes the next lookup rebuild."""
+    return cache.generation(model.__tablename__)
+
+def cached_index(model, generation):
+    """ The SearchIndex of `model` built at `generation`, None until built
+    or once the table moved to another generation."""
+    entry = _indexes.get(model)
+    if entry is None or entry[0] != generation:
+        return None
+    return entry[1]
+
+def build_index(model, rows, generation):
+    index = SearchIndex(rows)
+    _indexes[model] = (generation, index)
+    return index
+
+def _index_for(model):
+    generation = index_generation(model)
+    index = cached_index(model, generation)
+    if index is None:
+        index = build_index(model, db.session.execute(index_statement(model)), generation)
+    return index
+
+def reset_indexes():
+    """ Drop the in-process indexes, e.g. after a bulk load that bypassed the
+    ORM events below."""
+    _indexes.clear()
+
+def _invalidate(mapper, connection, target):
+    _indexes.pop(mapper.class_, None)
+
+for _model in (Venue, Artist):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _invalidate)
+
+def counts_statements(model, ids):
+    """ Statements fetching (id, upcoming_shows_count) of the rows in `ids`.
+
+    Read per request: the counters change with every show, without any
+    write to the row that would reach the events above."""
+    return [
+        db.select(model.id, model.upcoming_shows_count).filter(model.id.in_(ids[start:start + _ID_CHUNK]))
+        for start in range(0, len(ids), _ID_CHUNK)
+    ]
+
+class IndexedRow(NamedTuple):
+    """ A row of indexed_rows(), read like those of ranked_statement()."""
+    id: int
+    name: str
+    upcoming_shows_count: int
+    rank: float
+
+def index_cursor(model, after):
+    """ (rank, id) of the cursor `after`, for SearchIndex.search()."""
+    if after is None:
+        return None
+    return decode_cursor(after, (db.column('rank', db.Float), model.id))
+
+def indexed_rows(index, keys, counts):
+    """ Rows shaped like those of ranked_statement(), for (rank, id) keys."""
+    return [
+        IndexedRow(row_id, index.names[row_id], counts.get(row_id, 0), rank)
+        for rank, row_id in keys
+    ]
+
+def _indexed_search(model, term, after=None, limit=None, **filters):
+    index = _index_for(model)
+    limit = search_limit(limit)
+    # One row more than the page, as keyset() fetches, to tell whether
+    # there is a next page.
+    keys = index.search(term, after=index_cursor(model, after), limit=limit + 1, **filters)
+    counts = {}
+    for statement in counts_statements(model, [row_id for _, row_id in keys]):
+        counts.update(db.session.execute(statement).all())
+    return indexed_rows(index, keys, counts), limit
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+def _search(model, term, after=None, limit=None, **filters):
+    term = search_term(term)
+    if db.engine.dialect.name == 'postgresql':
+        rows, limit = _ranked_search(model, term, after, limit, **filters)
+    else:
+        rows, limit = _indexed_search(model, term, after, limit, **filters)
+    return search_page(rows, limit, after)
+
+def search_page(rows, limit, after=None):
+    """ Page of ranked_statement() or indexed_rows() rows, its items in
+    the shape the search pages expect."""
+    page = page_of(rows, _rank_key, limit, after)
+    page.items = [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.upcoming_shows_count
+    } for row in page.items]
+    return page
+
+def search_results(page):
+    """ Results of a search_page() for pages/search_*.html: its items,
+    their count, and whether there are more than that."""
+    return {
+        "count": len(page.items),
+        "more": page.next_cursor is not None,
+        "data": page.items
+    }
+
+def find_venues(term, after=None, limit=None, **filters):
+    """ Page of at most SEARCH_LIMIT venues matching `term`, best first,
+    narrowed by queries.genre_filters(). Raises InvalidSearch, and
+    InvalidCursor for a bad `after`."""
+    return _search(Venue, term, after, limit, **filters)
+
+def find_artists(term, after=None, limit=None, **filters):
+    """ Page of at most SEARCH_LIMIT artists matching `term`, best first,
+    narrowed by queries.genre_filters(). Raises InvalidSearch, and
+    InvalidCursor for a bad `after`."""
+    return _search(Artist, term, after, limit, **filters)
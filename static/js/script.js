@@ -2,3 +2,20 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// "Load more" links on the venue and artist pages fetch the next window of
+// show tiles and put it in place of the link.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest && event.target.closest('a.load-more');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  var container = link.parentNode;
+  fetch(link.href)
+    .then(function (response) { return response.text(); })
+    .then(function (html) {
+      container.insertAdjacentHTML('afterend', html);
+      container.parentNode.removeChild(container);
+    });
+});
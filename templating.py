@@ -0,0 +1,129 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import time
+
+import click
+from flask.cli import (
+    AppGroup,
+    with_appcontext
+)
+from flask import (
+    Response,
+    current_app,
+    session,
+    render_template,
+    stream_with_context
+)
+
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Template modes.
+#
+# 'development' (the default while DEBUG is on) checks every template for
+# changes on each render and compiles it again in every worker.
+#
+# 'production' never checks for changes, and keeps compiled templates in a
+# filesystem bytecode cache under TEMPLATE_CACHE_DIR, shared by the workers
+# of a host and by restarts. Entries are keyed by the template source, so a
+# deploy with changed templates never reads stale bytecode. Run
+# `flask templates precompile` at deploy time to fill it before the first
+# request.
+#----------------------------------------------------------------------------#
+
+def bytecode_cache(app):
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    return FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+def configure_templates(app):
+    app.config.setdefault('TEMPLATE_MODE', 'development' if app.debug else 'production')
+    app.config.setdefault('TEMPLATE_CACHE_DIR', os.path.join(app.root_path, '.template-cache'))
+    app.config.setdefault('STREAM_TEMPLATES', True)
+    app.config.setdefault('STREAM_CHUNK_SIZE', 8192)
+    if app.config['TEMPLATE_MODE'] == 'production':
+        app.config['TEMPLATES_AUTO_RELOAD'] = False
+        app.jinja_env.auto_reload = False
+        app.jinja_env.bytecode_cache = bytecode_cache(app)
+    elif app.config['TEMPLATE_MODE'] != 'development':
+        raise ValueError('Unknown TEMPLATE_MODE %r' % app.config['TEMPLATE_MODE'])
+
+def page_templates(env):
+    return env.list_templates(filter_func=lambda name: name.endswith('.html'))
+
+def precompile(app):
+    """ Compile every template into the bytecode cache (and the in-process
+    template cache). Returns the number of templates compiled."""
+    env = app.jinja_env
+    if env.bytecode_cache is None:
+        env.bytecode_cache = bytecode_cache(app)
+    names = page_templates(env)
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#
+# stream_template() renders a page while it is being sent: Jinja generates
+# the output event by event and the response goes out in chunks of about
+# STREAM_CHUNK_SIZE bytes, so the first byte leaves once the head of the
+# layout is rendered, and the listings iterate over rows still being
+# fetched (see pagination.StreamedPage and queries.iter_areas). Peak memory
+# is then one chunk of HTML plus one batch of rows, whatever the length of
+# the page.
+#
+# Once the first chunk is out the status and headers can't change: an
+# error further down cuts the page short (and is logged) rather than
+# rendering the error page. Statements run while streaming aren't counted
+# in the Server-Timing header, which is sent before them.
+#----------------------------------------------------------------------------#
+
+def _chunks(events, size):
+    # Join the many small strings Jinja yields into chunks of `size` bytes.
+    buffered, length = [], 0
+    for event in events:
+        buffered.append(event)
+        length += len(event)
+        if length >= size:
+            yield ''.join(buffered).encode('utf-8')
+            buffered, length = [], 0
+    if buffered:
+        yield ''.join(buffered).encode('utf-8')
+
+def stream_template(template_name, **context):
+    """ Streamed response of `template_name`, see above. Rendered whole
+    when STREAM_TEMPLATES is off, or with flashed messages pending, since
+    showing them changes the session cookie, which leaves with the headers."""
+    app = current_app._get_current_object()
+    if not app.config['STREAM_TEMPLATES'] or '_flashes' in session:
+        return render_template(template_name, **context)
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    events = template.generate(context)
+    return Response(
+        stream_with_context(_chunks(events, app.config['STREAM_CHUNK_SIZE'])),
+        mimetype='text/html'
+    )
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+templates_command = AppGroup('templates', help='Manage compiled templates.')
+
+@templates_command.command('precompile')
+@with_appcontext
+def precompile_command():
+    """ Compile every template into TEMPLATE_CACHE_DIR, so that cold
+    workers in production mode load bytecode instead of compiling."""
+    app = current_app._get_current_object()
+    started = time.perf_counter()
+    count = precompile(app)
+    click.echo('Compiled %d templates into %s in %.0f ms.' % (
+        count, app.config['TEMPLATE_CACHE_DIR'], (time.perf_counter() - started) * 1000
+    ))
+    if app.config['TEMPLATE_MODE'] != 'production':
+        click.echo("TEMPLATE_MODE is %r: the app won't read them." % app.config['TEMPLATE_MODE'], err=True)